@@ -1,6 +1,34 @@
 import os
 from datetime import timedelta
 
+# 按提示模板路由 LLM 的可配置字段及其类型
+LLM_ROUTE_FIELDS = {
+    "model": str,
+    "endpoint": str,
+    "api_key": str,
+    "temperature": float,
+    "max_tokens": int,
+}
+
+
+def load_llm_routes(environ=os.environ) -> dict:
+    """
+    读取 LLM_ROUTE_<TEMPLATE>_<FIELD> 环境变量，如 LLM_ROUTE_RETRIEVE_QUERY_MODEL
+
+    Returns:
+        dict: {模板名(小写): {字段: 值}}，只包含显式配置的字段
+    """
+    routes = {}
+    for name, raw in environ.items():
+        if not name.startswith("LLM_ROUTE_") or raw == "":
+            continue
+        rest = name[len("LLM_ROUTE_"):].lower()
+        for field, cast in LLM_ROUTE_FIELDS.items():
+            if rest.endswith("_" + field) and len(rest) > len(field) + 1:
+                routes.setdefault(rest[:-len(field) - 1], {})[field] = cast(raw)
+                break
+    return routes
+
 
 class Config:
     """应用配置类 - 参考 digital_twin_academic 的配置结构"""
@@ -20,6 +48,8 @@ class Config:
         f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "40"))
 
     # CORS配置
     CORS_ORIGINS = os.getenv("CORS_ORIGINS", "*")
@@ -33,18 +63,118 @@ class Config:
     # Redis配置
     REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
 
+    # 幂等键：完成记录保留时间与处理中占位的过期时间（秒）
+    IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "30"))
+
+    # 相同研究请求去重：按规范化内容 + locale + 模型，附加到运行中的任务或复用新鲜度窗口内的结果
+    DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "false").lower() == "true"
+    DEDUP_FRESHNESS_SECONDS = float(os.getenv("DEDUP_FRESHNESS_SECONDS", "86400"))
+
+    # 相似题目缓存：本地哈希向量索引，相似度达到阈值时复用关键词与论文检索（可选复用灵感）
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+    SEMANTIC_CACHE_TOP_K = int(os.getenv("SEMANTIC_CACHE_TOP_K", "5"))  # 最相似的源消息不可复用时依次尝试
+    SEMANTIC_CACHE_REUSE_INSPIRATION = os.getenv("SEMANTIC_CACHE_REUSE_INSPIRATION", "false").lower() == "true"
+    SEMANTIC_CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR", "")  # 为空时使用 backend/data/semantic_cache
+    SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "1024"))
+
+    # 步骤 1 关键词提取：llm / local（本地置信度足够时跳过 LLM）/ shadow（仅对比本地与 LLM 结果）
+    KEYWORD_EXTRACTOR_MODE = os.getenv("KEYWORD_EXTRACTOR_MODE", "llm").lower()
+    KEYWORD_LOCAL_MIN_CONFIDENCE = float(os.getenv("KEYWORD_LOCAL_MIN_CONFIDENCE", "0.6"))
+
+    # 推测式论文检索：提取关键词的同时按本地猜测的关键词检索，关键词一致时直接使用
+    SPECULATIVE_RETRIEVAL_ENABLED = os.getenv("SPECULATIVE_RETRIEVAL_ENABLED", "false").lower() == "true"
+    SPECULATIVE_RETRIEVAL_MIN_CONFIDENCE = float(os.getenv("SPECULATIVE_RETRIEVAL_MIN_CONFIDENCE", "0.5"))
+    SPECULATIVE_RETRIEVAL_WORKERS = int(os.getenv("SPECULATIVE_RETRIEVAL_WORKERS", "12"))
+
+    # 会话级创建锁的过期时间（秒），覆盖 create_research 中检查进行中任务到提交写入的耗时
+    SESSION_LOCK_SECONDS = float(os.getenv("SESSION_LOCK_SECONDS", "15"))
+
     # LLM服务配置
     CUSTOM_API_ENDPOINT = os.getenv("CUSTOM_API_ENDPOINT")
     CUSTOM_API_KEY = os.getenv("CUSTOM_API_KEY")
     CUSTOM_MODEL = os.getenv("CUSTOM_MODEL")
+    CUSTOM_TEMPERATURE = float(os.getenv("CUSTOM_TEMPERATURE", "0.6"))
+    CUSTOM_MAX_TOKENS = int(os.getenv("CUSTOM_MAX_TOKENS", "0"))  # 0 表示不限制
+    # 按提示模板（PROMPT_TEMPLATES 的键）覆盖模型 / 端点 / 温度 / max_tokens，未配置的字段使用上面的 CUSTOM_*
+    LLM_ROUTES = load_llm_routes()
     LLM_REQUEST_TIMEOUT = int(os.getenv("LLM_REQUEST_TIMEOUT", "180"))
+    # 多端点负载均衡：CUSTOM_API_ENDPOINT（及路由的 ENDPOINT）可写成逗号分隔的多个端点，端点后加 |权重（默认 1）
+    # 连续失败 LLM_BREAKER_FAILURE_THRESHOLD 次后熔断，LLM_BREAKER_COOLDOWN_SECONDS 后放行一次试探请求
+    LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "3"))
+    LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+    LLM_ENDPOINT_EWMA_ALPHA = float(os.getenv("LLM_ENDPOINT_EWMA_ALPHA", "0.3"))
+    # 端点耗时 EWMA 的衰减半衰期：长时间未被选中的慢端点得分逐渐下降并被重新试探（<= 0 不衰减）
+    LLM_ENDPOINT_LATENCY_HALF_LIFE_SECONDS = float(os.getenv("LLM_ENDPOINT_LATENCY_HALF_LIFE_SECONDS", "60"))
+    # 对冲请求：超过近期 LLM_HEDGE_PERCENTILE 分位耗时未返回时向另一端点重复发送，对冲率不超过 LLM_HEDGE_MAX_RATE
+    LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+    LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+    LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.05"))
+    LLM_HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", "64"))
+
+    # 提示词中论文摘要的 token 预算（估算值）：总量与单篇上限，0 表示不限制
+    PAPER_PROMPT_TOKEN_BUDGET = int(os.getenv("PAPER_PROMPT_TOKEN_BUDGET", "1500"))
+    PAPER_ABSTRACT_MAX_TOKENS = int(os.getenv("PAPER_ABSTRACT_MAX_TOKENS", "300"))
+
+    # Semantic Scholar 配置（压测时可指向 tests/mock 下的本地模拟服务）
+    SEMANTIC_SCHOLAR_BASE_URL = os.getenv("SEMANTIC_SCHOLAR_BASE_URL", "http://api.semanticscholar.org/graph/v1").rstrip("/")
+
+    # LLM / S2 录制回放：off / record / replay（见 app/services/llm_fixtures.py）
+    LLM_FIXTURE_MODE = os.getenv("LLM_FIXTURE_MODE", "off").lower()
+    LLM_FIXTURE_DIR = os.getenv("LLM_FIXTURE_DIR", "")  # 为空时使用 backend/tests/fixtures/replay
+    LLM_FIXTURE_LATENCY = os.getenv("LLM_FIXTURE_LATENCY", "recorded").lower()  # recorded / zero
+
+    # 研究流水线执行器（独立于 AnyIO 共享线程池）
+    PIPELINE_MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", "16"))
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "64"))  # 调度器排队上限，超出返回 503
+
+    # 研究任务截止时间与取消（见 app/services/task_context.py）
+    TASK_TIMEOUT_SECONDS = float(os.getenv("TASK_TIMEOUT_SECONDS", "3600"))
+    TASK_CANCEL_POLL_SECONDS = float(os.getenv("TASK_CANCEL_POLL_SECONDS", "5"))  # 取消标记轮询间隔
+
+    # 崩溃恢复：心跳与孤儿任务清扫（见 app/services/task_recovery.py）
+    TASK_RECOVERY_ENABLED = os.getenv("TASK_RECOVERY_ENABLED", "true").lower() == "true"
+    TASK_HEARTBEAT_SECONDS = int(os.getenv("TASK_HEARTBEAT_SECONDS", "30"))
+    TASK_HEARTBEAT_TIMEOUT_SECONDS = int(os.getenv("TASK_HEARTBEAT_TIMEOUT_SECONDS", "180"))  # 超过即视为孤儿任务
+    TASK_SWEEP_INTERVAL_SECONDS = int(os.getenv("TASK_SWEEP_INTERVAL_SECONDS", "60"))
+    TASK_RECOVERY_MAX_ATTEMPTS = int(os.getenv("TASK_RECOVERY_MAX_ATTEMPTS", "1"))  # 从断点重新入队的次数上限
+
+    # 停机排空：关闭时挂起运行中的任务并等待其在断点停止的最长时间（应小于 gunicorn graceful-timeout）
+    SHUTDOWN_DRAIN_TIMEOUT_SECONDS = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT_SECONDS", "60"))
+    # 预停机标记文件：存在时 /ready 返回 503 并拒绝新任务（由 deploy/stop_services.sh 在发送 SIGTERM 前创建）
+    DRAIN_MARKER_FILE = os.getenv("DRAIN_MARKER_FILE", "")
+
+    # 研究任务公平调度（见 app/services/task_scheduler.py）
+    SCHEDULER_MAX_CONCURRENCY = int(os.getenv("SCHEDULER_MAX_CONCURRENCY", str(PIPELINE_MAX_WORKERS)))
+    SCHEDULER_PER_USER_LIMIT = int(os.getenv("SCHEDULER_PER_USER_LIMIT", "2"))
+    SCHEDULER_PER_USER_QUEUE_LIMIT = int(os.getenv("SCHEDULER_PER_USER_QUEUE_LIMIT", "8"))  # 单用户排队上限，0 表示不限制
+    SCHEDULER_TIER_WEIGHTS = os.getenv("SCHEDULER_TIER_WEIGHTS", "pioneer:4,researcher:2,student:1,default:1")
+
+    # 准入控制：任一信号超过阈值时 /create 返回 429 + Retry-After（阈值为 0 表示关闭）
+    ADMISSION_QUEUE_HIGH_WATERMARK = float(os.getenv("ADMISSION_QUEUE_HIGH_WATERMARK", "0.8"))  # 占 PIPELINE_QUEUE_SIZE 比例
+    ADMISSION_DB_POOL_HIGH_WATERMARK = float(os.getenv("ADMISSION_DB_POOL_HIGH_WATERMARK", "0.9"))  # 占连接池容量比例
+    ADMISSION_LLM_LATENCY_SECONDS = float(os.getenv("ADMISSION_LLM_LATENCY_SECONDS", "120"))  # LLM 耗时 EWMA
+    ADMISSION_LLM_LATENCY_HALF_LIFE_SECONDS = float(os.getenv("ADMISSION_LLM_LATENCY_HALF_LIFE_SECONDS", "60"))  # 无新样本时的衰减半衰期
+    ADMISSION_LOOP_LAG_SECONDS = float(os.getenv("ADMISSION_LOOP_LAG_SECONDS", "0.5"))
+    ADMISSION_RETRY_AFTER_SECONDS = int(os.getenv("ADMISSION_RETRY_AFTER_SECONDS", "30"))
 
     # WebSocket 轮询配置
     WS_POLL_INTERVAL_SECONDS = float(os.getenv("WS_POLL_INTERVAL_SECONDS", "1"))
 
     # 日志配置
+    LOG_DIR = os.getenv("LOG_DIR", "")  # 为空时使用项目根目录下的 logs/
     LOG_MAX_BYTES = os.getenv("LOG_MAX_BYTES", "10485760")
     LOG_BACKUP_COUNT = os.getenv("LOG_BACKUP_COUNT", "30")
+    # 异步日志：handler 置于 QueueHandler/QueueListener 之后，由后台线程批量写盘
+    LOG_ASYNC = os.getenv("LOG_ASYNC", "false").lower() in {"1", "true", "yes"}
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_QUEUE_OVERFLOW = os.getenv("LOG_QUEUE_OVERFLOW", "drop_new")  # drop_new / drop_oldest / block
+    # 日志格式：text（默认）/ json（结构化，包含 trace_id、message_id、step、duration_ms）
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+    # 研究任务日志分片数：logs/tasks/YYYYMMDD/tasks_{message_id % N}.log
+    TASK_LOG_SHARDS = int(os.getenv("TASK_LOG_SHARDS", "16"))
 
 
 def get_jwt_config():
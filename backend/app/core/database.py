@@ -7,18 +7,22 @@ from sqlalchemy.orm import sessionmaker, Session
 from contextlib import contextmanager
 from typing import Generator
 from app.core.config import Config
+from app.core.metrics import instrument_engine
 
 # 创建数据库引擎
 engine = create_engine(
     Config.SQLALCHEMY_DATABASE_URI,
     pool_pre_ping=True,
     pool_recycle=3600,
-    pool_size=20,
-    max_overflow=40,
+    pool_size=Config.DB_POOL_SIZE,
+    max_overflow=Config.DB_MAX_OVERFLOW,
     pool_timeout=15,
     echo=False  # 默认不输出SQL日志
 )
 
+# 连接池与 SQL 执行指标
+instrument_engine(engine)
+
 # 创建会话工厂
 SessionLocal = sessionmaker(
     autocommit=False,
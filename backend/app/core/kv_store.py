@@ -0,0 +1,177 @@
+"""
+带 TTL 的键值存储
+Shared TTL key-value store (Redis with in-process fallback)
+
+跨 worker 共享的短期状态（幂等键等）存放在 REDIS_URL 指向的 Redis 中；
+Redis 未配置或不可用时在 fallback_seconds 内降级为进程内存储（仅本进程可见），之后再尝试 Redis。
+值统一以 JSON 序列化，set_if_absent 对应 Redis SET NX EX，保证并发写入时只有一个成功。
+lock() 在此基础上提供非阻塞的互斥锁：持有者令牌 + TTL，释放时比较令牌后删除，
+持有者崩溃时锁在 TTL 后自动失效。降级期间锁只在本进程内互斥。
+"""
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import redis
+
+from app.core.config import Config
+from app.utils.logger import get_logger
+
+logger = get_logger('kv_store')
+
+
+class MemoryKeyValueStore:
+    """进程内键值存储（线程安全，读取时惰性清理过期键）"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, key: str, now: float) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[0] <= now:
+            del self._data[key]
+            return None
+        return item[1]
+
+    def set(self, key: str, value: str, ttl: float, nx: bool = False) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if nx and self._alive(key, now) is not None:
+                return False
+            self._data[key] = (now + ttl, value)
+            return True
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._alive(key, time.monotonic())
+
+    def append(self, key: str, value: str, ttl: float):
+        now = time.monotonic()
+        with self._lock:
+            items = list(self._alive(key, now) or [])
+            self._data[key] = (now + ttl, items + [value])
+
+    def get_list(self, key: str) -> list:
+        with self._lock:
+            return list(self._alive(key, time.monotonic()) or [])
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_if_equals(self, key: str, value: str) -> bool:
+        with self._lock:
+            if self._alive(key, time.monotonic()) != value:
+                return False
+            del self._data[key]
+            return True
+
+
+# 令牌匹配时才删除，避免锁过期后误删其他持有者的锁
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class KeyValueStore:
+    """Redis 键值存储，Redis 不可用时降级为进程内存储"""
+
+    def __init__(self, url: Optional[str], prefix: str = "research_chat:", fallback_seconds: float = 30.0):
+        self.prefix = prefix
+        self.fallback_seconds = fallback_seconds
+        self._fallback = MemoryKeyValueStore()
+        self._redis = None
+        self._redis_failed_at = 0.0
+        if url and not url.startswith("memory://"):
+            try:
+                self._redis = redis.Redis.from_url(
+                    url, socket_timeout=0.2, socket_connect_timeout=0.2, decode_responses=True
+                )
+            except Exception as e:
+                logger.warning(f"Redis 初始化失败，使用进程内存储: {e}")
+
+    def _call(self, redis_op, memory_op):
+        if self._redis is not None and time.monotonic() - self._redis_failed_at >= self.fallback_seconds:
+            try:
+                return redis_op(self._redis)
+            except redis.RedisError as e:
+                logger.warning(f"Redis 不可用，{self.fallback_seconds:.0f} 秒内降级为进程内存储: {e}")
+                self._redis_failed_at = time.monotonic()
+        return memory_op(self._fallback)
+
+    def set(self, key: str, value: Any, ttl: float):
+        key, raw = self.prefix + key, json.dumps(value, ensure_ascii=False)
+        self._call(
+            lambda r: r.set(key, raw, px=int(ttl * 1000)),
+            lambda m: m.set(key, raw, ttl),
+        )
+
+    def set_if_absent(self, key: str, value: Any, ttl: float) -> bool:
+        """键不存在时写入并返回 True，已存在返回 False（原子操作）"""
+        key, raw = self.prefix + key, json.dumps(value, ensure_ascii=False)
+        return bool(self._call(
+            lambda r: r.set(key, raw, px=int(ttl * 1000), nx=True),
+            lambda m: m.set(key, raw, ttl, nx=True),
+        ))
+
+    def get(self, key: str) -> Optional[Any]:
+        key = self.prefix + key
+        raw = self._call(lambda r: r.get(key), lambda m: m.get(key))
+        return json.loads(raw) if raw is not None else None
+
+    def delete(self, key: str):
+        key = self.prefix + key
+        self._call(lambda r: r.delete(key), lambda m: m.delete(key))
+
+    def append(self, key: str, value: Any, ttl: float):
+        """追加到列表并刷新 TTL"""
+        key, raw = self.prefix + key, json.dumps(value, ensure_ascii=False)
+
+        def _redis_append(r):
+            pipe = r.pipeline()
+            pipe.rpush(key, raw)
+            pipe.pexpire(key, int(ttl * 1000))
+            pipe.execute()
+
+        self._call(_redis_append, lambda m: m.append(key, raw, ttl))
+
+    def get_list(self, key: str) -> list:
+        key = self.prefix + key
+        raws = self._call(lambda r: r.lrange(key, 0, -1), lambda m: m.get_list(key))
+        return [json.loads(raw) for raw in raws]
+
+    def delete_if_equals(self, key: str, value: Any) -> bool:
+        """值等于 value 时删除并返回 True（原子操作）"""
+        key, raw = self.prefix + key, json.dumps(value, ensure_ascii=False)
+        return bool(self._call(
+            lambda r: r.eval(_RELEASE_SCRIPT, 1, key, raw),
+            lambda m: m.delete_if_equals(key, raw),
+        ))
+
+    @contextmanager
+    def lock(self, name: str, ttl: float) -> Iterator[bool]:
+        """
+        非阻塞互斥锁
+
+        Yields:
+            bool: 是否获得锁；未获得时调用方应直接返回（不等待）
+        """
+        key, token = f"lock:{name}", uuid.uuid4().hex
+        acquired = self.set_if_absent(key, token, ttl)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.delete_if_equals(key, token)
+
+
+kv_store = KeyValueStore(Config.REDIS_URL)
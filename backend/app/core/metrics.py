@@ -0,0 +1,230 @@
+"""
+Prometheus Metrics
+Prometheus 指标定义与导出
+
+- 单进程：直接使用默认注册表
+- gunicorn 多进程：设置 PROMETHEUS_MULTIPROC_DIR 后，各 worker 将指标写入该目录下的
+  mmap 文件，/metrics 抓取时由 MultiProcessCollector 汇总（见 backend/gunicorn.conf.py）
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from sqlalchemy import event
+
+# 秒级流水线/LLM 调用的分桶
+SLOW_BUCKETS = (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 180, 300, 600, 1800, 3600)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "research_chat_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+)
+
+PIPELINE_STEP_SECONDS = Histogram(
+    "research_chat_pipeline_step_duration_seconds",
+    "Duration of each research pipeline step",
+    ["step", "status"],
+    buckets=SLOW_BUCKETS,
+)
+PIPELINE_TASKS_TOTAL = Counter(
+    "research_chat_pipeline_tasks_total",
+    "Finished research pipeline tasks",
+    ["status"],
+)
+
+PIPELINE_EXECUTOR_ACTIVE = Gauge(
+    "research_chat_pipeline_executor_active",
+    "Pipeline tasks currently running on the executor",
+    multiprocess_mode="livesum",
+)
+PIPELINE_EXECUTOR_REJECTED_TOTAL = Counter(
+    "research_chat_pipeline_executor_rejected_total",
+    "Pipeline tasks rejected because the executor was shut down",
+)
+
+SCHEDULER_QUEUE_DEPTH = Gauge(
+    "research_chat_scheduler_queue_depth",
+    "Research tasks waiting in the fair-share scheduler",
+    ["lane"],
+    multiprocess_mode="livesum",
+)
+SCHEDULER_QUEUE_WAIT_SECONDS = Histogram(
+    "research_chat_scheduler_queue_wait_seconds",
+    "Time research tasks wait in the fair-share scheduler before dispatch",
+    ["lane"],
+    buckets=SLOW_BUCKETS,
+)
+
+TASK_RECOVERY_TOTAL = Counter(
+    "research_chat_task_recovery_total",
+    "Orphaned research tasks handled by the sweeper",
+    ["action"],
+)
+
+DEDUP_REQUESTS_TOTAL = Counter(
+    "research_chat_dedup_requests_total",
+    "Research requests served by content-hash deduplication",
+    ["outcome"],
+)
+
+KEYWORD_EXTRACTION_TOTAL = Counter(
+    "research_chat_keyword_extraction_total",
+    "Pipeline step-1 keyword extractions by source",
+    ["source"],
+)
+KEYWORD_AGREEMENT = Histogram(
+    "research_chat_keyword_agreement",
+    "Word-level Jaccard agreement between local and LLM keywords",
+    buckets=(0.0, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0),
+)
+
+SPECULATIVE_RETRIEVAL_TOTAL = Counter(
+    "research_chat_speculative_retrieval_total",
+    "Speculative paper retrievals by outcome (hit / miss / error)",
+    ["outcome"],
+)
+
+ADMISSION_REJECTED_TOTAL = Counter(
+    "research_chat_admission_rejected_total",
+    "Research requests rejected by admission control",
+    ["reason"],
+)
+EVENT_LOOP_LAG_SECONDS = Gauge(
+    "research_chat_event_loop_lag_seconds",
+    "Most recent event loop scheduling lag",
+    multiprocess_mode="max",
+)
+
+LLM_REQUEST_SECONDS = Histogram(
+    "research_chat_llm_request_duration_seconds",
+    "LLM API call latency (single HTTP attempt)",
+    ["model", "status"],
+    buckets=SLOW_BUCKETS,
+)
+LLM_RETRIES_TOTAL = Counter(
+    "research_chat_llm_retries_total",
+    "LLM API call retries",
+    ["model", "reason"],
+)
+LLM_TOKENS_TOTAL = Counter(
+    "research_chat_llm_tokens_total",
+    "LLM token usage reported by the API",
+    ["model", "type"],
+)
+LLM_ENDPOINT_FAILOVERS_TOTAL = Counter(
+    "research_chat_llm_endpoint_failovers_total",
+    "LLM calls retried on another endpoint after a failure",
+    ["endpoint"],
+)
+LLM_CIRCUIT_OPENED_TOTAL = Counter(
+    "research_chat_llm_circuit_opened_total",
+    "LLM endpoint circuit breaker trips",
+    ["endpoint"],
+)
+LLM_HEDGES_TOTAL = Counter(
+    "research_chat_llm_hedges_total",
+    "Hedged LLM requests (fired / hedge_won / primary_won / budget_exhausted)",
+    ["outcome"],
+)
+
+S2_REQUEST_SECONDS = Histogram(
+    "research_chat_semantic_scholar_request_duration_seconds",
+    "Semantic Scholar search latency (single HTTP attempt)",
+    ["search", "status"],
+)
+S2_ERRORS_TOTAL = Counter(
+    "research_chat_semantic_scholar_errors_total",
+    "Semantic Scholar search errors",
+    ["search", "reason"],
+)
+
+DB_POOL_CHECKED_OUT = Gauge(
+    "research_chat_db_pool_checked_out",
+    "Database connections currently checked out",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKOUTS_TOTAL = Counter(
+    "research_chat_db_pool_checkouts_total",
+    "Database connection checkouts",
+)
+DB_POOL_CONNECTIONS_TOTAL = Counter(
+    "research_chat_db_pool_connections_total",
+    "New DBAPI connections opened by the pool",
+)
+DB_QUERIES_TOTAL = Counter(
+    "research_chat_db_queries_total",
+    "SQL statements executed",
+)
+
+WS_ACTIVE_CONNECTIONS = Gauge(
+    "research_chat_websocket_active_connections",
+    "Active status WebSocket connections",
+    multiprocess_mode="livesum",
+)
+
+
+def observe_http_request(scope, status_code: int, duration_seconds: float):
+    """记录 HTTP 请求耗时（route 使用路由模板，避免路径参数导致标签爆炸）"""
+    route = scope.get("route")
+    route_path = getattr(route, "path", None) or "unmatched"
+    HTTP_REQUEST_SECONDS.labels(scope.get("method", ""), route_path, str(status_code)).observe(duration_seconds)
+
+
+@contextmanager
+def track_pipeline_step(step: str):
+    """记录流水线步骤耗时，按成功/失败区分"""
+    start = time.perf_counter()
+    status = "success"
+    try:
+        yield
+    except Exception:
+        status = "failed"
+        raise
+    finally:
+        PIPELINE_STEP_SECONDS.labels(step, status).observe(time.perf_counter() - start)
+
+
+def instrument_engine(engine):
+    """为 SQLAlchemy 引擎注册连接池与 SQL 执行计数事件"""
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        DB_POOL_CONNECTIONS_TOTAL.inc()
+
+    @event.listens_for(engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKOUTS_TOTAL.inc()
+        DB_POOL_CHECKED_OUT.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        DB_POOL_CHECKED_OUT.dec()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _on_execute(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERIES_TOTAL.inc()
+
+
+def render_metrics():
+    """
+    生成 /metrics 响应内容
+
+    Returns:
+        (bytes, str): 指标文本与 Content-Type
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,110 @@
+"""
+ASGI Middleware
+纯 ASGI 请求追踪中间件
+
+替代 @app.middleware("http")（BaseHTTPMiddleware）实现：
+- 不为每个请求额外创建任务，不缓冲/包装响应体，流式响应原样透传
+- 同时支持 HTTP 与 WebSocket
+- request_id / trace_id 写入 contextvars，供日志与后台任务读取
+"""
+import time
+import uuid
+from typing import Iterable
+
+from app.core.metrics import observe_http_request
+from app.utils.logger import get_logger
+from app.utils.trace_context import request_id_var, trace_id_var
+
+logger = get_logger('main')
+
+# 不记录访问日志的路径
+SKIP_LOG_PATHS = ('/docs', '/redoc', '/openapi.json', '/health', '/metrics')
+
+
+def _header_value(headers: Iterable, name: bytes):
+    """从 ASGI 原始 headers 中读取指定头（name 需为小写）"""
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode('latin-1')
+    return None
+
+
+class RequestTracingMiddleware:
+    """
+    请求追踪中间件
+
+    - 读取或生成 X-Request-Id / X-Trace-Id
+    - 在响应头中追加 X-Request-Id、X-Trace-Id、X-Process-Time
+    - 请求结束（最后一个响应体分片发送后）记录访问日志与按路由的耗时直方图
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        scope_type = scope["type"]
+        if scope_type not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        headers = scope.get("headers") or []
+
+        # 生成请求ID和追踪ID
+        request_id = _header_value(headers, b"x-request-id") or uuid.uuid4().hex
+        trace_id = _header_value(headers, b"x-trace-id") or request_id
+
+        # 兼容 request.state.request_id / trace_id 的读取方式
+        state = scope.setdefault("state", {})
+        state["request_id"] = request_id
+        state["trace_id"] = trace_id
+        state["start_time"] = start_time
+
+        request_token = request_id_var.set(request_id)
+        trace_token = trace_id_var.set(trace_id)
+
+        trace_headers = [
+            (b"x-request-id", request_id.encode('latin-1')),
+            (b"x-trace-id", trace_id.encode('latin-1')),
+        ]
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            message_type = message["type"]
+
+            if message_type == "http.response.start":
+                status_code = message["status"]
+                process_time = time.perf_counter() - start_time
+                message["headers"] = list(message.get("headers") or []) + trace_headers + [
+                    (b"x-process-time", str(process_time).encode('latin-1')),
+                ]
+            elif message_type == "websocket.accept":
+                message["headers"] = list(message.get("headers") or []) + trace_headers
+
+            await send(message)
+
+            # 响应体发送完毕后再记录日志，避免阻塞首字节
+            if message_type == "http.response.body" and not message.get("more_body", False):
+                self._log_request(scope, status_code, start_time)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            trace_id_var.reset(trace_token)
+            request_id_var.reset(request_token)
+
+    @staticmethod
+    def _log_request(scope, status_code: int, start_time: float):
+        """记录访问日志（跳过某些路径）"""
+        elapsed = time.perf_counter() - start_time
+        observe_http_request(scope, status_code, elapsed)
+        path = scope.get("path", "")
+        if any(skip in path for skip in SKIP_LOG_PATHS):
+            return
+        duration_ms = int(elapsed * 1000)
+        logger.info(
+            f"event: {scope.get('method')}, path: {path}, "
+            f"status: {status_code}, duration_ms: {duration_ms}",
+            extra={"duration_ms": duration_ms},
+        )
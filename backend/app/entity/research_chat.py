@@ -1,6 +1,6 @@
 from datetime import datetime, timezone
 from ..utils.tools import UTC8
-from sqlalchemy import Column, BigInteger, String, Text, Boolean, DateTime, ForeignKey, Enum, JSON
+from sqlalchemy import Column, BigInteger, String, Text, Boolean, DateTime, ForeignKey, Enum, JSON, Computed, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -38,6 +38,8 @@ class ResearchChatMessage(Base):
 class ResearchChatProcessInfo(Base):
     """研究聊天进程信息表 - research_chat_process_infos"""
     __tablename__ = 'research_chat_process_infos'
+    # 同一会话最多一个进行中任务：进行中时 active_session_id = session_id，否则为 NULL（唯一索引允许多个 NULL）
+    __table_args__ = (UniqueConstraint('active_session_id', name='uq_rc_active_session'),)
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     session_id = Column(BigInteger, ForeignKey('research_chat_sessions.id', ondelete='CASCADE'), nullable=False, index=True)
@@ -51,5 +53,10 @@ class ResearchChatProcessInfo(Base):
         nullable=False,
         default='pending'
     )
+    active_session_id = Column(
+        BigInteger,
+        Computed("CASE WHEN creation_status IN ('pending', 'creating') THEN session_id END", persisted=True),
+        nullable=True
+    )
     created_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(UTC8))
     updated_at = Column(DateTime(timezone=True), nullable=False, default=lambda: datetime.now(UTC8), onupdate=lambda: datetime.now(UTC8))
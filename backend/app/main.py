@@ -3,16 +3,17 @@ FastAPI Main Application
 FastAPI 主应用
 参考 digital_twin_academic/backend/app/main.py
 """
+import asyncio
 import os
-import time
-import uuid
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 
 from app.core.config import Config
+from app.core.metrics import render_metrics
+from app.core.middleware import RequestTracingMiddleware
 from app.utils.logger import get_logger
 
 logger = get_logger('main')
@@ -26,11 +27,29 @@ async def lifespan(app: FastAPI):
     logger.info("=== Starting Research Chat FastAPI Application ===")
     logger.info(f"Environment: {os.getenv('APP_ENV', 'dev')}")
     logger.info(f"Database: {Config.SQLALCHEMY_DATABASE_URI}")
+    from app.services.admission import loop_lag_monitor
+    loop_lag_monitor.start()
+    from app.core.database import SessionLocal
+    from app.services.semantic_cache import start_backfill
+    start_backfill(SessionLocal)
+    recovery_scheduler = None
+    if Config.TASK_RECOVERY_ENABLED:
+        from app.services.task_recovery import create_recovery_scheduler
+        recovery_scheduler = create_recovery_scheduler()
+        recovery_scheduler.start()
 
     yield
 
-    # 关闭时
+    # 关闭时：先停止清扫（避免重新入队），再排空研究任务
+    # 心跳保留到进程退出（守护线程）：排空超时仍在执行的任务不会被其他 worker 当作孤儿重复执行
     logger.info("=== Shutting down Research Chat FastAPI Application ===")
+    if recovery_scheduler is not None:
+        recovery_scheduler.remove_job("task_sweeper")
+    from app.services.task_drain import drain_tasks
+    await asyncio.to_thread(drain_tasks, Config.SHUTDOWN_DRAIN_TIMEOUT_SECONDS)
+    await loop_lag_monitor.stop()
+    from app.services.pipeline_executor import pipeline_executor
+    pipeline_executor.shutdown(wait=False)
 
 
 def create_app() -> FastAPI:
@@ -62,44 +81,15 @@ def create_app() -> FastAPI:
         allow_origins=allow_origins,
         allow_credentials=True,
         allow_methods=["*"],
-        allow_headers=["Authorization", "Content-Type", "x-page-id"],
-        expose_headers=["Content-Type", "X-Request-Id", "X-Trace-Id"],
+        allow_headers=["Authorization", "Content-Type", "x-page-id", "Idempotency-Key"],
+        expose_headers=["Content-Type", "X-Request-Id", "X-Trace-Id", "Retry-After", "Idempotent-Replayed"],
     )
 
     # GZip压缩
     app.add_middleware(GZipMiddleware, minimum_size=1000)
 
-    # 请求追踪中间件
-    @app.middleware("http")
-    async def add_process_time_header(request: Request, call_next):
-        """添加请求追踪信息"""
-        start_time = time.time()
-
-        # 生成请求ID和追踪ID
-        request_id = request.headers.get('X-Request-Id') or request.headers.get('X-Request-ID') or uuid.uuid4().hex
-        trace_id = request.headers.get('X-Trace-Id') or request.headers.get('X-Trace-ID') or request_id
-
-        # 存储到request state
-        request.state.request_id = request_id
-        request.state.trace_id = trace_id
-        request.state.start_time = start_time
-
-        response = await call_next(request)
-
-        # 添加响应头
-        response.headers["X-Request-Id"] = request_id
-        response.headers["X-Trace-Id"] = trace_id
-        response.headers["X-Process-Time"] = str(time.time() - start_time)
-
-        # 记录请求日志（跳过某些路径）
-        if not any(path in request.url.path for path in ['/docs', '/redoc', '/openapi.json', '/health']):
-            duration_ms = int((time.time() - start_time) * 1000)
-            logger.info(
-                f"event: {request.method}, path: {request.url.path}, "
-                f"status: {response.status_code}, duration_ms: {duration_ms}"
-            )
-
-        return response
+    # 请求追踪中间件（纯 ASGI 实现，支持流式响应与 WebSocket）
+    app.add_middleware(RequestTracingMiddleware)
 
     # 全局异常处理
     @app.exception_handler(Exception)
@@ -137,6 +127,26 @@ def create_app() -> FastAPI:
             "service": "research_chat_backend_fastapi"
         }
 
+    # 就绪检查：停机排空期间返回 503，负载均衡据此摘除流量
+    @app.get("/ready")
+    async def ready():
+        from app.services.task_drain import drain_state
+        if drain_state.draining:
+            return JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"status": "draining", "service": "research_chat_backend_fastapi"},
+            )
+        return {
+            "status": "ready",
+            "service": "research_chat_backend_fastapi"
+        }
+
+    # Prometheus 指标
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        content, content_type = render_metrics()
+        return Response(content=content, media_type=content_type)
+
     return app
 
 
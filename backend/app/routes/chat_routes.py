@@ -3,24 +3,46 @@ FastAPI Research Chat Routes
 研究聊天路由模块 - FastAPI 实现
 迁移自 Flask Blueprint
 """
-from fastapi import APIRouter, Depends, Header, Request, Response, BackgroundTasks
+from fastapi import APIRouter, Depends, Header, Request, Response
 from typing import Optional
 from datetime import datetime
 from ..utils.tools import UTC8
 from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 import time
-import logging
-import os
 
 from app.services.auth import get_current_user
 from app.core.database import get_db, SessionLocal
 from app.entity.research_chat import ResearchChatSession, ResearchChatMessage, ResearchChatProcessInfo
-from app.utils.logger import get_logger
+from app.utils.logger import get_logger, get_task_logger, log_step
+from app.core.metrics import DEDUP_REQUESTS_TOTAL, PIPELINE_TASKS_TOTAL, track_pipeline_step
+from app.utils.trace_context import bind_trace_context, get_trace_id
 from app.utils.error_handler import ErrorCode, ErrorResponse, ErrorMessage
-from app.services.llm_service import LLMClient, get_newest_paper, get_highly_cited_paper, get_relevence_paper, get_prompt, construct_paper
+from app.services.admission import admission_controller
+from app.services.keyword_extractor import extract_keywords
+from app.services.speculative_retrieval import start_speculative_retrieval
+from app.services.semantic_cache import find_similar, remember_topic
+from app.services.request_dedup import COMPLETED, RUNNING, clone_result, finish_leader, request_dedup
+from app.services.idempotency import IN_PROGRESS, MAX_KEY_LENGTH, MISMATCH, REPLAY, idempotency_store, request_fingerprint
+from app.services.pipeline_executor import PipelineRejectedError
+from app.services.task_scheduler import task_scheduler
+from app.services.task_context import (
+    TaskCancelledError,
+    TaskContext,
+    TaskDeadlineExceeded,
+    TaskInterrupted,
+    TaskSuspended,
+    bind_task_context,
+    request_cancel,
+)
+from app.services.task_drain import drain_state
+from app.services.task_recovery import mark_resumable
+from app.core.config import Config
+from app.core.kv_store import kv_store
+from app.services.llm_service import LLMClient, build_search_query, get_newest_paper, get_highly_cited_paper, get_relevence_paper, get_prompt, construct_paper
 from app.constants.task_status import CreationStatus
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
 logger = get_logger('research_chat_fastapi')
 
@@ -90,6 +112,22 @@ def get_localized_message(key: str, locale: str = "cn") -> str:
             "cn": "❌ 研究任务失败",
             "en": "❌ Research task failed"
         },
+        "task_resume": {
+            "cn": "♻️ 研究任务从断点恢复执行",
+            "en": "♻️ Research task resumed from checkpoint"
+        },
+        "semantic_reuse": {
+            "cn": "🔁 复用相似研究题目的关键词与论文检索结果（相似度 {score:.2f}）",
+            "en": "🔁 Reusing keywords and papers from a similar research topic (similarity {score:.2f})"
+        },
+        "semantic_reuse_keywords": {
+            "cn": "🔁 复用相似研究题目的关键词（相似度 {score:.2f}）",
+            "en": "🔁 Reusing keywords from a similar research topic (similarity {score:.2f})"
+        },
+        "task_cancelled": {
+            "cn": "研究任务已取消",
+            "en": "Research task cancelled"
+        },
         "llm_init_failed": {
             "cn": "LLM客户端初始化失败",
             "en": "LLM client initialization failed"
@@ -135,6 +173,7 @@ class CreateResearchRequest(BaseModel):
     content: str = Field(..., description="研究内容/问题")
     session_id: Optional[str] = Field(None, description="会话ID")
     locale: str = Field("cn", description="界面语言，cn=中文，en=英文")
+    reuse_results: bool = Field(True, description="是否复用相同研究请求的结果（去重开启时生效）")
 
 
 class UpdateSessionNameRequest(BaseModel):
@@ -215,6 +254,27 @@ async def get_sessions(
         return ErrorResponse.create_error_response(ErrorCode.INTERNAL_SERVER_ERROR, ErrorMessage.INTERNAL_SERVER_ERROR)
 
 
+def _to_conversations(rows):
+    """将 (消息, 最新进程信息) 行转换为前端会话结构"""
+    convs = []
+    for m, p in rows:
+        convs.append({
+            "id": m.id,
+            "question": (m.content or ""),
+            "answer": (m.result_papers or None),
+            "process": {
+                "id": p.id if p else None,
+                "creation_status": p.creation_status if p else None,
+                "process_info": p.process_info if p else None,
+                "created_at": p.created_at.isoformat() if p and p.created_at else None,
+                "updated_at": p.updated_at.isoformat() if p and p.updated_at else None,
+            } if p else {},
+            "question_timestamp": m.created_at.isoformat() if m.created_at else None,
+            "answer_timestamp": m.updated_at.isoformat() if m.updated_at else None,
+        })
+    return convs
+
+
 @router.get("/sessions/{session_id}/messages")
 async def get_session_messages(
     session_id: str,
@@ -229,25 +289,6 @@ async def get_session_messages(
         page_param = request.query_params.get('page')
         size_param = request.query_params.get('size')
 
-        def _to_conversations(rows):
-            convs = []
-            for m, p in rows:
-                convs.append({
-                    "id": m.id,
-                    "question": (m.content or ""),
-                    "answer": (m.result_papers or None),
-                    "process": {
-                        "id": p.id if p else None,
-                        "creation_status": p.creation_status if p else None,
-                        "process_info": p.process_info if p else None,
-                        "created_at": p.created_at.isoformat() if p and p.created_at else None,
-                        "updated_at": p.updated_at.isoformat() if p and p.updated_at else None,
-                    } if p else {},
-                    "question_timestamp": m.created_at.isoformat() if m.created_at else None,
-                    "answer_timestamp": m.updated_at.isoformat() if m.updated_at else None,
-                })
-            return convs
-
         # 验证会话权限
         session = db.scalar(
             select(ResearchChatSession).where(
@@ -410,17 +451,90 @@ async def create_research(
     request: CreateResearchRequest,
     response: Response,
     x_page_id: Optional[str] = Header(None),
-    background_tasks: BackgroundTasks = None,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: dict = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     创建研究请求（异步解耦）
+    - 开启去重时，相同内容的请求复用近期结果或附加到运行中的任务（返回 deduplicated: cloned / attached）
+    - 携带 Idempotency-Key 时，重复请求直接返回首次创建的 message_id / session_id（响应头 Idempotent-Replayed: true）
     - 检查当前会话是否有正在处理中的任务（避免同一会话多个WebSocket连接）
     - 立即写入 messages 和 process_infos
-    - 启动后台任务处理 prompt/LLM 并更新数据库
-    - 立即返回 message_id 和 session_id，前端据此建立 WebSocket
+    - 停机排空中返回 503；准入控制：超过频率限制或系统过载时返回 429 + Retry-After
+    - 提交到公平调度器，由流水线执行器处理 prompt/LLM 并更新数据库（排队已满时返回 503）
+    - 立即返回 message_id、session_id 与排队位置，前端据此建立 WebSocket
     """
+    # 在写库前拒绝，避免产生无人处理的 pending 记录
+    if drain_state.draining:
+        response.status_code = ErrorCode.SERVICE_UNAVAILABLE.value
+        response.headers["Retry-After"] = str(Config.ADMISSION_RETRY_AFTER_SECONDS)
+        return ErrorResponse.create_error_response(ErrorCode.SERVICE_UNAVAILABLE, ErrorMessage.SERVICE_DRAINING)
+
+    if not idempotency_key:
+        return _create_research(request, response, x_page_id, current_user, db)
+
+    if len(idempotency_key) > MAX_KEY_LENGTH:
+        response.status_code = ErrorCode.BAD_REQUEST.value
+        return ErrorResponse.create_error_response(ErrorCode.BAD_REQUEST, ErrorMessage.IDEMPOTENCY_KEY_INVALID)
+
+    user_id = current_user["user_id"]
+    fingerprint = request_fingerprint(request.content, request.session_id, request.locale)
+    state, data = idempotency_store.begin("create", user_id, idempotency_key, fingerprint)
+    if state == REPLAY:
+        logger.info(f"幂等键命中，返回原始结果: user_id={user_id}, message_id={data.get('message_id')}")
+        response.headers["Idempotent-Replayed"] = "true"
+        return ErrorResponse.success_response("研究消息已成功创建", data)
+    if state == IN_PROGRESS:
+        response.status_code = ErrorCode.CONFLICT.value
+        return ErrorResponse.create_error_response(ErrorCode.CONFLICT, ErrorMessage.IDEMPOTENCY_IN_PROGRESS)
+    if state == MISMATCH:
+        response.status_code = ErrorCode.UNPROCESSABLE_ENTITY.value
+        return ErrorResponse.create_error_response(ErrorCode.UNPROCESSABLE_ENTITY, ErrorMessage.IDEMPOTENCY_KEY_REUSED)
+
+    result = None
+    try:
+        result = _create_research(request, response, x_page_id, current_user, db)
+    finally:
+        if result is not None and result["code"] == ErrorCode.SUCCESS.value:
+            idempotency_store.complete("create", user_id, idempotency_key, fingerprint, result["data"])
+        else:
+            # 未成功创建：释放占位，客户端可用同一个键重试
+            idempotency_store.abort("create", user_id, idempotency_key)
+    return result
+
+
+def _session_busy(response: Response):
+    """同一会话已有进行中的任务：HTTP 409，同时保持 ErrorResponse 格式"""
+    response.status_code = ErrorCode.CONFLICT.value
+    return ErrorResponse.create_error_response(
+        ErrorCode.CONFLICT,
+        "当前会话已有正在处理中的任务，请等待任务完成后再提交新的研究请求"
+    )
+
+
+def _create_research(
+    request: CreateResearchRequest,
+    response: Response,
+    x_page_id: Optional[str],
+    current_user: dict,
+    db: Session,
+):
+    """create_research 的主体：准入检查、写库并提交到调度器"""
+    decision = admission_controller.check(current_user["user_id"])
+    if decision:
+        response.status_code = ErrorCode.TOO_MANY_REQUESTS.value
+        response.headers["Retry-After"] = str(decision.retry_after)
+        return ErrorResponse.create_error_response(
+            ErrorCode.TOO_MANY_REQUESTS, ErrorMessage.TOO_MANY_REQUESTS,
+            {"reason": decision.reason, "retry_after": decision.retry_after}
+        )
+
+    if task_scheduler.is_saturated():
+        logger.warning(f"研究任务排队已满，拒绝新的研究请求: {task_scheduler.stats()}")
+        response.status_code = ErrorCode.SERVICE_UNAVAILABLE.value
+        return ErrorResponse.create_error_response(ErrorCode.SERVICE_UNAVAILABLE, ErrorMessage.PIPELINE_BUSY)
+
     try:
         user_id = current_user["user_id"]
         user_email = current_user["email"]
@@ -453,58 +567,116 @@ async def create_research(
             db.add(session)
             db.flush()
 
-        # 检查当前会话是否有正在处理中的任务
-        # creation_status 为 'pending' 或 'creating' 时表示任务正在处理中
-        in_progress_task = db.scalar(
-            select(ResearchChatProcessInfo).where(
-                ResearchChatProcessInfo.session_id == session.id,
-                ResearchChatProcessInfo.user_id == user_id,
-                ResearchChatProcessInfo.creation_status.in_(CreationStatus.IN_PROGRESS)
+        # 会话级锁：多 worker 并发请求同一会话时，检查进行中任务与写入新任务之间不被穿插
+        with kv_store.lock(f"session_create:{session.id}", Config.SESSION_LOCK_SECONDS) as locked:
+            if not locked:
+                logger.warning(f"会话 {session.page_session_id} 有并发的创建请求，拒绝创建新消息")
+                return _session_busy(response)
+
+            # 检查当前会话是否有正在处理中的任务
+            # creation_status 为 'pending' 或 'creating' 时表示任务正在处理中
+            # 使用加锁读（FOR UPDATE）：上面读取会话时已建立 REPEATABLE READ 快照，
+            # 普通读取看不到其他 worker 在此之后提交的任务
+            in_progress_task = db.scalar(
+                select(ResearchChatProcessInfo).where(
+                    ResearchChatProcessInfo.session_id == session.id,
+                    ResearchChatProcessInfo.user_id == user_id,
+                    ResearchChatProcessInfo.creation_status.in_(CreationStatus.IN_PROGRESS)
+                ).with_for_update()
             )
-        )
 
-        if in_progress_task:
-            logger.warning(f"会话 {session.page_session_id} 已有正在处理中的任务 (message_id={in_progress_task.message_id})，拒绝创建新消息")
-            # 设置 HTTP 状态码为 409，同时保持 ErrorResponse 格式
-            response.status_code = ErrorCode.CONFLICT.value
-            return ErrorResponse.create_error_response(
-                ErrorCode.CONFLICT,
-                f"当前会话已有正在处理中的任务，请等待任务完成后再提交新的研究请求"
+            if in_progress_task:
+                logger.warning(f"会话 {session.page_session_id} 已有正在处理中的任务 (message_id={in_progress_task.message_id})，拒绝创建新消息")
+                return _session_busy(response)
+
+            # 相同研究请求去重：复用已完成的结果，或附加到运行中的相同任务
+            fingerprint = request_dedup.fingerprint(content, locale) if request_dedup.enabled and request.reuse_results else None
+            dedup_kind, dedup_source = request_dedup.find(fingerprint) if fingerprint else (None, None)
+            extra_info = {"locale": locale}  # 崩溃恢复重新入队时使用
+            if dedup_kind == RUNNING:
+                extra_info["dedup_of"] = dedup_source
+
+            # 创建消息记录
+            message = ResearchChatMessage(
+                session_id=session.id,
+                user_id=user_id,
+                email=user_email,
+                content=content
             )
+            db.add(message)
+            db.flush()
 
-        # 创建消息记录
-        message = ResearchChatMessage(
-            session_id=session.id,
-            user_id=user_id,
-            email=user_email,
-            content=content
-        )
-        db.add(message)
-        db.flush()
-
-        # 创建进程记录（初始为 creating）
-        process = ResearchChatProcessInfo(
-            session_id=session.id,
-            message_id=message.id,
-            user_id=user_id,
-            email=user_email,
-            creation_status=CreationStatus.CREATING,
-            process_info={"logs": [format_log_with_timestamp("🚀 开始处理研究请求")]}
-        )
-        db.add(process)
-        db.commit()
+            # 创建进程记录（初始为 pending，调度执行后由流水线置为 creating）
+            process = ResearchChatProcessInfo(
+                session_id=session.id,
+                message_id=message.id,
+                user_id=user_id,
+                email=user_email,
+                creation_status=CreationStatus.PENDING,
+                process_info={"logs": [format_log_with_timestamp("🚀 开始处理研究请求")]},
+                extra_info=extra_info
+            )
+            db.add(process)
+            try:
+                db.commit()
+            except IntegrityError:
+                # 数据库兜底：uq_rc_active_session 保证同一会话最多一个进行中任务
+                db.rollback()
+                logger.warning(f"会话 {session.page_session_id} 已有正在处理中的任务（唯一约束），拒绝创建新消息")
+                return _session_busy(response)
 
         logger.info(f"研究请求已创建(异步): message_id={message.id}, session={session.page_session_id}")
 
-        # 启动后台任务（异步处理 LLM & 更新DB）
-        if background_tasks is not None:
-            background_tasks.add_task(_background_process_prompt_and_update,
-                                      message.id, session.id, user_id, user_email, content, locale)
+        if dedup_kind == COMPLETED and clone_result(db, dedup_source, message.id):
+            DEDUP_REQUESTS_TOTAL.labels("cloned").inc()
+            logger.info(f"复用相同研究请求的结果: message_id={message.id}, source={dedup_source}")
+            return ErrorResponse.success_response("研究消息已成功创建", {
+                "message_id": message.id,
+                "session_id": session.page_session_id,
+                "queue_position": 0,
+                "deduplicated": "cloned"
+            })
+
+        if dedup_kind == RUNNING:
+            request_dedup.attach(dedup_source, message.id)
+            # leader 恰好在附加前完成时 fan-out 可能已错过本任务
+            if not request_dedup.is_running(fingerprint, dedup_source):
+                clone_result(db, dedup_source, message.id)
+            DEDUP_REQUESTS_TOTAL.labels("attached").inc()
+            logger.info(f"附加到运行中的相同研究任务: message_id={message.id}, leader={dedup_source}")
+            return ErrorResponse.success_response("研究消息已成功创建", {
+                "message_id": message.id,
+                "session_id": session.page_session_id,
+                "queue_position": task_scheduler.position(dedup_source) or 0,
+                "deduplicated": "attached"
+            })
+
+        if fingerprint:
+            request_dedup.claim_leader(fingerprint, message.id)
+
+        # 提交到公平调度器（异步处理 LLM & 更新DB）
+        try:
+            queue_position = task_scheduler.submit(
+                message.id, user_id, current_user.get("identity_tag"),
+                _background_process_prompt_and_update,
+                message.id, session.id, user_id, user_email, content, locale, get_trace_id()
+            )
+        except PipelineRejectedError as e:
+            # 并发提交导致检查后排队被占满：将刚创建的任务标记为失败
+            logger.warning(f"研究任务调度被拒绝: message_id={message.id}, {e}")
+            if fingerprint:
+                request_dedup.release(fingerprint, message.id)
+            process.creation_status = CreationStatus.FAILED
+            process.process_info = {"logs": process.process_info["logs"] + [format_log_with_timestamp("❌ " + ErrorMessage.PIPELINE_BUSY)]}
+            db.commit()
+            response.status_code = ErrorCode.SERVICE_UNAVAILABLE.value
+            return ErrorResponse.create_error_response(ErrorCode.SERVICE_UNAVAILABLE, ErrorMessage.PIPELINE_BUSY)
 
         # 立即返回（前端拿到 message_id 后再连接 WS）
         return ErrorResponse.success_response("研究消息已成功创建", {
             "message_id": message.id,
-            "session_id": session.page_session_id
+            "session_id": session.page_session_id,
+            "queue_position": queue_position
         })
 
     except Exception as e:
@@ -513,47 +685,35 @@ async def create_research(
         return ErrorResponse.create_error_response(ErrorCode.INTERNAL_SERVER_ERROR, ErrorMessage.INTERNAL_SERVER_ERROR)
 
 
-def _background_process_prompt_and_update(message_id: int, session_db_id: int, user_id: int, user_email: str, content: str, locale: str = "cn"):
+def _background_process_prompt_and_update(message_id: int, session_db_id: int, user_id: int, user_email: str, content: str, locale: str = "cn", trace_id: Optional[str] = None):
     """
     后台任务：结合 prompt 调用模型并异步更新数据库
     - 仿照deepresearch的run_research_async函数模式
     - 追加进度日志到 ResearchChatProcessInfo.process_info.logs
     - 调用keyu-ideation的6步研究计划生成流程
     - 更新 ResearchChatMessage.result_papers 与进程状态
+    - trace_id 为发起请求的追踪ID，任务日志携带 trace_id / message_id / step
+    - 截止时间与取消：TaskContext 在步骤之间检查，LLM / S2 调用超时按剩余预算收紧
     """
-    # 定义任务超时时间 (1小时 = 3600秒)
-    TASK_TIMEOUT_SECONDS = 3600.0
-    
     db = SessionLocal()
-    
-    # Create task-specific logger (following deepresearch pattern)
-    task_logger = logging.getLogger(f"research_task.msg_{message_id}")
-    task_logger.setLevel(logging.INFO)
-    if task_logger.hasHandlers():
-        task_logger.handlers.clear()
-
-    formatter = logging.Formatter(
-        f'[%(asctime)s] [%(levelname)s] [msg:{message_id}] %(message)s',
-        '%Y-%m-%d %H:%M:%S'
+    task_ctx = TaskContext(
+        Config.TASK_TIMEOUT_SECONDS,
+        is_cancel_requested=lambda: _is_cancel_requested(message_id),
+        poll_interval=Config.TASK_CANCEL_POLL_SECONDS,
     )
-
-    # File handler
-    log_dir = "logs"
-    os.makedirs(log_dir, exist_ok=True)
-    log_file = os.path.join(log_dir, f"message_{message_id}_task.log")
-    file_handler = logging.FileHandler(log_file, encoding="utf-8")
-    file_handler.setFormatter(formatter)
-    task_logger.addHandler(file_handler)
-
-    # Stream handler
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(formatter)
-    task_logger.addHandler(stream_handler)
     
+    # 任务日志器：共享 research_task 日志汇，按 message_id 分片写入 logs/tasks/YYYYMMDD/
+    task_logger = get_task_logger(message_id)
+
     # 核心业务逻辑函数
     def _execute_research():
-        # 用户状态日志 (db_log) 的设置 - 仿照deepresearch模式
-        logs = []
+        # 断点：崩溃恢复后从最后一个已完成步骤继续（保存在 ResearchChatMessage.extra_info.checkpoint）
+        checkpoint = _load_checkpoint(db, message_id)
+        completed = list(checkpoint.get("completed", []))
+        state = dict(checkpoint.get("state", {}))
+
+        # 用户状态日志 (db_log) 的设置 - 仿照deepresearch模式；恢复执行时保留已有日志
+        logs = _load_logs(db, message_id) if completed else []
         
         def db_log(msg: str, stage: str = CreationStatus.CREATING):
             nonlocal logs
@@ -563,21 +723,41 @@ def _background_process_prompt_and_update(message_id: int, session_db_id: int, u
 
             # 直接更新数据库 - 仿照deepresearch的数据库更新模式
             try:
-                proc = db.scalar(
-                    select(ResearchChatProcessInfo).where(ResearchChatProcessInfo.message_id == message_id)
-                )
-                if proc:
-                    proc.process_info = {"logs": logs}
-                    proc.creation_status = stage
-                    proc.updated_at = datetime.now()
-                    db.commit()
+                _save_logs(db, message_id, logs, stage)
             except Exception as e:
                 task_logger.error(f"Failed to update process info: {e}")
                 db.rollback()
 
+        def save_checkpoint(step: str, **values):
+            completed.append(step)
+            state.update(values)
+            try:
+                msg = db.scalar(select(ResearchChatMessage).where(ResearchChatMessage.id == message_id))
+                if msg:
+                    msg.extra_info = {**(msg.extra_info or {}), "checkpoint": {"completed": completed, "state": state}}
+                    db.commit()
+            except Exception as e:
+                # 断点仅用于恢复，写入失败不影响本次执行
+                task_logger.warning(f"Failed to save checkpoint after step {step}: {e}")
+                db.rollback()
+
         try:
-            db_log(get_localized_message("task_start", locale))
-            task_logger.info(f"Research task started. Topic: '{content}'")
+            if completed:
+                db_log(get_localized_message("task_resume", locale))
+                task_logger.info(f"Research task resumed after steps {completed}. Topic: '{content}'")
+            else:
+                db_log(get_localized_message("task_start", locale))
+                task_logger.info(f"Research task started. Topic: '{content}'")
+                # 相似题目：直接复用其检索结果，跳过对应步骤
+                reused = _reuse_similar_retrieval(db, content, locale)
+                if reused:
+                    source_id, score, steps, snapshot = reused
+                    completed.extend(steps)
+                    state.update(snapshot)
+                    DEDUP_REQUESTS_TOTAL.labels("semantic").inc()
+                    key = "semantic_reuse" if "papers" in steps else "semantic_reuse_keywords"
+                    db_log(get_localized_message(key, locale).format(score=score))
+                    task_logger.info(f"Reusing steps {steps} from similar message {source_id} (similarity {score:.3f})")
             
             # 初始化LLM客户端
             try:
@@ -587,83 +767,144 @@ def _background_process_prompt_and_update(message_id: int, session_db_id: int, u
                 raise Exception(get_localized_message("llm_init_failed", locale) + f": {e}")
 
             # === Step 1: Extract Keywords ===
-            db_log(get_localized_message("step1_keywords", locale))
-            task_logger.info("Step 1: Extracting keywords from query")
-            try:
-                prompt = get_prompt("retrieve_query", locale=locale, user_query=content)
-                response = client.get_response(prompt=prompt)
-                task_logger.info(f"Keywords extracted: {response}")
-                
-                query_list = [kw.strip() for kw in response.split(",")]
-                if len(query_list) == 1:
-                    query = query_list[0]
-                else:
-                    query = " | ".join(f'"{item}"' for item in query_list)
-                
-                db_log(get_localized_message("keywords_complete", locale))
-                task_logger.info(f"Constructed query: {query}")
-            except Exception as e:
-                raise Exception(get_localized_message("keywords_failed", locale) + f": {e}")
+            speculation = None
+            if "keywords" in completed:
+                response, query = state["keywords"], state["query"]
+            else:
+                task_ctx.check()
+                db_log(get_localized_message("step1_keywords", locale))
+                task_logger.info("Step 1: Extracting keywords from query")
+                with log_step(task_logger, "keywords"), track_pipeline_step("keywords"):
+                    try:
+                        # 推测检索：按本地猜测的关键词与 LLM 调用并行检索（SPECULATIVE_RETRIEVAL_ENABLED）
+                        speculation = start_speculative_retrieval(
+                            content, (get_newest_paper, get_highly_cited_paper, get_relevence_paper)
+                        )
+                        # 本地提取置信度足够时跳过一次 LLM 调用（KEYWORD_EXTRACTOR_MODE）
+                        response, source = extract_keywords(
+                            content,
+                            lambda: client.get_response(
+                                prompt=get_prompt("retrieve_query", locale=locale, user_query=content), template="retrieve_query"
+                            ),
+                        )
+                        task_logger.info(f"Keywords extracted ({source}): {response}")
+                        query = build_search_query(response)
+
+                        db_log(get_localized_message("keywords_complete", locale))
+                        task_logger.info(f"Constructed query: {query}")
+                    except TaskInterrupted:
+                        # 关键词未得到：已发起的推测检索不会再被使用，取消尚未开始的检索
+                        if speculation:
+                            speculation.discard()
+                        raise
+                    except Exception as e:
+                        if speculation:
+                            speculation.discard()
+                        raise Exception(get_localized_message("keywords_failed", locale) + f": {e}")
+                save_checkpoint("keywords", keywords=response, query=query)
 
             # === Step 2: Retrieve Papers ===
-            db_log(get_localized_message("step2_papers", locale))
-            task_logger.info("Step 2: Retrieving related papers")
-            try:
-                newest_paper = get_newest_paper(query)
-                highly_cited_paper = get_highly_cited_paper(query)
-                relevence_paper = get_relevence_paper(query)
+            if "papers" in completed:
+                newest_paper, highly_cited_paper, relevence_paper = state["newest"], state["highly_cited"], state["relevant"]
                 paper = construct_paper(newest_paper, highly_cited_paper, relevence_paper)
-                
-                task_logger.info(f"Papers retrieved: {len(newest_paper)} newest, {len(highly_cited_paper)} highly cited, {len(relevence_paper)} relevant")
-                db_log(get_localized_message("papers_complete", locale))
-            except Exception as e:
-                raise Exception(get_localized_message("papers_failed", locale) + f": {e}")
+            else:
+                task_ctx.check()
+                db_log(get_localized_message("step2_papers", locale))
+                task_logger.info("Step 2: Retrieving related papers")
+                with log_step(task_logger, "papers"), track_pipeline_step("papers"):
+                    try:
+                        speculative = speculation.take(response) if speculation else None
+                        if speculative:
+                            newest_paper, highly_cited_paper, relevence_paper = speculative
+                            task_logger.info(f"Using speculative retrieval for query: {speculation.query}")
+                        else:
+                            newest_paper = get_newest_paper(query)
+                            highly_cited_paper = get_highly_cited_paper(query)
+                            relevence_paper = get_relevence_paper(query)
+                        paper = construct_paper(newest_paper, highly_cited_paper, relevence_paper)
+                    
+                        task_logger.info(f"Papers retrieved: {len(newest_paper)} newest, {len(highly_cited_paper)} highly cited, {len(relevence_paper)} relevant")
+                        db_log(get_localized_message("papers_complete", locale))
+                    except TaskInterrupted:
+                        raise
+                    except Exception as e:
+                        raise Exception(get_localized_message("papers_failed", locale) + f": {e}")
+                save_checkpoint("papers", newest=newest_paper, highly_cited=highly_cited_paper, relevant=relevence_paper)
 
             # === Step 3: Generate Inspiration ===
-            db_log(get_localized_message("step3_inspiration", locale))
-            task_logger.info("Step 3: Generating inspiration from papers")
-            try:
-                prompt = get_prompt("get_inspiration", locale=locale, user_query=content, paper=paper)
-                inspiration = client.get_response(prompt=prompt)
-                task_logger.info(f"Inspiration generated (length: {len(inspiration)} chars)")
-                db_log(get_localized_message("inspiration_complete", locale))
-            except Exception as e:
-                raise Exception(get_localized_message("inspiration_failed", locale) + f": {e}")
+            if "inspiration" in completed:
+                inspiration = state["inspiration"]
+            else:
+                task_ctx.check()
+                db_log(get_localized_message("step3_inspiration", locale))
+                task_logger.info("Step 3: Generating inspiration from papers")
+                with log_step(task_logger, "inspiration"), track_pipeline_step("inspiration"):
+                    try:
+                        prompt = get_prompt("get_inspiration", locale=locale, user_query=content, paper=paper)
+                        inspiration = client.get_response(prompt=prompt, template="get_inspiration")
+                        task_logger.info(f"Inspiration generated (length: {len(inspiration)} chars)")
+                        db_log(get_localized_message("inspiration_complete", locale))
+                    except TaskInterrupted:
+                        raise
+                    except Exception as e:
+                        raise Exception(get_localized_message("inspiration_failed", locale) + f": {e}")
+                save_checkpoint("inspiration", inspiration=inspiration)
 
             # === Step 4: Generate Preliminary Plan ===
-            db_log(get_localized_message("step4_plan", locale))
-            task_logger.info("Step 4: Generating preliminary research plan")
-            try:
-                prompt = get_prompt("generate_research_plan", locale=locale, user_query=content, paper=paper, inspiration=inspiration)
-                research_plan = client.get_response(prompt=prompt)
-                task_logger.info(f"Preliminary plan generated (length: {len(research_plan)} chars)")
-                db_log(get_localized_message("plan_complete", locale))
-            except Exception as e:
-                raise Exception(get_localized_message("plan_failed", locale) + f": {e}")
+            if "plan" in completed:
+                research_plan = state["research_plan"]
+            else:
+                task_ctx.check()
+                db_log(get_localized_message("step4_plan", locale))
+                task_logger.info("Step 4: Generating preliminary research plan")
+                with log_step(task_logger, "plan"), track_pipeline_step("plan"):
+                    try:
+                        prompt = get_prompt("generate_research_plan", locale=locale, user_query=content, paper=paper, inspiration=inspiration)
+                        research_plan = client.get_response(prompt=prompt, template="generate_research_plan")
+                        task_logger.info(f"Preliminary plan generated (length: {len(research_plan)} chars)")
+                        db_log(get_localized_message("plan_complete", locale))
+                    except TaskInterrupted:
+                        raise
+                    except Exception as e:
+                        raise Exception(get_localized_message("plan_failed", locale) + f": {e}")
+                save_checkpoint("plan", research_plan=research_plan)
 
             # === Step 5: Critical Review ===
-            db_log(get_localized_message("step5_review", locale))
-            task_logger.info("Step 5: Conducting critical review")
-            try:
-                prompt = get_prompt("critic_research_plan", locale=locale, user_query=content, paper=paper, inspiration=inspiration, research_plan=research_plan)
-                criticism = client.get_response(prompt=prompt)
-                task_logger.info(f"Critical review completed (length: {len(criticism)} chars)")
-                db_log(get_localized_message("review_complete", locale))
-            except Exception as e:
-                raise Exception(get_localized_message("review_failed", locale) + f": {e}")
-
-            # === Step 6: Refine Plan ===
+            if "review" in completed:
+                criticism = state["criticism"]
+            else:
+                task_ctx.check()
+                db_log(get_localized_message("step5_review", locale))
+                task_logger.info("Step 5: Conducting critical review")
+                with log_step(task_logger, "review"), track_pipeline_step("review"):
+                    try:
+                        prompt = get_prompt("critic_research_plan", locale=locale, user_query=content, paper=paper, inspiration=inspiration, research_plan=research_plan)
+                        criticism = client.get_response(prompt=prompt, template="critic_research_plan")
+                        task_logger.info(f"Critical review completed (length: {len(criticism)} chars)")
+                        db_log(get_localized_message("review_complete", locale))
+                    except TaskInterrupted:
+                        raise
+                    except Exception as e:
+                        raise Exception(get_localized_message("review_failed", locale) + f": {e}")
+                save_checkpoint("review", criticism=criticism)
+
+            # === Step 6: Refine Plan ===（最后一步，结果直接写入消息，无需断点）
+            task_ctx.check()
             db_log(get_localized_message("step6_finalize", locale))
             task_logger.info("Step 6: Refining research plan based on criticism")
-            try:
-                prompt = get_prompt("refine_research_plan", locale=locale, user_query=content, research_plan=research_plan, criticism=criticism)
-                final_research_plan = client.get_response(prompt=prompt)
-                task_logger.info(f"Final plan generated (length: {len(final_research_plan)} chars)")
-                db_log(get_localized_message("finalize_complete", locale))
-            except Exception as e:
-                raise Exception(get_localized_message("finalize_failed", locale) + f": {e}")
+            with log_step(task_logger, "finalize"), track_pipeline_step("finalize"):
+                try:
+                    prompt = get_prompt("refine_research_plan", locale=locale, user_query=content, research_plan=research_plan, criticism=criticism)
+                    final_research_plan = client.get_response(prompt=prompt, template="refine_research_plan")
+                    task_logger.info(f"Final plan generated (length: {len(final_research_plan)} chars)")
+                    db_log(get_localized_message("finalize_complete", locale))
+                except TaskInterrupted:
+                    raise
+                except Exception as e:
+                    raise Exception(get_localized_message("finalize_failed", locale) + f": {e}")
 
             # === Update Message with Final Result ===
+            task_ctx.check()
             db_log("🔄 保存最终研究计划...")
             task_logger.info("Saving final research plan to database")
             try:
@@ -689,14 +930,28 @@ def _background_process_prompt_and_update(message_id: int, session_db_id: int, u
                     msg.result_papers = result_data_to_save
                     msg.updated_at = datetime.now()
                     msg.extra_info = {"generation_complete": True}
+                    if Config.SEMANTIC_CACHE_ENABLED:
+                        # 检索结果快照，供相似题目复用
+                        msg.extra_info["retrieval"] = {
+                            "keywords": response, "query": query, "newest": newest_paper,
+                            "highly_cited": highly_cited_paper, "relevant": relevence_paper, "inspiration": inspiration,
+                        }
                     db.commit()
                     task_logger.info("Final research plan saved to database successfully")
+            except TaskInterrupted:
+                raise
             except Exception as e:
                 raise Exception(f"保存最终研究计划失败: {e}")
 
             db_log(get_localized_message("task_complete", locale), stage=CreationStatus.CREATED)
             task_logger.info("===== TASK COMPLETED SUCCESSFULLY =====")
+            PIPELINE_TASKS_TOTAL.labels(CreationStatus.CREATED).inc()
+            remember_topic(message_id, content, locale)
+            return True
 
+        except TaskInterrupted:
+            # 取消 / 超时由外层统一处理
+            raise
         except Exception as e:
             # 对用户，只记录简洁的错误信息
             error_message_for_user = get_localized_message("task_failed", locale) + f": {str(e)}"
@@ -705,62 +960,175 @@ def _background_process_prompt_and_update(message_id: int, session_db_id: int, u
             # 对开发者，使用 exception 记录完整的堆栈跟踪到日志文件
             task_logger.exception("A critical error caused the research task to fail. See traceback below.")
             task_logger.error("===== TASK FAILED =====")
+            PIPELINE_TASKS_TOTAL.labels(CreationStatus.FAILED).inc()
+            return False
 
-    # 主要执行逻辑 - 仿照deepresearch的超时处理
-    try:
-        task_logger.info(f"Task starting with a timeout of {TASK_TIMEOUT_SECONDS} seconds.")
-        
-        # 使用threading.Timer来模拟超时处理（因为这是同步函数）
-        import threading
-        import signal
-        
-        def timeout_handler():
-            raise TimeoutError(f"Task timed out after {TASK_TIMEOUT_SECONDS} seconds")
-        
-        # 设置超时定时器
-        timer = threading.Timer(TASK_TIMEOUT_SECONDS, timeout_handler)
-        timer.start()
-        
-        try:
-            _execute_research()
-        finally:
-            timer.cancel()
-            
-    except TimeoutError as e:
-        # 超时处理 - 仿照deepresearch的超时处理模式
-        timeout_message = "❌ 任务执行失败: 运行超过1小时，已自动超时。"
-        task_logger.error(f"Task timed out after {TASK_TIMEOUT_SECONDS} seconds. Marking as failed.")
-        
-        # 直接更新数据库状态为 failed
+    def _mark_failed(message: str):
+        """追加一条日志并将任务置为失败（取消 / 超时）"""
         try:
             proc = db.scalar(
                 select(ResearchChatProcessInfo).where(ResearchChatProcessInfo.message_id == message_id)
             )
-            if proc and proc.process_info and 'logs' in proc.process_info:
-                logs_on_timeout = proc.process_info['logs']
-            else:
-                logs_on_timeout = []
-            
-            log_entry = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {timeout_message}"
-            logs_on_timeout.append(log_entry)
-            
-            proc.process_info = {"logs": logs_on_timeout}
+            if not proc:
+                return
+            logs = list(proc.process_info.get('logs', [])) if proc.process_info else []
+            logs.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}")
+            proc.process_info = {"logs": logs}
             proc.creation_status = CreationStatus.FAILED
-            proc.updated_at = datetime.now()
+            proc.updated_at = datetime.now(UTC8)
             db.commit()
-            
-            task_logger.error("===== TASK FAILED DUE TO TIMEOUT =====")
         except Exception as e:
-            task_logger.error(f"Failed to update timeout status: {e}")
+            task_logger.error(f"Failed to update interrupted status: {e}")
             db.rollback()
-        
+
+    # 后台线程中重新绑定追踪上下文，日志可关联到发起请求的 trace_id
+    with bind_trace_context(trace_id=trace_id, message_id=message_id), bind_task_context(message_id, task_ctx):
+        try:
+            task_logger.info(f"Task starting with a timeout of {Config.TASK_TIMEOUT_SECONDS} seconds.")
+            succeeded = _execute_research()
+            finish_leader(content, locale, message_id, succeeded)
+
+        except TaskDeadlineExceeded:
+            task_logger.error(f"Task timed out after {Config.TASK_TIMEOUT_SECONDS} seconds. Marking as failed.")
+            PIPELINE_TASKS_TOTAL.labels("timeout").inc()
+            _mark_failed("❌ 任务执行失败: 运行超过时间上限，已自动超时。")
+            finish_leader(content, locale, message_id, False)
+            task_logger.error("===== TASK FAILED DUE TO TIMEOUT =====")
+
+        except TaskSuspended:
+            # 停机排空：断点已在步骤完成时保存，交给存活 worker / 重启后的服务恢复
+            task_logger.warning("Task suspended for shutdown; marked resumable.")
+            PIPELINE_TASKS_TOTAL.labels("suspended").inc()
+            mark_resumable([message_id])
+
+        except TaskCancelledError:
+            task_logger.warning("Task cancelled by user request.")
+            PIPELINE_TASKS_TOTAL.labels("cancelled").inc()
+            _mark_failed("⛔ " + get_localized_message("task_cancelled", locale))
+            finish_leader(content, locale, message_id, False)
+            task_logger.warning("===== TASK CANCELLED =====")
+
+        finally:
+            db.close()
+
+
+def _load_checkpoint(db: Session, message_id: int) -> dict:
+    """读取崩溃恢复断点 {"completed": [...], "state": {...}}，无断点时返回空字典"""
+    msg = db.scalar(select(ResearchChatMessage).where(ResearchChatMessage.id == message_id))
+    extra_info = getattr(msg, "extra_info", None) or {}
+    return extra_info.get("checkpoint") or {}
+
+
+def _reuse_similar_retrieval(db: Session, content: str, locale: str) -> Optional[tuple]:
+    """
+    相似题目缓存命中时返回 (message_id, 相似度, 可跳过的步骤, 断点状态)，否则返回 None
+
+    依次检查相似度达到阈值的前几个历史题目：优先复用完整的检索结果快照，其次只复用关键词与检索式
+    """
+    keys = ("keywords", "query", "newest", "highly_cited", "relevant")
+    keywords_only = None
+    for source_id, score in find_similar(content, locale):
+        msg = db.scalar(select(ResearchChatMessage).where(ResearchChatMessage.id == source_id))
+        if msg is None:
+            continue
+        retrieval = (msg.extra_info or {}).get("retrieval") or {}
+        if all(key in retrieval for key in keys):
+            steps = ["keywords", "papers"]
+            snapshot = {key: retrieval[key] for key in keys}
+            if Config.SEMANTIC_CACHE_REUSE_INSPIRATION and retrieval.get("inspiration"):
+                steps.append("inspiration")
+                snapshot["inspiration"] = retrieval["inspiration"]
+            return source_id, score, steps, snapshot
+        intermediate = (msg.result_papers or {}).get("intermediate_results") or {}
+        if keywords_only is None and intermediate.get("keywords") and intermediate.get("query"):
+            keywords_only = (source_id, score, ["keywords"],
+                             {"keywords": intermediate["keywords"], "query": intermediate["query"]})
+    return keywords_only
+
+
+def _load_logs(db: Session, message_id: int) -> list:
+    """读取已有的用户状态日志（恢复执行时续写）"""
+    proc = db.scalar(select(ResearchChatProcessInfo).where(ResearchChatProcessInfo.message_id == message_id))
+    process_info = getattr(proc, "process_info", None) or {}
+    return list(process_info.get("logs", []))
+
+
+def _save_logs(db: Session, message_id: int, logs: list, stage: str) -> bool:
+    """整列写回用户状态日志与任务状态，并刷新心跳（updated_at）"""
+    proc = db.scalar(select(ResearchChatProcessInfo).where(ResearchChatProcessInfo.message_id == message_id))
+    if not proc:
+        return False
+    proc.process_info = {"logs": logs}
+    proc.creation_status = stage
+    # 与列默认值一致使用 UTC8，updated_at 同时作为崩溃恢复的心跳
+    proc.updated_at = datetime.now(UTC8)
+    db.commit()
+    return True
+
+
+def _is_cancel_requested(message_id: int) -> bool:
+    """查询取消标记（独立短会话，读取其他 worker 写入的最新值）"""
+    db = SessionLocal()
+    try:
+        extra_info = db.scalar(
+            select(ResearchChatProcessInfo.extra_info).where(ResearchChatProcessInfo.message_id == message_id)
+        )
+        return bool(extra_info and extra_info.get("cancel_requested"))
     finally:
-        # 任务结束时 (无论成功、失败还是超时)，都关闭并移除handler
-        for handler in task_logger.handlers[:]:
-            handler.close()
-            task_logger.removeHandler(handler)
         db.close()
 
+
+@router.post("/messages/{message_id}/cancel")
+async def cancel_research(
+    message_id: int,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    取消研究任务
+    - 排队中（本进程）/ 去重 follower：直接移出队列并置为失败
+    - 执行中：写入取消标记，任务在下一个检查点停止（同进程立即生效，其他 worker 轮询生效）
+    """
+    try:
+        user_id = current_user["user_id"]
+        process = db.scalar(
+            select(ResearchChatProcessInfo).where(
+                ResearchChatProcessInfo.message_id == message_id,
+                ResearchChatProcessInfo.user_id == user_id
+            )
+        )
+        if not process:
+            return ErrorResponse.create_error_response(ErrorCode.NOT_FOUND, "任务不存在")
+
+        if process.creation_status in CreationStatus.FINISHED:
+            return ErrorResponse.create_error_response(ErrorCode.CONFLICT, "任务已结束，无法取消")
+
+        process.extra_info = {**(process.extra_info or {}), "cancel_requested": True,
+                              "cancel_requested_at": datetime.now(UTC8).isoformat()}
+
+        if task_scheduler.cancel(message_id) or process.extra_info.get("dedup_of") is not None:
+            # 尚未开始执行（或附加在相同任务上的去重 follower）：直接结束
+            logs = list(process.process_info.get("logs", [])) if process.process_info else []
+            logs.append(format_log_with_timestamp("⛔ " + get_localized_message("task_cancelled")))
+            process.process_info = {"logs": logs}
+            process.creation_status = CreationStatus.FAILED
+            PIPELINE_TASKS_TOTAL.labels("cancelled").inc()
+        db.commit()
+
+        request_cancel(message_id)
+        logger.info(f"已请求取消研究任务: message_id={message_id}, status={process.creation_status}")
+
+        return ErrorResponse.success_response("已请求取消任务", {
+            "message_id": message_id,
+            "status": process.creation_status
+        })
+
+    except Exception as e:
+        logger.error(f"取消研究任务失败: {e}")
+        db.rollback()
+        return ErrorResponse.create_error_response(ErrorCode.INTERNAL_SERVER_ERROR, ErrorMessage.INTERNAL_SERVER_ERROR)
+
+
 @router.get("/health")
 async def health_check():
     """健康检查端点"""
@@ -18,6 +18,8 @@ from app.entity.research_chat import ResearchChatProcessInfo
 from app.constants.task_status import CreationStatus
 from sqlalchemy import select
 from app.core.config import Config
+from app.core.metrics import WS_ACTIVE_CONNECTIONS
+from app.services.task_scheduler import task_scheduler
 
 logger = get_logger('websocket')
 
@@ -99,6 +101,31 @@ async def authenticate_websocket(websocket: WebSocket) -> Optional[dict]:
         return None
 
 
+def build_status_message(result: ResearchChatProcessInfo) -> dict:
+    """根据进程记录组装推送给前端的统一格式状态消息（pending 时附带排队位置）"""
+    status_data = {
+        "message_id": int(result.message_id),
+        "status": result.creation_status,
+        "logs": result.process_info.get("logs", []) if result.process_info else []
+    }
+
+    # 根据状态确定消息文本
+    status_messages = {
+        CreationStatus.CREATED: "任务成功完成",
+        CreationStatus.FAILED: "任务失败",
+    }
+    message_text = status_messages.get(result.creation_status, "任务正在进行中")
+
+    if result.creation_status == CreationStatus.PENDING:
+        # 排队位置仅在本进程调度的任务可知；未知时为 None
+        queue_position = task_scheduler.position(int(result.message_id))
+        status_data["queue_position"] = queue_position
+        if queue_position:
+            message_text = "任务排队中"
+
+    return {"code": 200, "message": message_text, "data": status_data}
+
+
 @router.websocket("/ws/status/{message_id}")
 async def websocket_status(
     websocket: WebSocket,
@@ -154,6 +181,7 @@ async def websocket_status(
     # ==================== 建立连接 ====================
 
     await websocket.accept()
+    WS_ACTIVE_CONNECTIONS.inc()
     logger.info(
         f"WebSocket 连接已建立: message_id={message_id}, "
         f"user_id={user_info['user_id']}, email={user_info['email']}"
@@ -175,24 +203,7 @@ async def websocket_status(
                 result = None
 
             if result:
-                # 准备状态数据
-                status_data = {
-                    "message_id": int(result.message_id),
-                    "status": result.creation_status,
-                    "logs": result.process_info.get("logs", []) if result.process_info else []
-                }
-
-                # 根据状态确定消息文本
-                status_messages = {
-                    CreationStatus.CREATED: "任务成功完成",
-                    CreationStatus.FAILED: "任务失败",
-                }
-                message_text = status_messages.get(result.creation_status, "任务正在进行中")
-
-                # 组装统一格式消息
-                message_to_send = {
-                    "code": 200, "message": message_text, "data": status_data
-                }
+                message_to_send = build_status_message(result)
 
                 # 只在状态变化时发送
                 if message_to_send != last_sent_status:
@@ -223,6 +234,7 @@ async def websocket_status(
         except:
             pass
     finally:
+        WS_ACTIVE_CONNECTIONS.dec()
         # 优化关闭流程，快速释放资源
         try:
             if websocket.client_state.name != 'DISCONNECTED':
@@ -0,0 +1,215 @@
+"""
+研究请求准入控制
+Admission control and load shedding for /create
+
+容量已饱和时继续接收任务只会让任务堆积、最终在 1 小时超时后失败。
+create_research 在写库前调用 admission_controller.check()，以下任一信号触发时返回 429 + Retry-After：
+- rate_limited: 单用户请求频率超过 RATE_LIMIT_CHAT（limits 库；存储为 RATELIMIT_STORAGE_URI，
+  未配置时使用 REDIS_URL，Redis 不可用时降级为进程内计数）
+- queue_depth:  调度器排队数达到 PIPELINE_QUEUE_SIZE * ADMISSION_QUEUE_HIGH_WATERMARK
+- db_pool:      已借出连接数达到 (DB_POOL_SIZE + DB_MAX_OVERFLOW) * ADMISSION_DB_POOL_HIGH_WATERMARK
+- llm_latency:  近期 LLM 调用耗时 EWMA 超过 ADMISSION_LLM_LATENCY_SECONDS（按 ADMISSION_LLM_LATENCY_HALF_LIFE_SECONDS 随时间衰减）
+- loop_lag:     事件循环延迟超过 ADMISSION_LOOP_LAG_SECONDS
+阈值配置为 0 时关闭对应信号。
+"""
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from limits import parse
+from limits.storage import MemoryStorage, storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+from app.core.config import Config
+from app.core.metrics import ADMISSION_REJECTED_TOTAL, EVENT_LOOP_LAG_SECONDS
+from app.utils.logger import get_logger
+
+logger = get_logger('admission')
+
+
+@dataclass
+class AdmissionDecision:
+    """拒绝原因与建议的重试等待秒数"""
+    reason: str
+    retry_after: int
+
+
+class EwmaLatency:
+    """
+    指数加权移动平均耗时（线程安全）
+
+    没有新样本时按 half_life 秒的半衰期向 0 衰减：慢调用导致拒绝新请求后，
+    即使不再有新的调用，信号也会随时间恢复，不会一直拒绝。half_life <= 0 时不衰减。
+    """
+
+    def __init__(self, alpha: float = 0.2, half_life: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.alpha = alpha
+        self.half_life = half_life
+        self._clock = clock
+        self._value: Optional[float] = None
+        self._updated_at = 0.0
+        self._lock = threading.Lock()
+
+    def _decayed(self, now: float) -> Optional[float]:
+        if self._value is None or self.half_life <= 0:
+            return self._value
+        return self._value * 0.5 ** (max(0.0, now - self._updated_at) / self.half_life)
+
+    def observe(self, seconds: float):
+        with self._lock:
+            now = self._clock()
+            current = self._decayed(now)
+            if current is None:
+                self._value = seconds
+            else:
+                self._value = self.alpha * seconds + (1 - self.alpha) * current
+            self._updated_at = now
+
+    @property
+    def value(self) -> float:
+        with self._lock:
+            return self._decayed(self._clock()) or 0.0
+
+
+class EventLoopLagMonitor:
+    """周期性 sleep 并测量实际唤醒延迟，作为事件循环繁忙程度的信号"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag = max(0.0, loop.time() - expected)
+            EVENT_LOOP_LAG_SECONDS.set(self.lag)
+
+
+class UserRateLimiter:
+    """按用户的固定窗口限流，主存储不可用时降级为进程内计数"""
+
+    def __init__(self, limit: str, storage_uri: Optional[str], fallback_seconds: float = 30.0):
+        self.item = parse(limit)
+        self.fallback_seconds = fallback_seconds
+        self._fallback = FixedWindowRateLimiter(MemoryStorage())
+        self._primary = None
+        self._primary_failed_at = 0.0
+        if storage_uri and not storage_uri.startswith("memory://"):
+            try:
+                storage = storage_from_string(storage_uri, socket_timeout=0.2, socket_connect_timeout=0.2)
+                self._primary = FixedWindowRateLimiter(storage)
+            except Exception as e:
+                logger.warning(f"限流存储初始化失败，使用进程内计数: {e}")
+
+    def _limiter(self) -> FixedWindowRateLimiter:
+        if self._primary is None or time.monotonic() - self._primary_failed_at < self.fallback_seconds:
+            return self._fallback
+        return self._primary
+
+    def hit(self, key: str) -> Optional[int]:
+        """
+        计数一次请求
+
+        Returns:
+            Optional[int]: 未超限返回 None，超限返回距窗口重置的秒数
+        """
+        limiter = self._limiter()
+        try:
+            if limiter.hit(self.item, key):
+                return None
+            reset_time, _ = limiter.get_window_stats(self.item, key)
+        except Exception as e:
+            if limiter is self._fallback:
+                raise
+            logger.warning(f"限流存储不可用，{self.fallback_seconds:.0f} 秒内降级为进程内计数: {e}")
+            self._primary_failed_at = time.monotonic()
+            return self.hit(key)
+        return max(1, int(reset_time - time.time()) + 1)
+
+
+class AdmissionController:
+    """汇总各过载信号，决定是否接收新的研究请求"""
+
+    def __init__(
+        self,
+        rate_limiter: Optional[UserRateLimiter],
+        queue_stats: Callable[[], dict],
+        max_queued: int,
+        pool_checked_out: Callable[[], int],
+        pool_capacity: int,
+        llm_latency: EwmaLatency,
+        loop_monitor: EventLoopLagMonitor,
+    ):
+        self.rate_limiter = rate_limiter
+        self.queue_stats = queue_stats
+        self.max_queued = max_queued
+        self.pool_checked_out = pool_checked_out
+        self.pool_capacity = pool_capacity
+        self.llm_latency = llm_latency
+        self.loop_monitor = loop_monitor
+
+    def _overloaded(self) -> Optional[str]:
+        if Config.ADMISSION_QUEUE_HIGH_WATERMARK > 0:
+            if self.queue_stats()["queued"] >= max(1, self.max_queued * Config.ADMISSION_QUEUE_HIGH_WATERMARK):
+                return "queue_depth"
+        if Config.ADMISSION_DB_POOL_HIGH_WATERMARK > 0:
+            if self.pool_checked_out() >= self.pool_capacity * Config.ADMISSION_DB_POOL_HIGH_WATERMARK:
+                return "db_pool"
+        if 0 < Config.ADMISSION_LLM_LATENCY_SECONDS <= self.llm_latency.value:
+            return "llm_latency"
+        if 0 < Config.ADMISSION_LOOP_LAG_SECONDS <= self.loop_monitor.lag:
+            return "loop_lag"
+        return None
+
+    def check(self, user_id) -> Optional[AdmissionDecision]:
+        """返回 None 表示放行，否则返回拒绝原因与 Retry-After"""
+        reason = self._overloaded()
+        if reason:
+            decision = AdmissionDecision(reason, Config.ADMISSION_RETRY_AFTER_SECONDS)
+        else:
+            retry_after = self.rate_limiter.hit(f"chat:{user_id}") if self.rate_limiter else None
+            if retry_after is None:
+                return None
+            decision = AdmissionDecision("rate_limited", retry_after)
+        ADMISSION_REJECTED_TOTAL.labels(decision.reason).inc()
+        logger.warning(f"拒绝研究请求: user_id={user_id}, reason={decision.reason}, retry_after={decision.retry_after}")
+        return decision
+
+
+def _build_controller() -> AdmissionController:
+    from app.core.database import engine
+    from app.services.task_scheduler import task_scheduler
+
+    return AdmissionController(
+        rate_limiter=UserRateLimiter(Config.RATE_LIMIT_CHAT, Config.RATELIMIT_STORAGE_URI or Config.REDIS_URL),
+        queue_stats=task_scheduler.stats,
+        max_queued=Config.PIPELINE_QUEUE_SIZE,
+        pool_checked_out=engine.pool.checkedout,
+        pool_capacity=Config.DB_POOL_SIZE + Config.DB_MAX_OVERFLOW,
+        llm_latency=llm_latency,
+        loop_monitor=loop_lag_monitor,
+    )
+
+
+# LLM 调用耗时（llm_service 每次调用结束后更新，超时与端点故障按请求超时计）与事件循环延迟（lifespan 中启动）
+llm_latency = EwmaLatency(half_life=Config.ADMISSION_LLM_LATENCY_HALF_LIFE_SECONDS)
+loop_lag_monitor = EventLoopLagMonitor()
+admission_controller = _build_controller()
@@ -131,7 +131,7 @@ async def get_current_user(
         db: 数据库会话
 
     Returns:
-        dict: 用户信息 {user_id, email}
+        dict: 用户信息 {user_id, email, identity_tag}
 
     Raises:
         HTTPException: 401 未授权
@@ -191,7 +191,8 @@ async def get_current_user(
 
     return {
         "user_id": user_id,
-        "email": email
+        "email": email,
+        "identity_tag": user.identity_tag
     }
 
 
@@ -0,0 +1,84 @@
+"""
+幂等键
+Idempotency-Key support for POST /create
+
+网络抖动后客户端重试会让 create_research 执行两次：若首次请求创建了新会话，重试会再建一个会话并跑一遍完整的流水线。
+客户端在请求头携带 Idempotency-Key 时：
+- begin() 以 SET NX 原子占位（state=in_progress，TTL 为 IDEMPOTENCY_LOCK_SECONDS），并发的重复请求只有一个能占位成功
+- 成功创建后 complete() 保存原始响应数据（TTL 为 IDEMPOTENCY_TTL_SECONDS），之后的重复请求直接返回原 message_id / session_id
+- 创建失败（被准入拒绝、冲突、异常）时 abort() 释放占位，客户端可用同一个键重试
+- 同一个键携带不同的请求参数视为误用，返回 422
+键按用户隔离，存储见 app.core.kv_store。
+"""
+import hashlib
+import json
+from typing import Optional, Tuple
+
+from app.core.config import Config
+from app.core.kv_store import KeyValueStore, kv_store
+from app.utils.logger import get_logger
+
+logger = get_logger('idempotency')
+
+MAX_KEY_LENGTH = 255
+
+NEW = "new"
+REPLAY = "replay"
+IN_PROGRESS = "in_progress"
+MISMATCH = "mismatch"
+
+
+def request_fingerprint(*parts) -> str:
+    """请求参数摘要，用于识别同一个键被用于不同请求"""
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """幂等键的占位、完成与释放"""
+
+    def __init__(self, kv: KeyValueStore, ttl_seconds: float, lock_seconds: float):
+        self.kv = kv
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+
+    @staticmethod
+    def _key(scope: str, user_id, key: str) -> str:
+        return f"idem:{scope}:{user_id}:{key}"
+
+    def begin(self, scope: str, user_id, key: str, fingerprint: str) -> Tuple[str, Optional[dict]]:
+        """
+        占位或查询已有记录
+
+        Returns:
+            (NEW, None): 占位成功，调用方执行请求后须调用 complete / abort
+            (REPLAY, data): 已完成的重复请求，data 为原始响应数据
+            (IN_PROGRESS, None): 相同请求正在处理中
+            (MISMATCH, None): 同一个键对应不同的请求参数
+        """
+        full_key = self._key(scope, user_id, key)
+        if self.kv.set_if_absent(full_key, {"state": IN_PROGRESS, "fingerprint": fingerprint}, self.lock_seconds):
+            return NEW, None
+        record = self.kv.get(full_key)
+        if record is None:
+            # 占位恰好过期：再尝试一次
+            if self.kv.set_if_absent(full_key, {"state": IN_PROGRESS, "fingerprint": fingerprint}, self.lock_seconds):
+                return NEW, None
+            record = self.kv.get(full_key) or {}
+        if record.get("fingerprint") != fingerprint:
+            return MISMATCH, None
+        if record.get("state") == "done":
+            return REPLAY, record.get("data")
+        return IN_PROGRESS, None
+
+    def complete(self, scope: str, user_id, key: str, fingerprint: str, data: dict):
+        self.kv.set(
+            self._key(scope, user_id, key),
+            {"state": "done", "fingerprint": fingerprint, "data": data},
+            self.ttl_seconds,
+        )
+
+    def abort(self, scope: str, user_id, key: str):
+        self.kv.delete(self._key(scope, user_id, key))
+
+
+idempotency_store = IdempotencyStore(kv_store, Config.IDEMPOTENCY_TTL_SECONDS, Config.IDEMPOTENCY_LOCK_SECONDS)
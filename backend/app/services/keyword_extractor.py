@@ -0,0 +1,160 @@
+"""
+本地关键词提取
+Local fast-path keyword extraction for pipeline step 1
+
+步骤 1 仅为得到一到两个小写英文名词关键词就要发起一次完整的 LLM 调用（retrieve_query 模板）。
+这里用 RAKE 在本地提取：按停用词与标点切分候选短语，词分数为 度/频次，短语分数为词分数之和，
+再用简单的英文名词短语规则过滤（常见动词 / 形容词作为分隔词，去掉首尾副词 / 动词形式，限制短语长度）。
+
+置信度 = 英文字符占比 × 前两个短语的分数占比 × 短语质量。候选短语只有一两个时分数占比恒为 1，
+因此短语质量取前两个短语中最差的一个：单词短语（如 "transformers"）信息量不足，2-3 词短语质量最高。
+KEYWORD_LOCAL_MIN_CONFIDENCE 应参考 shadow 模式记录的 keyword_agreement 分布调整。
+
+Semantic Scholar 检索需要英文关键词，本地无法翻译：中文题目只提取其中的英文术语，
+置信度按英文字符占比折算，纯中文题目始终回退到 LLM（因此不引入中文分词依赖）。
+
+KEYWORD_EXTRACTOR_MODE：
+- llm:    保持原行为，只调用 LLM
+- local:  本地置信度 >= KEYWORD_LOCAL_MIN_CONFIDENCE 时直接使用本地结果，否则回退到 LLM
+- shadow: 仍使用 LLM 结果，同时计算本地结果并记录一致性指标，用于评估后再切换到 local
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+from app.core.config import Config
+from app.core.metrics import KEYWORD_AGREEMENT, KEYWORD_EXTRACTION_TOTAL
+from app.utils.logger import get_logger
+
+logger = get_logger('keyword_extractor')
+
+MODE_LLM = "llm"
+MODE_LOCAL = "local"
+MODE_SHADOW = "shadow"
+
+MAX_PHRASE_WORDS = 4
+
+# 通用停用词 + 研究请求中常见但不代表主题的词
+_STOPWORDS = set("""
+a about above after again against all also am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers how i
+if in into is it its itself just me more most my no nor not of off on once only or other our ours out over own same
+she should so some such than that the their them then there these they this those through to too under until up very
+was we were what when where which while who whom why will with would you your yours
+based using use via towards toward within without new novel want wants interested interest research researching
+study studies studying propose proposal develop developing explore exploring investigate investigating topic topics
+idea ideas paper papers like please help me improve improving
+approach approaches method methods problem problems question questions
+""".split())
+
+# 请求中常见的动词 / 形容词，不能构成主题短语（"make it better"、"how transformers work"）
+_NON_NOUNS = set("""
+make makes making made do done get gets getting got give gives find finds try tell show see need needs
+work works worked better best good great nice bad big small way ways thing things stuff something anything lot lots
+""".split())
+
+# 短语质量（按词数）：单词短语过于宽泛，2-3 词的名词短语最可靠
+_LENGTH_QUALITY = {1: 0.5, 2: 1.0, 3: 1.0, 4: 0.8}
+
+_TOKEN_RE = re.compile(r"[a-z][a-z0-9\-]*|[0-9]+[a-z][a-z0-9\-]*")
+_SPLIT_RE = re.compile(r"[^a-z0-9\-\s]+")
+_LATIN_RE = re.compile(r"[A-Za-z]")
+_CJK_RE = re.compile(r"[一-鿿]")
+
+
+@dataclass
+class KeywordResult:
+    """本地提取结果与置信度（0-1）"""
+    keywords: List[str] = field(default_factory=list)
+    confidence: float = 0.0
+
+
+def _is_participle(word: str) -> bool:
+    return len(word) > 4 and word.endswith("ed") and not word.endswith("eed")
+
+
+def _candidate_phrases(text: str) -> List[List[str]]:
+    """按标点 / 非拉丁字符与停用词切分候选短语"""
+    phrases = []
+    for chunk in _SPLIT_RE.split(text.lower()):
+        current: List[str] = []
+        for token in chunk.split():
+            if token in _STOPWORDS or token in _NON_NOUNS or not _TOKEN_RE.fullmatch(token):
+                if current:
+                    phrases.append(current)
+                current = []
+            else:
+                current.append(token)
+        if current:
+            phrases.append(current)
+    # 名词短语规则：去掉首尾的副词，结尾不能是 -ed 形容词 / 过去分词
+    cleaned = []
+    for words in phrases:
+        while words and words[0].endswith("ly"):
+            words = words[1:]
+        while words and (words[-1].endswith("ly") or _is_participle(words[-1])):
+            words = words[:-1]
+        if words and len(words) <= MAX_PHRASE_WORDS:
+            cleaned.append(words)
+    return cleaned
+
+
+def rake_keywords(text: str, max_keywords: int = 2) -> KeywordResult:
+    """RAKE 提取关键词，置信度 = 英文字符占比 × 前 max_keywords 个短语的分数占比 × 其中最差短语的质量"""
+    phrases = _candidate_phrases(text)
+    if not phrases:
+        return KeywordResult()
+
+    frequency: Dict[str, int] = {}
+    degree: Dict[str, int] = {}
+    for words in phrases:
+        for word in words:
+            frequency[word] = frequency.get(word, 0) + 1
+            degree[word] = degree.get(word, 0) + len(words)
+
+    scores: Dict[str, float] = {}
+    for words in phrases:
+        phrase = " ".join(words)
+        scores[phrase] = sum(degree[word] / frequency[word] for word in words)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    top = ranked[:max_keywords]
+
+    latin = len(_LATIN_RE.findall(text))
+    cjk = len(_CJK_RE.findall(text))
+    coverage = latin / (latin + cjk * 3) if latin else 0.0  # 一个汉字约等于一个英文词的信息量
+    separation = sum(score for _, score in top) / sum(scores.values())
+    quality = min(_LENGTH_QUALITY[len(phrase.split())] for phrase, _ in top)
+    return KeywordResult([phrase for phrase, _ in top], round(coverage * separation * quality, 3))
+
+
+def keyword_agreement(local: List[str], llm_response: str) -> float:
+    """本地结果与 LLM 结果的词级 Jaccard 相似度"""
+    local_words = {word for phrase in local for word in phrase.split()}
+    llm_words = {word for phrase in llm_response.lower().split(",") for word in phrase.split()}
+    if not local_words and not llm_words:
+        return 1.0
+    return len(local_words & llm_words) / len(local_words | llm_words)
+
+
+def extract_keywords(content: str, call_llm: Callable[[], str]) -> Tuple[str, str]:
+    """
+    按 KEYWORD_EXTRACTOR_MODE 提取关键词
+
+    Returns:
+        (与 LLM 输出格式一致的逗号分隔关键词, 来源 local / llm)
+    """
+    mode = Config.KEYWORD_EXTRACTOR_MODE
+    local = rake_keywords(content) if mode in (MODE_LOCAL, MODE_SHADOW) else None
+
+    if mode == MODE_LOCAL and local.keywords and local.confidence >= Config.KEYWORD_LOCAL_MIN_CONFIDENCE:
+        KEYWORD_EXTRACTION_TOTAL.labels("local").inc()
+        return ", ".join(local.keywords), "local"
+
+    response = call_llm()
+    KEYWORD_EXTRACTION_TOTAL.labels("llm").inc()
+    if local is not None and local.keywords:
+        agreement = keyword_agreement(local.keywords, response)
+        KEYWORD_AGREEMENT.observe(agreement)
+        logger.info(f"关键词对比: local={local.keywords} (confidence={local.confidence}), "
+                    f"llm={response!r}, agreement={agreement:.2f}")
+    return response, "llm"
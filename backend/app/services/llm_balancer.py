@@ -0,0 +1,187 @@
+"""
+LLM 多端点负载均衡
+Health-aware load balancing and failover across LLM endpoints
+
+CUSTOM_API_ENDPOINT（以及 LLM_ROUTE_<TEMPLATE>_ENDPOINT）可配置为逗号分隔的多个端点，端点后加 |权重：
+    CUSTOM_API_ENDPOINT=http://a:3888/v1|2,http://b:3888/v1
+同一配置串在进程内共享一个 EndpointPool，统计跨任务累积：
+- 选择：按 EWMA 耗时 × (1 + 进行中请求数) / 权重 取最小值；尚无耗时数据的端点得分为 0，会被优先试探。
+  EWMA 没有新样本时按 LLM_ENDPOINT_LATENCY_HALF_LIFE_SECONDS 半衰期衰减，一时变慢而不再被选中的端点
+  得分随时间下降，最终会再收到一次请求重新测量，恢复后重新分到流量
+- 熔断：连续失败 LLM_BREAKER_FAILURE_THRESHOLD 次后熔断，LLM_BREAKER_COOLDOWN_SECONDS 后放行一次试探请求（半开），
+  试探成功恢复，失败重新计时；全部端点熔断时选择最早可恢复的端点，不直接拒绝
+- 故障转移：调用失败后下一次尝试优先换到其他端点且不等待退避，没有可换的端点时才按原逻辑退避
+只有超时、连接错误、5xx 与 429 计为端点故障；其他 4xx 与请求内容有关，不影响端点健康状态。
+"""
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+from app.core.config import Config
+from app.core.metrics import LLM_CIRCUIT_OPENED_TOTAL
+from app.services.admission import EwmaLatency
+from app.utils.logger import get_logger
+
+logger = get_logger('llm_balancer')
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def parse_endpoints(spec: str) -> List[Tuple[str, float]]:
+    """解析 "url|weight,url" 形式的端点配置，权重缺省为 1"""
+    endpoints = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        url, _, weight = item.partition("|")
+        weight = float(weight) if weight.strip() else 1.0
+        if weight <= 0:
+            raise ValueError(f"LLM 端点权重必须大于 0: {item}")
+        endpoints.append((url.strip().rstrip("/"), weight))
+    if not endpoints:
+        raise ValueError("未配置 LLM 端点")
+    return endpoints
+
+
+def is_endpoint_failure(error: Exception) -> bool:
+    """超时 / 连接错误 / 5xx / 429 归为端点故障"""
+    response = getattr(error, "response", None)
+    if isinstance(error, requests.exceptions.HTTPError) and response is not None:
+        return response.status_code >= 500 or response.status_code == 429
+    return isinstance(error, requests.exceptions.RequestException)
+
+
+class Endpoint:
+    """单个端点的耗时、熔断状态与计数（由 EndpointPool 加锁访问）"""
+
+    def __init__(self, url: str, weight: float, alpha: float, half_life: float = 60.0, clock=time.monotonic):
+        self.url = url
+        self.weight = weight
+        self.latency = EwmaLatency(alpha, half_life=half_life, clock=clock)
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+
+    def score(self) -> float:
+        return self.latency.value * (1 + self.in_flight) / self.weight
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "state": self.state,
+            "ewma_latency": round(self.latency.value, 3),
+            "in_flight": self.in_flight,
+            "consecutive_failures": self.consecutive_failures,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class EndpointPool:
+    """一组端点的选择与健康统计（线程安全）"""
+
+    def __init__(self, endpoints: Iterable[Tuple[str, float]], failure_threshold: int = 3,
+                 cooldown_seconds: float = 30.0, alpha: float = 0.3, half_life: float = 60.0,
+                 clock=time.monotonic):
+        self.endpoints = [Endpoint(url, weight, alpha, half_life, clock) for url, weight in endpoints]
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def _available(self, endpoint: Endpoint, now: float) -> bool:
+        if endpoint.state == CLOSED:
+            return True
+        # 熔断冷却结束后只放行一次试探请求
+        return endpoint.state == OPEN and now - endpoint.opened_at >= self.cooldown_seconds
+
+    def has_alternative(self, exclude: Iterable[str]) -> bool:
+        """除 exclude 外是否还有可用端点"""
+        exclude = set(exclude)
+        now = self._clock()
+        with self._lock:
+            return any(self._available(e, now) for e in self.endpoints if e.url not in exclude)
+
+    def acquire(self, exclude: Iterable[str] = ()) -> Endpoint:
+        """选择端点并计入进行中请求，调用结束后必须 release"""
+        exclude = set(exclude)
+        now = self._clock()
+        with self._lock:
+            candidates = [e for e in self.endpoints if self._available(e, now)]
+            preferred = [e for e in candidates if e.url not in exclude]
+            if preferred or candidates:
+                endpoint = min(preferred or candidates, key=lambda e: (e.score(), e.in_flight / e.weight))
+            else:
+                endpoint = min(self.endpoints, key=lambda e: e.opened_at)
+            if endpoint.state == OPEN:
+                endpoint.state = HALF_OPEN
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(self, endpoint: Endpoint, seconds: float, healthy: Optional[bool]):
+        """
+        记录一次调用结果
+
+        Args:
+            healthy: True 成功 / False 端点故障 / None 与端点无关的失败（不影响健康状态）
+        """
+        with self._lock:
+            endpoint.in_flight -= 1
+            if healthy is None:
+                if endpoint.state == HALF_OPEN:
+                    endpoint.state = OPEN
+                return
+            # 超时也计入耗时，慢端点的得分随之升高
+            endpoint.latency.observe(seconds)
+            if healthy:
+                endpoint.consecutive_failures = 0
+                endpoint.state = CLOSED
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.state == HALF_OPEN or endpoint.consecutive_failures >= self.failure_threshold:
+                if endpoint.state != OPEN:
+                    LLM_CIRCUIT_OPENED_TOTAL.labels(endpoint.url).inc()
+                    logger.warning(f"LLM 端点熔断: {endpoint.url}, 连续失败 {endpoint.consecutive_failures} 次")
+                endpoint.state = OPEN
+                endpoint.opened_at = self._clock()
+
+    def stats(self) -> List[dict]:
+        with self._lock:
+            return [endpoint.stats() for endpoint in self.endpoints]
+
+
+_pools: Dict[str, EndpointPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_endpoint_pool(spec: str) -> EndpointPool:
+    """按端点配置串获取进程级共享的 EndpointPool"""
+    with _pools_lock:
+        pool = _pools.get(spec)
+        if pool is None:
+            pool = EndpointPool(
+                parse_endpoints(spec),
+                failure_threshold=Config.LLM_BREAKER_FAILURE_THRESHOLD,
+                cooldown_seconds=Config.LLM_BREAKER_COOLDOWN_SECONDS,
+                alpha=Config.LLM_ENDPOINT_EWMA_ALPHA,
+                half_life=Config.LLM_ENDPOINT_LATENCY_HALF_LIFE_SECONDS,
+            )
+            _pools[spec] = pool
+        return pool
+
+
+def reset_endpoint_pools():
+    """清空进程级端点统计（单元测试使用）"""
+    with _pools_lock:
+        _pools.clear()
@@ -0,0 +1,125 @@
+"""
+LLM / Semantic Scholar 录制回放
+Record / replay fixtures for external calls
+
+- record: 真实调用成功后，将请求、响应与耗时写入夹具文件
+- replay: 不发起网络请求，按请求哈希读取夹具返回；可按录制耗时 sleep 或零延迟返回
+- off:    默认，不做任何处理
+
+夹具文件：{LLM_FIXTURE_DIR}/{kind}/{sha256(请求)}.json，kind 为 llm / s2
+请求哈希只包含影响响应内容的字段（LLM: messages + temperature；S2: 接口路径 + 查询参数），
+不包含 endpoint / api key / 模型名，录制的夹具可在不同环境间复用
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional
+
+from app.core.config import Config
+
+MODE_OFF = "off"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+LATENCY_RECORDED = "recorded"
+LATENCY_ZERO = "zero"
+
+DEFAULT_FIXTURE_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..", "tests", "fixtures", "replay")
+)
+
+
+class FixtureNotFoundError(LookupError):
+    """回放模式下找不到对应请求的夹具"""
+
+
+def fixture_key(payload: dict) -> str:
+    """请求哈希（键排序后的 JSON 的 sha256）"""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class FixtureStore:
+    """夹具存储"""
+
+    def __init__(self, mode: str = MODE_OFF, directory: Optional[str] = None, latency: str = LATENCY_RECORDED):
+        if mode not in (MODE_OFF, MODE_RECORD, MODE_REPLAY):
+            raise ValueError(f"Unknown fixture mode: {mode}")
+        if latency not in (LATENCY_RECORDED, LATENCY_ZERO):
+            raise ValueError(f"Unknown fixture latency: {latency}")
+        self.mode = mode
+        self.directory = directory or DEFAULT_FIXTURE_DIR
+        self.latency = latency
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == MODE_RECORD
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == MODE_REPLAY
+
+    def path_for(self, kind: str, payload: dict) -> str:
+        return os.path.join(self.directory, kind, f"{fixture_key(payload)}.json")
+
+    def record(self, kind: str, payload: dict, response, elapsed: float):
+        """写入夹具（先写临时文件再原子替换，避免并发录制时读到半个文件）"""
+        path = self.path_for(kind, payload)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            "kind": kind,
+            "request": payload,
+            "response": response,
+            "elapsed": round(elapsed, 6),
+            "recorded_at": datetime.now().isoformat(),
+        }
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def replay(self, kind: str, payload: dict):
+        """
+        读取夹具并返回录制的响应
+
+        Raises:
+            FixtureNotFoundError: 夹具不存在
+        """
+        path = self.path_for(kind, payload)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            raise FixtureNotFoundError(f"No {kind} fixture for request {os.path.basename(path)}")
+        if self.latency == LATENCY_RECORDED and entry.get("elapsed"):
+            time.sleep(entry["elapsed"])
+        return entry["response"]
+
+
+_store: Optional[FixtureStore] = None
+
+
+def get_fixture_store() -> FixtureStore:
+    """按 Config 构建进程级夹具存储（首次调用时创建）"""
+    global _store
+    if _store is None:
+        _store = FixtureStore(
+            mode=Config.LLM_FIXTURE_MODE,
+            directory=Config.LLM_FIXTURE_DIR or None,
+            latency=Config.LLM_FIXTURE_LATENCY,
+        )
+    return _store
+
+
+def set_fixture_store(store: Optional[FixtureStore]):
+    """替换进程级夹具存储（基准测试 / 单元测试使用，传 None 则下次按 Config 重建）"""
+    global _store
+    _store = store
@@ -0,0 +1,98 @@
+"""
+LLM 对冲请求
+Hedged LLM requests for tail-latency reduction
+
+LLM 耗时长尾明显，流水线串行执行，一次慢调用会拖慢整个任务。开启 LLM_HEDGE_ENABLED 后：
+- 按提示模板分别统计最近 WINDOW 次成功调用的耗时（不同步骤耗时差异很大，不能共用一个分位数）
+- 请求在 LLM_HEDGE_PERCENTILE 分位耗时内未返回时，向另一个端点（llm_balancer 选择，只有一个端点时发往同一端点）
+  发送相同请求，取先成功的结果；落后的请求无法中止，完成后仍计入端点统计
+- 对冲预算为令牌桶：每次调用增加 LLM_HEDGE_MAX_RATE 个令牌（上限 BURST），每次对冲消耗 1 个，
+  对冲次数长期不超过调用次数的 LLM_HEDGE_MAX_RATE；样本少于 LLM_HEDGE_MIN_SAMPLES 时不对冲
+"""
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Optional
+
+from app.core.config import Config
+
+WINDOW = 200
+BURST = 10.0
+
+
+class HedgePolicy:
+    """分模板耗时窗口 + 对冲令牌桶（线程安全）"""
+
+    def __init__(self, percentile: float = 95, min_samples: int = 20, max_rate: float = 0.05,
+                 window: int = WINDOW, burst: float = BURST):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.max_rate = max_rate
+        self.window = window
+        self.burst = burst
+        self._samples: Dict[str, deque] = {}
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def delay(self, key: str) -> Optional[float]:
+        """发出对冲请求前的等待秒数，样本不足时返回 None"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < max(self.min_samples, 1):
+            return None
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return samples[index]
+
+    def on_request(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.max_rate)
+
+    def try_hedge(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tokens": round(self._tokens, 3),
+                "samples": {key: len(samples) for key, samples in self._samples.items()},
+            }
+
+
+def first_success(futures: Iterable[Future]):
+    """返回最先成功的结果；全部失败时抛出最后一个异常"""
+    pending = set(futures)
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future
+            error = future.exception()
+    raise error
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_hedge_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=Config.LLM_HEDGE_WORKERS, thread_name_prefix="llm-hedge")
+        return _executor
+
+
+hedge_policy = HedgePolicy(
+    percentile=Config.LLM_HEDGE_PERCENTILE,
+    min_samples=Config.LLM_HEDGE_MIN_SAMPLES,
+    max_rate=Config.LLM_HEDGE_MAX_RATE,
+)
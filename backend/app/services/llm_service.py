@@ -4,8 +4,24 @@ LLM服务模块 - 集成keyu-ideation的研究计划生成功能
 import requests
 import time
 import os
+from concurrent.futures import wait
 from typing import Optional, Dict, Any
 from app.core.config import Config
+from app.core.metrics import (
+    LLM_ENDPOINT_FAILOVERS_TOTAL,
+    LLM_HEDGES_TOTAL,
+    LLM_REQUEST_SECONDS,
+    LLM_RETRIES_TOTAL,
+    LLM_TOKENS_TOTAL,
+    S2_ERRORS_TOTAL,
+    S2_REQUEST_SECONDS,
+)
+from app.services.admission import llm_latency
+from app.services.llm_balancer import get_endpoint_pool, is_endpoint_failure
+from app.services.llm_fixtures import get_fixture_store
+from app.services.llm_hedging import first_success, get_hedge_executor, hedge_policy
+from app.services.prompt_budget import abstract_limit, compact_abstract, dedupe_papers, estimate_tokens
+from app.services.task_context import backoff_sleep, call_timeout
 
 # 从keyu-ideation复制的提示模板
 PROMPT_TEMPLATES = {
@@ -81,100 +97,90 @@ Please revise the research proposal thoroughly in light of the feedback, ensurin
 }
 
 
-def get_newest_paper(query, max_results=None, max_retries=None):
-    """获取最新论文"""
+def _search_url(path: str = "") -> str:
+    """Semantic Scholar 检索接口地址（基于 SEMANTIC_SCHOLAR_BASE_URL）"""
+    return f"{Config.SEMANTIC_SCHOLAR_BASE_URL}/paper/search{path}"
+
+
+def _search_papers(search: str, label: str, url: str, params: dict, max_results=None, max_retries=None):
+    """
+    Semantic Scholar 检索（带重试与指标）
+
+    Args:
+        search: 指标标签（newest / highly_cited / relevance）
+        label: 日志中的中文名称
+        url: 检索接口地址
+        params: 查询参数
+    """
     max_results = max_results or getattr(Config, 'MAX_PAPERS_PER_QUERY', 3)
     max_retries = max_retries or getattr(Config, 'SEMANTIC_SCHOLAR_MAX_RETRIES', 20)
     timeout = getattr(Config, 'SEMANTIC_SCHOLAR_TIMEOUT', 10)
-    
-    url = f"http://api.semanticscholar.org/graph/v1/paper/search/bulk"
-    params = {"query": query, "fields": "title,abstract", "sort": "publicationDate:desc"}
-    
+
+    # 录制回放：键为接口路径 + 查询参数，夹具保存完整 data 列表
+    fixtures = get_fixture_store()
+    fixture_request = {"path": url[len(Config.SEMANTIC_SCHOLAR_BASE_URL):], "params": params}
+    if fixtures.replaying:
+        return fixtures.replay("s2", fixture_request)[:max_results]
+
     for attempt in range(max_retries):
+        # 流水线中按任务剩余预算收紧超时，已取消/超时时直接抛出
+        request_timeout = call_timeout(timeout)
+        start = time.perf_counter()
         try:
-            response = requests.get(url, params=params, timeout=timeout)
+            response = requests.get(url, params=params, timeout=request_timeout)
             data = response.json()
-            
+
             if 'data' in data:
+                elapsed = time.perf_counter() - start
+                S2_REQUEST_SECONDS.labels(search, "success").observe(elapsed)
+                if fixtures.recording:
+                    fixtures.record("s2", fixture_request, data['data'], elapsed)
                 return data['data'][:max_results]
             else:
+                # 限流或异常响应中没有 data 字段
+                S2_REQUEST_SECONDS.labels(search, "no_data").observe(time.perf_counter() - start)
+                S2_ERRORS_TOTAL.labels(search, "no_data").inc()
                 if attempt < max_retries - 1:
-                    time.sleep(1)
+                    backoff_sleep(1)
                 continue
         except Exception as e:
+            S2_REQUEST_SECONDS.labels(search, "error").observe(time.perf_counter() - start)
+            S2_ERRORS_TOTAL.labels(search, type(e).__name__).inc()
             if attempt < max_retries - 1:
-                print(f"获取最新论文失败: {e}，{1}秒后重试... (尝试 {attempt + 1}/{max_retries})")
-                time.sleep(1)
+                print(f"获取{label}失败: {e}，{1}秒后重试... (尝试 {attempt + 1}/{max_retries})")
+                backoff_sleep(1)
                 continue
             else:
-                print(f"获取最新论文最终失败: {e}")
+                print(f"获取{label}最终失败: {e}")
                 return []
-    
+
     return []
 
 
+def build_search_query(keywords: str) -> str:
+    """将步骤 1 输出的逗号分隔关键词构造为 Semantic Scholar 检索式（多个关键词为 OR）"""
+    query_list = [kw.strip() for kw in keywords.split(",")]
+    if len(query_list) == 1:
+        return query_list[0]
+    return " | ".join(f'"{item}"' for item in query_list)
+
+
+def get_newest_paper(query, max_results=None, max_retries=None):
+    """获取最新论文"""
+    params = {"query": query, "fields": "title,abstract", "sort": "publicationDate:desc"}
+    return _search_papers("newest", "最新论文", _search_url("/bulk"), params, max_results, max_retries)
+
+
 def get_highly_cited_paper(query, max_results=None, max_retries=None):
     """获取高引用论文"""
-    max_results = max_results or getattr(Config, 'MAX_PAPERS_PER_QUERY', 3)
-    max_retries = max_retries or getattr(Config, 'SEMANTIC_SCHOLAR_MAX_RETRIES', 20)
-    timeout = getattr(Config, 'SEMANTIC_SCHOLAR_TIMEOUT', 10)
-    
-    url = f"http://api.semanticscholar.org/graph/v1/paper/search/bulk"
     params = {"query": query, "fields": "title,abstract", "sort": "citationCount:desc"}
-    
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, params=params, timeout=timeout)        
-            data = response.json()
-            
-            if 'data' in data:
-                return data['data'][:max_results]
-            else:
-                if attempt < max_retries - 1:
-                    time.sleep(1)
-                continue
-        except Exception as e:
-            if attempt < max_retries - 1:
-                print(f"获取高引用论文失败: {e}，{1}秒后重试... (尝试 {attempt + 1}/{max_retries})")
-                time.sleep(1)
-                continue
-            else:
-                print(f"获取高引用论文最终失败: {e}")
-                return []
-    
-    return []
+    return _search_papers("highly_cited", "高引用论文", _search_url("/bulk"), params, max_results, max_retries)
 
 
 def get_relevence_paper(query, max_results=None, max_retries=None):
     """获取相关论文"""
-    max_results = max_results or getattr(Config, 'MAX_PAPERS_PER_QUERY', 3)
-    max_retries = max_retries or getattr(Config, 'SEMANTIC_SCHOLAR_MAX_RETRIES', 20)
-    timeout = getattr(Config, 'SEMANTIC_SCHOLAR_TIMEOUT', 10)
-    
-    url = f"http://api.semanticscholar.org/graph/v1/paper/search"
     params = {"query": query, "fields": "title,abstract"}
-    
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(url, params=params, timeout=timeout)    
-            data = response.json()
-            
-            if 'data' in data:
-                return data['data'][:max_results]
-            else:
-                if attempt < max_retries - 1:
-                    time.sleep(1)
-                continue
-        except Exception as e:
-            if attempt < max_retries - 1:
-                print(f"获取相关论文失败: {e}，{1}秒后重试... (尝试 {attempt + 1}/{max_retries})")
-                time.sleep(1)
-                continue
-            else:
-                print(f"获取相关论文最终失败: {e}")
-                return []
-    
-    return []
+    return _search_papers("relevance", "相关论文", _search_url(), params, max_results, max_retries)
 
 
 def get_prompt(template_name, locale="cn", **kwargs):
@@ -193,18 +199,47 @@ def get_prompt(template_name, locale="cn", **kwargs):
     return prompt
 
 
-def construct_paper(newest_paper, highly_cited_paper, relevence_paper):
-    """构造论文信息"""
+def construct_paper(newest_paper, highly_cited_paper, relevence_paper, token_budget=None, abstract_max_tokens=None):
+    """
+    构造论文信息
+
+    三个列表中重复的论文只保留第一次出现，缺少摘要的论文只保留标题；摘要总量按
+    PAPER_PROMPT_TOKEN_BUDGET 分配，单篇不超过 PAPER_ABSTRACT_MAX_TOKENS（见 prompt_budget，0 表示不限制）；
+    标题已占满预算时省略全部摘要
+    """
+    if token_budget is None:
+        token_budget = getattr(Config, 'PAPER_PROMPT_TOKEN_BUDGET', 0)
+    if abstract_max_tokens is None:
+        abstract_max_tokens = getattr(Config, 'PAPER_ABSTRACT_MAX_TOKENS', 0)
+
+    headers = ("The latest paper:\n", "The highly cited paper:\n", "The relevent paper:\n")
+    sections = dedupe_papers([newest_paper, highly_cited_paper, relevence_paper])
+    papers = [p for section in sections for p in section]
+    abstracts = [(p.get('abstract') or "").strip() for p in papers]
+
+    limit = abstract_max_tokens if abstract_max_tokens > 0 else None
+    if token_budget > 0:
+        # 标题与固定格式的 token 不压缩，从总预算中扣除
+        fixed = sum(estimate_tokens(h) for h in headers)
+        fixed += sum(estimate_tokens(f"Title: {p.get('title')}\nAbstract: \n\n") for p in papers)
+        lengths = [estimate_tokens(a) for a in abstracts if a]
+        if abstract_max_tokens > 0:
+            lengths = [min(length, abstract_max_tokens) for length in lengths]
+        limit = abstract_limit(lengths, token_budget - fixed) if lengths else 0
+
     paper = ""
-    paper += "The latest paper:\n"
-    for p in newest_paper:
-        paper += f"Title: {p['title']}\nAbstract: {p['abstract']}\n\n"
-    paper += "The highly cited paper:\n"
-    for p in highly_cited_paper:
-        paper += f"Title: {p['title']}\nAbstract: {p['abstract']}\n\n"
-    paper += "The relevent paper:\n"
-    for p in relevence_paper:
-        paper += f"Title: {p['title']}\nAbstract: {p['abstract']}\n\n"
+    index = 0
+    for header, section in zip(headers, sections):
+        paper += header
+        for p in section:
+            abstract = abstracts[index]
+            index += 1
+            if abstract:
+                abstract = compact_abstract(abstract, limit)
+            if abstract:
+                paper += f"Title: {p.get('title')}\nAbstract: {abstract}\n\n"
+            else:
+                paper += f"Title: {p.get('title')}\n\n"
     return paper
 
 
@@ -232,10 +267,30 @@ class LLMClient:
             raise ValueError(f"不支持的提供商: {provider}")
         
         # 设置参数
-        self.temperature = kwargs.get('temperature', 0.6)
+        self.temperature = kwargs.get('temperature', getattr(self.config, 'CUSTOM_TEMPERATURE', 0.6))
+        self.max_tokens = kwargs.get('max_tokens', getattr(self.config, 'CUSTOM_MAX_TOKENS', 0))
         self.max_retries = kwargs.get('max_retries', 3)
+        self.template: Optional[str] = None
         self.timeout = kwargs.get('timeout', getattr(self.config, 'LLM_REQUEST_TIMEOUT', 180))
 
+    def route(self, template: Optional[str]) -> dict:
+        """
+        提示模板对应的调用参数：Config.LLM_ROUTES 中显式配置的字段覆盖客户端默认值
+
+        Returns:
+            dict: model / endpoint / api_key / temperature / max_tokens
+        """
+        settings = {
+            "model": self.llm,
+            "endpoint": self.endpoint,
+            "api_key": self.api_key,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+        }
+        if template:
+            settings.update(getattr(self.config, 'LLM_ROUTES', {}).get(template, {}))
+        return settings
+
     def _make_custom_api_call(self, prompt: str) -> str:
         """使用自定义API端点调用"""
         headers = {
@@ -249,48 +304,170 @@ class LLMClient:
             "temperature": self.temperature,
             "stream": False
         }
-        
+        if self.max_tokens:
+            data["max_tokens"] = self.max_tokens
+
+        # 录制回放：键为 messages + temperature（不含 endpoint / 模型名）
+        fixtures = get_fixture_store()
+        fixture_request = {"messages": data["messages"], "temperature": self.temperature}
+        if fixtures.replaying:
+            recorded = fixtures.replay("llm", fixture_request)
+            self._record_usage(recorded)
+            return recorded["content"]
+
+        # 多端点时按健康状态选择端点，失败后优先换端点重试（见 llm_balancer）
+        pool = get_endpoint_pool(self.endpoint)
+        failed = set()
         for attempt in range(self.max_retries):
+            # 流水线中按任务剩余预算收紧超时，已取消/超时时直接抛出
+            request_timeout = call_timeout(self.timeout)
+            tried = []
             try:
-                response = requests.post(
-                    f"{self.endpoint}/chat/completions",
-                    headers=headers,
-                    json=data,
-                    timeout=self.timeout
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                return result["choices"][0]["message"]["content"]
+                content, result, elapsed = self._send(pool, failed, tried, headers, data, request_timeout)
+                self._record_usage(result)
+                if fixtures.recording:
+                    fixtures.record("llm", fixture_request, {"content": content, "usage": result.get("usage")}, elapsed)
+                return content
                 
             except requests.exceptions.Timeout:
                 if attempt < self.max_retries - 1:
-                    wait_time = 2 ** attempt
-                    print(f"API超时，{wait_time}秒后重试... (尝试 {attempt + 1}/{self.max_retries})")
-                    time.sleep(wait_time)
+                    LLM_RETRIES_TOTAL.labels(self.llm, "timeout").inc()
+                    self._wait_before_retry(pool, failed, tried, attempt, "API超时")
                     continue
                 else:
                     raise Exception(f"API调用超时，已重试{self.max_retries}次")
                     
             except requests.exceptions.RequestException as e:
                 if attempt < self.max_retries - 1:
-                    wait_time = 2 ** attempt
-                    print(f"API调用失败: {e}，{wait_time}秒后重试... (尝试 {attempt + 1}/{self.max_retries})")
-                    time.sleep(wait_time)
+                    LLM_RETRIES_TOTAL.labels(self.llm, "error").inc()
+                    self._wait_before_retry(pool, failed, tried, attempt, f"API调用失败: {e}")
                     continue
                 else:
                     raise Exception(f"API调用失败: {e}")
 
-    def get_response(self, prompt: str, **kwargs) -> str:
-        """获取LLM响应"""
-        temperature = kwargs.get('temperature', self.temperature)
+    def _send(self, pool, failed: set, tried: list, headers: dict, data: dict, timeout: float):
+        """
+        发送一次请求（含对冲）
+
+        开启 LLM_HEDGE_ENABLED 时，超过当前模板近期分位耗时仍未返回则向另一端点重复发送，取先成功的结果（见 llm_hedging）
+        """
+        key = self.template or "default"
+        endpoint = pool.acquire(exclude=failed)
+        tried.append(endpoint.url)
+        if not getattr(self.config, 'LLM_HEDGE_ENABLED', False):
+            return self._post(pool, endpoint, headers, data, timeout, key)
+
+        hedge_policy.on_request()
+        delay = hedge_policy.delay(key)
+        if delay is None or delay >= timeout:
+            return self._post(pool, endpoint, headers, data, timeout, key)
+
+        executor = get_hedge_executor()
+        primary = executor.submit(self._post, pool, endpoint, headers, data, timeout, key)
+        if wait([primary], timeout=delay).done:
+            return primary.result()
+        if not hedge_policy.try_hedge():
+            LLM_HEDGES_TOTAL.labels("budget_exhausted").inc()
+            return primary.result()
+
+        hedge_endpoint = pool.acquire(exclude=failed | {endpoint.url})
+        tried.append(hedge_endpoint.url)
+        LLM_HEDGES_TOTAL.labels("fired").inc()
+        hedge = executor.submit(self._post, pool, hedge_endpoint, headers, data, max(timeout - delay, 1.0), key)
+        winner = first_success([primary, hedge])
+        LLM_HEDGES_TOTAL.labels("hedge_won" if winner is hedge else "primary_won").inc()
+        return winner.result()
+
+    def _post(self, pool, endpoint, headers: dict, data: dict, timeout: float, key: str):
+        """
+        单次 HTTP 调用，结束时记录端点统计与耗时指标（对冲时在线程池中执行，不读取可变的实例属性）
+
+        Returns:
+            (content, 原始响应, 耗时秒数)
+        """
+        model = data["model"]
+        start = time.perf_counter()
+        try:
+            response = requests.post(
+                f"{endpoint.url}/chat/completions",
+                headers=headers,
+                json=data,
+                timeout=timeout
+            )
+            response.raise_for_status()
+            result = response.json()
+            content = result["choices"][0]["message"]["content"]
+        except requests.exceptions.Timeout:
+            elapsed = time.perf_counter() - start
+            pool.release(endpoint, elapsed, False)
+            LLM_REQUEST_SECONDS.labels(model, "timeout").observe(elapsed)
+            llm_latency.observe(max(elapsed, timeout))
+            raise
+        except requests.exceptions.RequestException as e:
+            elapsed = time.perf_counter() - start
+            endpoint_failure = is_endpoint_failure(e)
+            pool.release(endpoint, elapsed, False if endpoint_failure else None)
+            LLM_REQUEST_SECONDS.labels(model, "error").observe(elapsed)
+            if endpoint_failure:
+                # 连接失败 / 5xx 往往很快返回，按一次超时计入准入信号，避免拉低耗时均值
+                llm_latency.observe(max(elapsed, timeout))
+            raise
+        except BaseException:
+            pool.release(endpoint, time.perf_counter() - start, None)
+            raise
+
+        elapsed = time.perf_counter() - start
+        pool.release(endpoint, elapsed, True)
+        LLM_REQUEST_SECONDS.labels(model, "success").observe(elapsed)
+        llm_latency.observe(elapsed)
+        if getattr(self.config, 'LLM_HEDGE_ENABLED', False):
+            hedge_policy.observe(key, elapsed)
+        return content, result, elapsed
+
+    def _wait_before_retry(self, pool, failed: set, tried: list, attempt: int, reason: str):
+        """还有其他可用端点时立即换端点重试，否则清空失败记录并按 2 ** attempt 退避"""
+        failed.update(tried)
+        if pool.has_alternative(failed):
+            for url in tried:
+                LLM_ENDPOINT_FAILOVERS_TOTAL.labels(url).inc()
+            print(f"{reason}，切换端点重试... (尝试 {attempt + 1}/{self.max_retries})")
+            return
+        failed.clear()
+        wait_time = 2 ** attempt
+        print(f"{reason}，{wait_time}秒后重试... (尝试 {attempt + 1}/{self.max_retries})")
+        backoff_sleep(wait_time)
+
+    def _record_usage(self, result: dict):
+        """记录 API 返回的 token 用量"""
+        usage = result.get("usage") if isinstance(result, dict) else None
+        if not usage:
+            return
+        for key, token_type in (("prompt_tokens", "prompt"), ("completion_tokens", "completion")):
+            value = usage.get(key)
+            if isinstance(value, (int, float)) and value > 0:
+                LLM_TOKENS_TOTAL.labels(self.llm, token_type).inc(value)
+
+    def get_response(self, prompt: str, template: Optional[str] = None, **kwargs) -> str:
+        """
+        获取LLM响应
+
+        Args:
+            prompt: 提示词
+            template: 提示模板名，按 Config.LLM_ROUTES 选择模型 / 端点 / 温度 / max_tokens
+        """
+        settings = self.route(template)
+        temperature = kwargs.get('temperature', settings["temperature"])
         max_retries = kwargs.get('max_retries', self.max_retries)
         
         # 临时更新参数
-        original_temp = self.temperature
-        original_retries = self.max_retries
+        original = (self.llm, self.endpoint, self.api_key, self.temperature, self.max_tokens, self.max_retries, self.template)
+        self.llm = settings["model"]
+        self.endpoint = settings["endpoint"]
+        self.api_key = settings["api_key"]
         self.temperature = temperature
+        self.max_tokens = settings["max_tokens"]
         self.max_retries = max_retries
+        self.template = template
         
         try:
             if self.provider == "custom":
@@ -299,8 +476,7 @@ class LLMClient:
                 raise ValueError(f"不支持的提供商: {self.provider}")
         finally:
             # 恢复原始参数
-            self.temperature = original_temp
-            self.max_retries = original_retries
+            self.llm, self.endpoint, self.api_key, self.temperature, self.max_tokens, self.max_retries, self.template = original
 
     def get_config_info(self) -> dict:
         """获取配置信息"""
@@ -308,7 +484,17 @@ class LLMClient:
             "provider": self.provider,
             "model": self.llm,
             "endpoint": self.endpoint,
+            "endpoints": get_endpoint_pool(self.endpoint).stats(),
+            "hedging": hedge_policy.stats() if getattr(self.config, 'LLM_HEDGE_ENABLED', False) else None,
             "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
             "max_retries": self.max_retries,
-            "timeout": self.timeout
+            "timeout": self.timeout,
+            "routes": {name: self.route(name)["model"] for name in PROMPT_TEMPLATES},
         }
+
+
+def route_signature() -> str:
+    """各提示模板实际使用的模型，用于区分不同路由配置下的结果（去重指纹）"""
+    client = LLMClient(provider="custom")
+    return ",".join(f"{name}={client.route(name)['model']}" for name in PROMPT_TEMPLATES)
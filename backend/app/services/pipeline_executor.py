@@ -0,0 +1,88 @@
+"""
+研究流水线专用执行器
+Dedicated executor for research pipeline tasks
+
+研究任务（_background_process_prompt_and_update）为同步、长耗时（可达 1 小时）任务。
+若通过 BackgroundTasks 运行，会占用 Starlette/AnyIO 共享线程池（默认 40 线程），
+该线程池同时服务同步依赖与 run_in_threadpool，任务一多请求路径即被饿死。
+
+这里为流水线使用独立线程池：
+- PIPELINE_MAX_WORKERS：并发执行的任务数
+- 排队与准入由 task_scheduler 负责（派发数不超过线程数），执行器本身不排队；
+  关闭后 submit 抛出 PipelineRejectedError
+- 指标：执行中任务数、拒绝次数
+"""
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from app.core.config import Config
+from app.core.metrics import PIPELINE_EXECUTOR_ACTIVE, PIPELINE_EXECUTOR_REJECTED_TOTAL
+from app.utils.logger import get_logger
+
+logger = get_logger('pipeline_executor')
+
+
+class PipelineRejectedError(RuntimeError):
+    """任务被拒绝（调度器排队已满，或执行器已关闭）"""
+
+
+class PipelineExecutor:
+    """流水线专用线程池"""
+
+    def __init__(self, max_workers: int, name: str = "pipeline"):
+        if max_workers < 1:
+            raise ValueError("max_workers must be >= 1")
+        self.max_workers = max_workers
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._active = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        提交任务（复制调用方 contextvars，与 run_in_threadpool 行为一致）
+
+        Raises:
+            PipelineRejectedError: 执行器已关闭
+        """
+        context = contextvars.copy_context()
+
+        def _run():
+            with self._lock:
+                self._active += 1
+            PIPELINE_EXECUTOR_ACTIVE.inc()
+            try:
+                return context.run(fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                PIPELINE_EXECUTOR_ACTIVE.dec()
+
+        try:
+            future = self._executor.submit(_run)
+        except RuntimeError:
+            PIPELINE_EXECUTOR_REJECTED_TOTAL.inc()
+            raise PipelineRejectedError("Pipeline executor is shut down")
+        future.add_done_callback(self._log_failure)
+        return future
+
+    @staticmethod
+    def _log_failure(future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Pipeline task raised an unhandled exception", exc_info=future.exception())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "active": self._active,
+            }
+
+    def shutdown(self, wait: bool = False, cancel_futures: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+
+# 进程级执行器（线程按需创建，gunicorn fork 前不会启动线程）
+pipeline_executor = PipelineExecutor(max_workers=Config.PIPELINE_MAX_WORKERS)
@@ -0,0 +1,110 @@
+"""
+论文上下文的 token 预算
+Token budgeting and abstract compaction for the paper context
+
+construct_paper 生成的论文文本会在灵感、计划、评审三个提示词中重复发送。这里提供：
+- estimate_tokens：无需分词器的 token 估算（CJK 字符按 1 个 token，其余字符按 4 个字符 1 个 token）
+- paper_key / dedupe_papers：按 paperId（缺失时按规范化标题）去重，三个列表中重复的论文只保留第一次出现的位置
+  （优先使用带摘要的副本）
+- abstract_limit：在总预算内为各摘要分配上限（短摘要用不完的额度留给长摘要）
+- compact_abstract：抽取式压缩，按句保留开头部分（背景与方法通常在前），单句超限时按词截断，被截断时以 … 结尾；
+  标题与格式已占满预算时摘要整体省略，只保留标题
+"""
+import math
+import re
+from typing import Iterable, List, Optional, Sequence
+
+_CJK_RE = re.compile(r"[一-鿿]")
+_PIECE_RE = re.compile(r"[一-鿿]|[^\s一-鿿]+\s*|\s+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|(?<=[。！？])")
+ELLIPSIS = " …"
+
+
+def _cost(text: str) -> float:
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk) / 4
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    return math.ceil(_cost(text)) if text else 0
+
+
+def paper_key(paper: dict) -> str:
+    if paper.get("paperId"):
+        return "id:" + str(paper["paperId"])
+    return "title:" + re.sub(r"\W+", " ", str(paper.get("title") or "")).strip().casefold()
+
+
+def dedupe_papers(lists: Iterable[Optional[Sequence[dict]]]) -> List[List[dict]]:
+    """
+    跨列表去重，保持列表与论文的原始顺序
+
+    重复的论文保留在首次出现的位置；首次出现的副本没有摘要而后续副本有时，改用后续副本
+    """
+    seen = {}  # key -> (列表下标, 列表内下标)
+    result = []
+    for papers in lists:
+        unique = []
+        for paper in papers or []:
+            key = paper_key(paper)
+            if key not in seen:
+                seen[key] = (len(result), len(unique))
+                unique.append(paper)
+                continue
+            i, j = seen[key]
+            kept = unique if i == len(result) else result[i]
+            if not kept[j].get("abstract") and paper.get("abstract"):
+                kept[j] = paper
+        result.append(unique)
+    return result
+
+
+def abstract_limit(lengths: Sequence[int], available: int) -> int:
+    """
+    使 sum(min(length, limit)) <= available 的最大 limit（注水分配）
+
+    Args:
+        lengths: 各摘要的估算 token 数
+        available: 摘要可用的总 token 数
+    """
+    remaining = max(available, 0)
+    ordered = sorted(lengths)
+    for i, length in enumerate(ordered):
+        share = remaining // (len(ordered) - i)
+        if length > share:
+            return share
+        remaining -= length
+    return ordered[-1] if ordered else 0
+
+
+def _truncate(text: str, max_tokens: float) -> str:
+    kept, used = [], 0.0
+    for piece in _PIECE_RE.findall(text):
+        used += _cost(piece)
+        if used > max_tokens:
+            break
+        kept.append(piece)
+    return "".join(kept).rstrip()
+
+
+def compact_abstract(abstract: str, max_tokens: Optional[int]) -> str:
+    """
+    将摘要压缩到 max_tokens 以内
+
+    max_tokens 为 None 时不限制；预算不足以保留任何内容（含 max_tokens <= 0）时返回空串，由调用方只保留标题
+    """
+    abstract = re.sub(r"\s+", " ", abstract).strip()
+    if max_tokens is None or _cost(abstract) <= max_tokens:
+        return abstract
+    budget = max_tokens - _cost(ELLIPSIS)
+    kept, used = [], 0.0
+    for sentence in _SENTENCE_RE.split(abstract):
+        cost = _cost(sentence) + 0.25
+        if used + cost > budget:
+            break
+        kept.append(sentence)
+        used += cost
+    if not kept:
+        truncated = _truncate(abstract, budget) if budget > 0 else ""
+        return truncated + ELLIPSIS if truncated else ""
+    return " ".join(kept) + ELLIPSIS
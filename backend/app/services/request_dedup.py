@@ -0,0 +1,179 @@
+"""
+相同研究请求去重
+Content-hash deduplication of identical research requests
+
+热门题目会被大量用户原样提交，每次都执行完整的六步流水线。开启 DEDUP_ENABLED 后，
+create_research 按 规范化内容 + locale + 各步骤模型 计算指纹：
+- 新鲜度窗口（DEDUP_FRESHNESS_SECONDS）内已有完成结果：直接复制到新消息，不调用 LLM
+- 已有运行中的相同任务（leader）：新任务作为 follower 附加（extra_info.dedup_of），不提交流水线；
+  leader 完成后复制结果给全部 follower，失败 / 取消时 follower 由 mark_resumable 交给清扫器独立执行
+- 否则本任务成为 leader
+请求中 reuse_results=false 可跳过去重。
+
+指纹到 leader / 结果的映射与 follower 列表保存在 kv_store 中；fan-out 丢失（如降级为进程内存储）时，
+清扫器会处理心跳过期的 follower：leader 已完成则复制结果，仍在运行则刷新心跳，否则独立执行。
+"""
+import hashlib
+import re
+import unicodedata
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import select
+
+from app.constants.task_status import CreationStatus
+from app.core.config import Config
+from app.core.database import SessionLocal
+from app.core.kv_store import KeyValueStore, kv_store
+from app.core.metrics import DEDUP_REQUESTS_TOTAL
+from app.entity.research_chat import ResearchChatMessage, ResearchChatProcessInfo
+from app.services.llm_service import route_signature
+from app.utils.logger import get_logger
+from app.utils.tools import UTC8
+
+logger = get_logger('request_dedup')
+
+COMPLETED = "completed"
+RUNNING = "running"
+
+
+def normalize_content(content: str) -> str:
+    """NFKC 规范化、大小写折叠并合并空白"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", content)).strip().casefold()
+
+
+def content_fingerprint(content: str, locale: str, model: Optional[str]) -> str:
+    raw = "\x1f".join([normalize_content(content), locale or "", model or ""])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class RequestDeduplicator:
+    """指纹 -> 运行中的 leader / 已完成结果 的映射"""
+
+    def __init__(self, kv: KeyValueStore, enabled: bool, freshness_seconds: float, running_ttl: float):
+        self.kv = kv
+        self.enabled = enabled
+        self.freshness_seconds = freshness_seconds
+        self.running_ttl = running_ttl
+
+    def fingerprint(self, content: str, locale: str) -> str:
+        # 按模板路由后各步骤可能使用不同模型，指纹包含全部路由
+        return content_fingerprint(content, locale, route_signature())
+
+    def find(self, fingerprint: str) -> Tuple[Optional[str], Optional[int]]:
+        """返回 (COMPLETED, 结果所在 message_id) / (RUNNING, leader message_id) / (None, None)"""
+        done = self.kv.get(f"dedup:done:{fingerprint}")
+        if done is not None:
+            return COMPLETED, done
+        running = self.kv.get(f"dedup:running:{fingerprint}")
+        if running is not None:
+            return RUNNING, running
+        return None, None
+
+    def claim_leader(self, fingerprint: str, message_id: int) -> bool:
+        return self.kv.set_if_absent(f"dedup:running:{fingerprint}", message_id, self.running_ttl)
+
+    def is_running(self, fingerprint: str, message_id: int) -> bool:
+        return self.kv.get(f"dedup:running:{fingerprint}") == message_id
+
+    def attach(self, leader_id: int, follower_id: int):
+        self.kv.append(f"dedup:followers:{leader_id}", follower_id, self.running_ttl)
+
+    def followers(self, leader_id: int) -> list:
+        return self.kv.get_list(f"dedup:followers:{leader_id}")
+
+    def publish(self, fingerprint: str, message_id: int):
+        """leader 成功完成：释放运行中标记并记录结果位置（非 leader 的任务不发布）"""
+        if self.kv.delete_if_equals(f"dedup:running:{fingerprint}", message_id) and self.freshness_seconds > 0:
+            self.kv.set(f"dedup:done:{fingerprint}", message_id, self.freshness_seconds)
+
+    def release(self, fingerprint: str, message_id: int):
+        """leader 未成功完成：释放运行中标记，后续相同请求重新选出 leader"""
+        self.kv.delete_if_equals(f"dedup:running:{fingerprint}", message_id)
+
+
+def _log_entry(message: str) -> str:
+    return f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}"
+
+
+def clone_result(db, source_message_id: int, target_message_id: int) -> bool:
+    """
+    将已完成消息的结果复制到目标消息，并将目标任务置为完成（来源 message_id 仅记录在任务 extra_info）
+
+    目标任务已结束或已请求取消、来源结果不存在时返回 False
+    """
+    source = db.scalar(select(ResearchChatMessage).where(ResearchChatMessage.id == source_message_id))
+    if source is None or not source.result_papers:
+        return False
+    target = db.scalar(select(ResearchChatMessage).where(ResearchChatMessage.id == target_message_id))
+    proc = db.scalar(select(ResearchChatProcessInfo).where(ResearchChatProcessInfo.message_id == target_message_id))
+    if target is None or proc is None or proc.creation_status not in CreationStatus.IN_PROGRESS:
+        return False
+    if (proc.extra_info or {}).get("cancel_requested"):
+        return False
+
+    # 只复制内容；来源消息属于其他用户，关联仅记录在不返回给客户端的任务 extra_info 中
+    target.result_papers = dict(source.result_papers)
+    target.extra_info = {"generation_complete": True}
+    proc.extra_info = {**(proc.extra_info or {}), "deduplicated_from": source_message_id}
+    logs = list((proc.process_info or {}).get("logs", []))
+    logs.append(_log_entry("♻️ 已复用相同研究请求的结果"))
+    proc.process_info = {"logs": logs}
+    proc.creation_status = CreationStatus.CREATED
+    proc.updated_at = datetime.now(UTC8)
+    db.commit()
+    return True
+
+
+def resolve_followers(leader_id: int, succeeded: bool) -> int:
+    """
+    leader 结束后处理全部 follower：成功则复制结果，否则标记为可恢复由清扫器独立执行
+
+    Returns:
+        int: 复制结果的 follower 数
+    """
+    follower_ids = request_dedup.followers(leader_id)
+    if not follower_ids:
+        return 0
+    if not succeeded:
+        from app.services.task_recovery import mark_resumable
+        mark_resumable(follower_ids)
+        logger.info(f"去重 leader 未完成，follower 转为独立执行: leader={leader_id}, followers={follower_ids}")
+        return 0
+
+    cloned = 0
+    db = SessionLocal()
+    try:
+        for follower_id in follower_ids:
+            try:
+                if clone_result(db, leader_id, follower_id):
+                    cloned += 1
+            except Exception as e:
+                logger.error(f"复制去重结果失败: leader={leader_id}, follower={follower_id}, error={e}")
+                db.rollback()
+    finally:
+        db.close()
+    DEDUP_REQUESTS_TOTAL.labels("fanout").inc(cloned)
+    logger.info(f"去重 leader 完成，已复制结果: leader={leader_id}, cloned={cloned}/{len(follower_ids)}")
+    return cloned
+
+
+def finish_leader(content: str, locale: str, message_id: int, succeeded: bool):
+    """流水线结束时调用：发布或释放 leader 标记，并处理 follower"""
+    if not request_dedup.enabled:
+        return
+    try:
+        fingerprint = request_dedup.fingerprint(content, locale)
+        if succeeded:
+            request_dedup.publish(fingerprint, message_id)
+        else:
+            request_dedup.release(fingerprint, message_id)
+        resolve_followers(message_id, succeeded)
+    except Exception as e:
+        # follower 由清扫器兜底
+        logger.error(f"处理去重 follower 失败: leader={message_id}, error={e}")
+
+
+request_dedup = RequestDeduplicator(
+    kv_store, Config.DEDUP_ENABLED, Config.DEDUP_FRESHNESS_SECONDS, Config.TASK_TIMEOUT_SECONDS
+)
@@ -0,0 +1,320 @@
+"""
+相似研究请求缓存
+Semantic near-duplicate query cache over past research topics
+
+精确去重（request_dedup）无法覆盖改写后的题目（语序、单复数与词形、停用词、标点不同）。这里维护一个本地向量索引：
+- HashingEmbedder：无需模型的哈希向量（英文词干 + 词内字符 3-gram、中文字符 2-gram，次线性词频，L2 归一化）；
+  不理解缩写与同义词（"LLM" 与 "large language models"），因此阈值应保守，误复用会带来不相关的论文
+- SemanticIndex：向量保存在 numpy memmap 矩阵（vectors.f32）中，行号到 message_id / locale 的映射追加写入
+  entries.jsonl；写入时持有文件锁，多 worker 共享同一目录，读取前按 entries.jsonl 增量刷新
+- 检索为矩阵与查询向量的一次点积（向量已归一化即余弦相似度），只比较相同 locale 的条目
+
+流水线开始时（非断点恢复）取相似度 >= SEMANTIC_CACHE_THRESHOLD 的前 SEMANTIC_CACHE_TOP_K 个历史题目，
+优先复用其中有检索结果快照（ResearchChatMessage.extra_info.retrieval）的关键词与论文检索结果（步骤 1-2），
+SEMANTIC_CACHE_REUSE_INSPIRATION 开启时同时复用灵感（步骤 3）；没有快照的历史题目（开启缓存前完成的任务）
+只复用 result_papers.intermediate_results 中的关键词与检索式（步骤 1）。源消息已删除或无可复用内容时顺延到下一个。
+任务成功完成后将题目加入索引；服务启动时 backfill_index 在后台把已完成的历史消息补入索引（按 message_id 去重，
+多 worker 同时执行也不会重复写入）。
+"""
+import fcntl
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+
+from app.constants.task_status import CreationStatus
+from app.core.config import Config
+from app.entity.research_chat import ResearchChatMessage, ResearchChatProcessInfo
+from app.utils.logger import get_logger
+
+logger = get_logger('semantic_cache')
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_CJK_RE = re.compile(r"[一-鿿]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "based", "by", "for", "from", "how", "in", "into", "is", "it",
+    "of", "on", "or", "the", "to", "towards", "using", "via", "what", "with",
+}
+_CJK_STOPCHARS = re.compile(r"[的了和与及之于]")
+_SUFFIXES = ("ations", "ation", "ings", "ing", "ions", "ion", "ers", "er", "ies", "es", "s", "ed")
+
+
+def _stem(word: str) -> str:
+    """粗粒度词干：去掉常见英文后缀，保留至少 4 个字符"""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+
+class HashingEmbedder:
+    """特征哈希向量化，同一文本在不同进程中得到相同向量"""
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+
+    def features(self, text: str) -> Counter:
+        text = unicodedata.normalize("NFKC", text).casefold()
+        features = Counter()
+        words = [word for word in _WORD_RE.findall(text) if word not in _STOPWORDS]
+        for word in words:
+            stem = _stem(word)
+            features["w:" + stem] += 1.0
+            padded = f"<{stem}>"
+            for i in range(len(padded) - 2):
+                features["c:" + padded[i:i + 3]] += 0.25
+        for run in _CJK_RE.findall(_CJK_STOPCHARS.sub(" ", text)):
+            if len(run) == 1:
+                features["z:" + run] += 1.0
+            for i in range(len(run) - 1):
+                features["z:" + run[i:i + 2]] += 1.0
+        return features
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, count in self.features(text).items():
+            digest = hashlib.md5(feature.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[index] += sign * (1.0 + math.log(count) if count > 1 else count)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+
+class SemanticIndex:
+    """memmap 向量矩阵 + 追加写入的条目表，支持多进程增量更新"""
+
+    def __init__(self, directory: str, embedder: HashingEmbedder, initial_capacity: int = 1024):
+        self.directory = directory
+        self.embedder = embedder
+        self.initial_capacity = initial_capacity
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._entries_path = os.path.join(directory, "entries.jsonl")
+        self._lock_path = os.path.join(directory, "index.lock")
+        self._matrix: Optional[np.memmap] = None
+        self._entries: List[dict] = []
+        self._message_ids = set()
+        self._rows_by_locale: Dict[str, np.ndarray] = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    @property
+    def row_bytes(self) -> int:
+        return self.embedder.dim * 4
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self._lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _map(self):
+        """按当前文件大小重新映射矩阵（其他进程扩容后调用）"""
+        size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        capacity = size // self.row_bytes
+        if capacity == 0:
+            self._matrix = None
+        elif self._matrix is None or self._matrix.shape[0] != capacity:
+            self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self.embedder.dim))
+
+    def _refresh(self):
+        """读取其他进程追加的条目"""
+        if not os.path.exists(self._entries_path):
+            return
+        with open(self._entries_path, "r", encoding="utf-8") as f:
+            f.seek(self._offset)
+            lines = f.readlines()
+            # 只消费完整的行，半行留到下次
+            if lines and not lines[-1].endswith("\n"):
+                lines.pop()
+            self._offset += sum(len(line.encode("utf-8")) for line in lines)
+        if not lines:
+            return
+        new_rows: Dict[str, List[int]] = {}
+        for line in lines:
+            entry = json.loads(line)
+            new_rows.setdefault(entry["locale"], []).append(entry["row"])
+            self._entries.append(entry)
+            self._message_ids.add(entry["message_id"])
+        for locale, rows in new_rows.items():
+            existing = self._rows_by_locale.get(locale, np.empty(0, dtype=np.int64))
+            self._rows_by_locale[locale] = np.concatenate([existing, np.asarray(rows, dtype=np.int64)])
+        self._map()
+
+    def _ensure_capacity(self, rows: int):
+        capacity = self._matrix.shape[0] if self._matrix is not None else 0
+        if rows <= capacity:
+            return
+        new_capacity = max(self.initial_capacity, capacity * 2)
+        while new_capacity < rows:
+            new_capacity *= 2
+        if self._matrix is not None:
+            self._matrix.flush()
+        with open(self._vectors_path, "ab") as f:
+            f.truncate(new_capacity * self.row_bytes)
+        self._map()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._entries)
+
+    def add(self, message_id: int, text: str, locale: str) -> bool:
+        return self.add_many([(message_id, text, locale)]) == 1
+
+    def add_many(self, items: Iterable[Tuple[int, str, str]]) -> int:
+        """批量写入 (message_id, 题目, locale)，已在索引中的 message_id 跳过，返回写入条数"""
+        items = list(items)
+        vectors = [self.embedder.embed(text) for _, text, _ in items]
+        with self._lock, self._file_lock():
+            self._refresh()
+            lines = []
+            row = len(self._entries)
+            for (message_id, _, locale), vector in zip(items, vectors):
+                if message_id in self._message_ids:
+                    continue
+                self._ensure_capacity(row + 1)
+                self._matrix[row] = vector
+                lines.append(json.dumps({"row": row, "message_id": message_id, "locale": locale}) + "\n")
+                self._message_ids.add(message_id)
+                row += 1
+            if not lines:
+                return 0
+            self._matrix.flush()
+            # 向量落盘后再写条目，读取方看到条目时向量一定可用
+            with open(self._entries_path, "a", encoding="utf-8") as f:
+                f.write("".join(lines))
+            self._refresh()
+            return len(lines)
+
+    def search(self, text: str, locale: str, limit: int = 1) -> List[Tuple[int, float]]:
+        """相同 locale 下最相似的 limit 个条目 [(message_id, 余弦相似度)]，按相似度降序"""
+        query = self.embedder.embed(text)
+        with self._lock:
+            self._refresh()
+            rows = self._rows_by_locale.get(locale)
+            if rows is None or len(rows) == 0 or self._matrix is None:
+                return []
+            scores = self._matrix[rows] @ query
+            top = np.argsort(-scores, kind="stable")[:max(limit, 1)]
+            return [(self._entries[int(rows[i])]["message_id"], float(scores[i])) for i in top]
+
+
+_index: Optional[SemanticIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_semantic_index() -> SemanticIndex:
+    """按 Config 构建进程级索引（首次调用时创建）"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            directory = Config.SEMANTIC_CACHE_DIR or os.path.normpath(
+                os.path.join(os.path.dirname(__file__), "..", "..", "data", "semantic_cache")
+            )
+            _index = SemanticIndex(directory, HashingEmbedder(Config.SEMANTIC_CACHE_DIM))
+        return _index
+
+
+def set_semantic_index(index: Optional[SemanticIndex]):
+    """替换进程级索引（单元测试使用，传 None 则下次按 Config 重建）"""
+    global _index
+    _index = index
+
+
+def find_similar(content: str, locale: str) -> List[Tuple[int, float]]:
+    """相似度达到 SEMANTIC_CACHE_THRESHOLD 的前 SEMANTIC_CACHE_TOP_K 个历史题目 [(message_id, 相似度)]"""
+    if not Config.SEMANTIC_CACHE_ENABLED:
+        return []
+    try:
+        matches = get_semantic_index().search(content, locale, Config.SEMANTIC_CACHE_TOP_K)
+    except Exception as e:
+        logger.warning(f"相似题目检索失败: {e}")
+        return []
+    return [match for match in matches if match[1] >= Config.SEMANTIC_CACHE_THRESHOLD]
+
+
+def remember_topic(message_id: int, content: str, locale: str):
+    """任务成功完成后将题目加入索引"""
+    if not Config.SEMANTIC_CACHE_ENABLED:
+        return
+    try:
+        get_semantic_index().add(message_id, content, locale)
+    except Exception as e:
+        logger.warning(f"相似题目索引写入失败: message_id={message_id}, error={e}")
+
+
+def has_reusable_retrieval(message: ResearchChatMessage) -> bool:
+    """已完成且保存了检索结果快照或中间关键词的消息才值得加入索引"""
+    extra_info = message.extra_info or {}
+    intermediate = (message.result_papers or {}).get("intermediate_results") or {}
+    return bool(extra_info.get("generation_complete")) and bool(
+        extra_info.get("retrieval") or (intermediate.get("keywords") and intermediate.get("query"))
+    )
+
+
+def backfill_index(session_factory: Callable, batch_size: int = 200) -> int:
+    """
+    将已完成的历史消息补入索引（按 message_id 分页，已索引的消息跳过）
+
+    Returns:
+        int: 新写入的条目数
+    """
+    index = get_semantic_index()
+    added = 0
+    last_id = 0
+    db = session_factory()
+    try:
+        while True:
+            rows = db.execute(
+                select(ResearchChatMessage, ResearchChatProcessInfo.extra_info)
+                .join(ResearchChatProcessInfo, ResearchChatProcessInfo.message_id == ResearchChatMessage.id)
+                .where(
+                    ResearchChatMessage.id > last_id,
+                    ResearchChatProcessInfo.creation_status == CreationStatus.CREATED,
+                )
+                .order_by(ResearchChatMessage.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            last_id = rows[-1][0].id
+            added += index.add_many(
+                (message.id, message.content, (process_extra or {}).get("locale", "cn"))
+                for message, process_extra in rows
+                if has_reusable_retrieval(message)
+            )
+            db.expunge_all()
+    finally:
+        db.close()
+    logger.info(f"相似题目索引回填完成: 新增 {added} 条，共 {len(index)} 条")
+    return added
+
+
+def start_backfill(session_factory: Callable) -> Optional[threading.Thread]:
+    """SEMANTIC_CACHE_ENABLED 时在后台线程中回填索引"""
+    if not Config.SEMANTIC_CACHE_ENABLED:
+        return None
+
+    def run():
+        try:
+            backfill_index(session_factory)
+        except Exception as e:
+            logger.warning(f"相似题目索引回填失败: {e}")
+
+    thread = threading.Thread(target=run, name="semantic-cache-backfill", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,99 @@
+"""
+推测式论文检索
+Speculative paper retrieval overlapping with keyword extraction
+
+步骤 1（LLM 提取关键词）与步骤 2（三次 Semantic Scholar 检索）严格串行。开启 SPECULATIVE_RETRIEVAL_ENABLED 后：
+- 步骤 1 开始前用本地 RAKE 猜测关键词（置信度低于 SPECULATIVE_RETRIEVAL_MIN_CONFIDENCE 时不推测），
+  并在独立线程池中并行发起三次检索
+- 步骤 1 得到关键词后比较：关键词集合一致（忽略顺序、大小写、空白与末尾复数 s）则直接使用推测结果，
+  检索的网络等待与 LLM 调用重叠；不一致则丢弃（尚未开始的检索会被取消）
+推测检索会额外消耗 S2 配额，命中率见 research_chat_speculative_retrieval_total。
+"""
+import contextvars
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from app.core.config import Config
+from app.core.metrics import SPECULATIVE_RETRIEVAL_TOTAL
+from app.services.keyword_extractor import rake_keywords
+from app.services.llm_service import build_search_query
+from app.utils.logger import get_logger
+
+logger = get_logger('speculative_retrieval')
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=Config.SPECULATIVE_RETRIEVAL_WORKERS, thread_name_prefix="speculative-s2"
+            )
+        return _executor
+
+
+def _normalize_keyword(keyword: str) -> str:
+    words = re.sub(r"\s+", " ", keyword.strip().lower()).split(" ")
+    return " ".join(word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+                    for word in words)
+
+
+def keyword_set(keywords: str) -> frozenset:
+    return frozenset(_normalize_keyword(kw) for kw in keywords.split(",") if kw.strip())
+
+
+class SpeculativeRetrieval:
+    """按猜测的关键词并行发起的一组检索"""
+
+    def __init__(self, keywords: List[str], fetchers: Sequence[Callable], executor: ThreadPoolExecutor):
+        self.keywords = ", ".join(keywords)
+        self.query = build_search_query(self.keywords)
+        # 每个检索使用独立的 contextvars 副本，检索中的超时与取消仍跟随当前任务
+        self._futures: List[Future] = [
+            executor.submit(contextvars.copy_context().run, fetch, self.query) for fetch in fetchers
+        ]
+
+    def matches(self, keywords: str) -> bool:
+        return keyword_set(keywords) == keyword_set(self.keywords)
+
+    def discard(self):
+        for future in self._futures:
+            future.cancel()
+
+    def take(self, keywords: str) -> Optional[Tuple[list, ...]]:
+        """
+        关键词与猜测一致时等待并返回推测结果，否则丢弃并返回 None（调用方按实际关键词检索）
+        """
+        if not self.matches(keywords):
+            self.discard()
+            SPECULATIVE_RETRIEVAL_TOTAL.labels("miss").inc()
+            logger.info(f"推测检索未命中: guess={self.keywords!r}, actual={keywords!r}")
+            return None
+        try:
+            results = tuple(future.result() for future in self._futures)
+        except Exception as e:
+            SPECULATIVE_RETRIEVAL_TOTAL.labels("error").inc()
+            logger.warning(f"推测检索失败，改为串行检索: {e}")
+            return None
+        SPECULATIVE_RETRIEVAL_TOTAL.labels("hit").inc()
+        return results
+
+
+def start_speculative_retrieval(content: str, fetchers: Sequence[Callable]) -> Optional[SpeculativeRetrieval]:
+    """未开启或无法猜测关键词时返回 None"""
+    if not Config.SPECULATIVE_RETRIEVAL_ENABLED:
+        return None
+    guess = rake_keywords(content)
+    if not guess.keywords or guess.confidence < Config.SPECULATIVE_RETRIEVAL_MIN_CONFIDENCE:
+        return None
+    try:
+        return SpeculativeRetrieval(guess.keywords, fetchers, _get_executor())
+    except RuntimeError as e:
+        # 线程池已关闭（停机中）
+        logger.warning(f"推测检索未启动: {e}")
+        return None
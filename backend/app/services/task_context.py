@@ -0,0 +1,166 @@
+"""
+研究任务截止时间与协作式取消
+Task deadline and cooperative cancellation
+
+原先通过 threading.Timer 实现的 1 小时超时会在定时器线程中抛出 TimeoutError，
+任务线程不受影响，超时从未真正生效。这里改为协作式：
+- TaskContext 记录截止时间与取消状态，流水线在每个步骤之间调用 check()
+- LLM / Semantic Scholar 调用通过 current_task_context() 获取上下文，
+  单次请求超时取 min(默认超时, 剩余预算)，重试等待可被取消打断
+- 取消请求写入 ResearchChatProcessInfo.extra_info.cancel_requested（跨 worker 生效），
+  check() 按 TASK_CANCEL_POLL_SECONDS 节流轮询；同进程内通过 request_cancel 立即生效
+- 停机排空时调用 suspend_all()，任务在下一个检查点抛出 TaskSuspended，由流水线标记为可恢复
+
+注意：已发出的单次 HTTP 请求无法中断，取消在该请求返回（或按剩余预算超时）后生效。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Optional
+
+from app.utils.logger import get_logger
+
+logger = get_logger('task_context')
+
+
+class TaskInterrupted(Exception):
+    """任务被中断（取消、超时或挂起）的基类，流水线各步骤不应将其包装为普通失败"""
+
+
+class TaskCancelledError(TaskInterrupted):
+    """用户取消任务"""
+
+
+class TaskDeadlineExceeded(TaskInterrupted, TimeoutError):
+    """任务超过截止时间"""
+
+
+class TaskSuspended(TaskInterrupted):
+    """服务停机排空，任务应在断点处停止并等待恢复"""
+
+
+class TaskContext:
+    """单个任务的截止时间与取消令牌"""
+
+    def __init__(
+        self,
+        timeout_seconds: float,
+        is_cancel_requested: Optional[Callable[[], bool]] = None,
+        poll_interval: float = 5.0,
+    ):
+        self.timeout_seconds = timeout_seconds
+        self.deadline = time.monotonic() + timeout_seconds
+        self._is_cancel_requested = is_cancel_requested
+        self._poll_interval = poll_interval
+        self._last_poll = None
+        self._cancelled = threading.Event()
+        self._suspended = False
+        # 取消与挂起都会唤醒退避等待
+        self._wakeup = threading.Event()
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self):
+        self._cancelled.set()
+        self._wakeup.set()
+
+    def suspend(self):
+        self._suspended = True
+        self._wakeup.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._cancelled.is_set():
+            return True
+        now = time.monotonic()
+        if self._is_cancel_requested and (self._last_poll is None or now - self._last_poll >= self._poll_interval):
+            self._last_poll = now
+            try:
+                if self._is_cancel_requested():
+                    self.cancel()
+            except Exception as e:
+                logger.warning(f"查询取消标记失败: {e}")
+        return self._cancelled.is_set()
+
+    def check(self):
+        """已取消、挂起或超过截止时间时抛出对应异常"""
+        if self.cancelled:
+            raise TaskCancelledError("Task was cancelled")
+        if self._suspended:
+            raise TaskSuspended("Task suspended for shutdown")
+        if self.remaining() <= 0:
+            raise TaskDeadlineExceeded(f"Task timed out after {self.timeout_seconds:.0f} seconds")
+
+    def timeout_for(self, default: float) -> float:
+        """单次外部调用的超时：不超过剩余预算"""
+        self.check()
+        return min(default, self.remaining())
+
+    def sleep(self, seconds: float):
+        """可被取消 / 挂起打断的等待（重试退避），不超过剩余预算"""
+        self.check()
+        self._wakeup.wait(min(seconds, self.remaining()))
+        self.check()
+
+
+_current_task_context: ContextVar[Optional[TaskContext]] = ContextVar("task_context", default=None)
+
+# 本进程内运行中的任务（message_id -> TaskContext），用于取消立即生效
+_running_tasks: Dict[int, TaskContext] = {}
+_running_lock = threading.Lock()
+
+
+def current_task_context() -> Optional[TaskContext]:
+    """获取当前线程正在执行的任务上下文（非流水线调用返回 None）"""
+    return _current_task_context.get()
+
+
+@contextmanager
+def bind_task_context(message_id: int, ctx: TaskContext):
+    """绑定任务上下文并登记为运行中，退出时还原"""
+    token = _current_task_context.set(ctx)
+    with _running_lock:
+        _running_tasks[message_id] = ctx
+    try:
+        yield ctx
+    finally:
+        with _running_lock:
+            if _running_tasks.get(message_id) is ctx:
+                del _running_tasks[message_id]
+        _current_task_context.reset(token)
+
+
+def request_cancel(message_id: int) -> bool:
+    """取消本进程内运行中的任务，返回是否找到该任务"""
+    with _running_lock:
+        ctx = _running_tasks.get(message_id)
+    if ctx is None:
+        return False
+    ctx.cancel()
+    return True
+
+
+def suspend_all() -> list:
+    """挂起本进程内全部运行中的任务，返回其 message_id"""
+    with _running_lock:
+        items = list(_running_tasks.items())
+    for _, ctx in items:
+        ctx.suspend()
+    return [message_id for message_id, _ in items]
+
+
+def call_timeout(default: float) -> float:
+    """外部调用超时：流水线中按剩余预算收紧，其他场景返回默认值"""
+    ctx = current_task_context()
+    return ctx.timeout_for(default) if ctx else default
+
+
+def backoff_sleep(seconds: float):
+    """重试退避：流水线中可被取消打断"""
+    ctx = current_task_context()
+    if ctx:
+        ctx.sleep(seconds)
+    else:
+        time.sleep(seconds)
@@ -0,0 +1,86 @@
+"""
+停机排空
+Graceful drain of research tasks on shutdown
+
+滚动重启时进程直接退出会中断正在调用 LLM 的流水线，浪费已消耗的 token 并导致任务失败。
+uvicorn 收到 SIGTERM 后先关闭监听端口再执行 lifespan 关闭阶段，此时标记 draining 已无法让负载均衡摘流。
+因此停机分两步：
+- 预停机：deploy/stop_services.sh 先创建 DRAIN_MARKER_FILE（每个实例一个，所有 worker 共享），
+  /ready 返回 503、create_research 拒绝新任务，等待 DRAIN_GRACE_SECONDS 让负载均衡摘除流量后再发送 SIGTERM
+- lifespan 关闭阶段调用 drain_tasks()：
+1. 标记 draining（未经预停机直接收到 SIGTERM 时）
+2. 调度器停止接收任务，排队中的任务直接移出
+3. 挂起运行中的任务：流水线在下一个检查点（步骤之间，断点已保存）停止
+4. 最多等待 SHUTDOWN_DRAIN_TIMEOUT_SECONDS
+5. 排队中的任务由 mark_resumable 标记为可恢复，交给存活 worker 或重启后的服务继续执行
+超时仍未停止的任务不在这里标记：其线程仍在运行，此时标记会让其他 worker 的清扫重复执行同一任务。
+这些任务在下一个检查点停止时自行标记；停止前心跳继续刷新（lifespan 只移除清扫任务），
+进程被强制终止后心跳过期，由正常的崩溃恢复接管。
+"""
+import os
+import time
+from typing import Optional
+
+from app.core.config import Config
+from app.services.task_context import suspend_all
+from app.services.task_recovery import mark_resumable
+from app.services.task_scheduler import task_scheduler
+from app.utils.logger import get_logger
+
+logger = get_logger('task_drain')
+
+
+class DrainState:
+    """进程排空状态（就绪检查与准入使用）"""
+
+    def __init__(self, marker_file: Optional[str] = None):
+        self.marker_file = marker_file
+        self.started_at: Optional[float] = None
+        self._draining = False
+
+    @property
+    def draining(self) -> bool:
+        """本进程已开始排空，或预停机标记文件已存在"""
+        if not self._draining and self.marker_file and os.path.exists(self.marker_file):
+            self.start()
+        return self._draining
+
+    def start(self):
+        if not self._draining:
+            self._draining = True
+            self.started_at = time.monotonic()
+
+
+drain_state = DrainState(Config.DRAIN_MARKER_FILE or None)
+
+
+def drain_tasks(timeout: float, poll_interval: float = 0.2) -> dict:
+    """
+    排空本进程的研究任务（阻塞，需在线程中调用）
+
+    Returns:
+        dict: queued / suspended / stopped / unfinished / marked_resumable 任务数
+    """
+    drain_state.start()
+    queued = task_scheduler.drain()
+    suspended = suspend_all()
+    logger.info(f"开始排空研究任务: 排队 {len(queued)} 个，运行中 {len(suspended)} 个，最多等待 {timeout:.0f} 秒")
+
+    deadline = time.monotonic() + timeout
+    while task_scheduler.running_keys() and time.monotonic() < deadline:
+        time.sleep(poll_interval)
+
+    unfinished = task_scheduler.running_keys()
+    # 运行中的任务在检查点停止时自行标记；仍在执行的任务不能标记，否则会被其他 worker 重复执行
+    marked = mark_resumable(queued)
+    if unfinished:
+        logger.warning(f"排空超时，{len(unfinished)} 个任务仍在执行，将在下一个检查点停止时自行标记: {unfinished}")
+    summary = {
+        "queued": len(queued),
+        "suspended": len(suspended),
+        "stopped": max(0, len(suspended) - len(unfinished)),
+        "unfinished": len(unfinished),
+        "marked_resumable": marked,
+    }
+    logger.info(f"研究任务排空完成: {summary}")
+    return summary
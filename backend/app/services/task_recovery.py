@@ -0,0 +1,251 @@
+"""
+研究任务崩溃恢复
+Heartbeats and orphaned-task sweeper
+
+worker 进程退出后，其任务在 research_chat_process_infos 中永远停留在 pending / creating，
+create_research 的进行中检查会使该会话无法再提交新请求。
+
+- 心跳：每个 worker 每 TASK_HEARTBEAT_SECONDS 为本进程调度器中（排队 + 执行中）的任务刷新 updated_at；
+  流水线的 db_log 同样会刷新 updated_at
+- 清扫：每 TASK_SWEEP_INTERVAL_SECONDS 查找 updated_at 超过 TASK_HEARTBEAT_TIMEOUT_SECONDS 的进行中任务，
+  以条件 UPDATE 认领（多 worker 同时清扫时只有一个成功），然后：
+    - 未请求取消且恢复次数 < TASK_RECOVERY_MAX_ATTEMPTS：置为 pending 并提交到本进程调度器，
+      流水线从 ResearchChatMessage.extra_info.checkpoint 中最后完成的步骤继续
+    - 否则置为 failed
+  停机排空时挂起的任务（extra_info.suspended）由 mark_resumable 直接置为心跳过期，
+  下一轮清扫即可恢复，且不计入恢复次数
+- 去重 follower（extra_info.dedup_of）：leader 仍在运行时仅刷新心跳，leader 已完成时复制结果，
+  否则作为独立任务重新入队（同样不计入恢复次数）
+- 两个任务均由 APScheduler BackgroundScheduler 在独立线程中执行，在 lifespan 中启停
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from sqlalchemy import select, update
+
+from app.constants.task_status import CreationStatus
+from app.core.config import Config
+from app.core.database import SessionLocal
+from app.core.metrics import TASK_RECOVERY_TOTAL
+from app.entity.auth import User
+from app.entity.research_chat import ResearchChatMessage, ResearchChatProcessInfo
+from app.services.pipeline_executor import PipelineRejectedError
+from app.services.task_scheduler import task_scheduler
+from app.utils.logger import get_logger
+from app.utils.tools import UTC8
+
+logger = get_logger('task_recovery')
+
+SWEEP_BATCH_SIZE = 50
+
+
+def _now() -> datetime:
+    return datetime.now(UTC8)
+
+
+def _log_entry(message: str) -> str:
+    return f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}"
+
+
+def heartbeat_active_tasks() -> int:
+    """为本进程排队 / 执行中的任务刷新 updated_at，返回更新行数"""
+    keys = task_scheduler.active_keys()
+    if not keys:
+        return 0
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            update(ResearchChatProcessInfo)
+            .where(
+                ResearchChatProcessInfo.message_id.in_(keys),
+                ResearchChatProcessInfo.creation_status.in_(CreationStatus.IN_PROGRESS),
+            )
+            .values(updated_at=_now())
+        )
+        db.commit()
+        return result.rowcount
+    except Exception as e:
+        logger.error(f"任务心跳更新失败: {e}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+
+
+def _claim(db, proc: ResearchChatProcessInfo) -> bool:
+    """条件更新 updated_at 认领任务，避免多个 worker 重复恢复"""
+    result = db.execute(
+        update(ResearchChatProcessInfo)
+        .where(
+            ResearchChatProcessInfo.id == proc.id,
+            ResearchChatProcessInfo.updated_at == proc.updated_at,
+            ResearchChatProcessInfo.creation_status.in_(CreationStatus.IN_PROGRESS),
+        )
+        .values(updated_at=_now())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def _recover(db, proc: ResearchChatProcessInfo) -> Optional[tuple]:
+    """
+    处理一个已认领的孤儿任务
+
+    Returns:
+        需要重新入队时返回 (message, identity_tag, locale)，否则返回 None（已置为失败）
+    """
+    extra_info = dict(proc.extra_info or {})
+    attempts = int(extra_info.get("recovery_attempts", 0))
+    # 停机排空主动挂起的任务、leader 未完成的去重 follower 不计入恢复次数
+    suspended = extra_info.pop("suspended", False)
+    if extra_info.pop("dedup_of", None) is not None:
+        suspended = True
+    logs = list((proc.process_info or {}).get("logs", []))
+    message = db.scalar(select(ResearchChatMessage).where(ResearchChatMessage.id == proc.message_id))
+
+    if message is None or extra_info.get("cancel_requested") or (not suspended and attempts >= Config.TASK_RECOVERY_MAX_ATTEMPTS):
+        logs.append(_log_entry("❌ 任务执行中断（服务重启或进程异常退出），请重新提交"))
+        proc.process_info = {"logs": logs}
+        proc.creation_status = CreationStatus.FAILED
+        db.commit()
+        TASK_RECOVERY_TOTAL.labels("failed").inc()
+        logger.warning(f"孤儿任务已置为失败: message_id={proc.message_id}, attempts={attempts}")
+        return None
+
+    if not suspended:
+        extra_info["recovery_attempts"] = attempts + 1
+    logs.append(_log_entry("♻️ 任务执行中断，正在重新排队恢复"))
+    proc.extra_info = extra_info
+    proc.process_info = {"logs": logs}
+    proc.creation_status = CreationStatus.PENDING
+    identity_tag = db.scalar(select(User.identity_tag).where(User.id == proc.user_id))
+    db.commit()
+    TASK_RECOVERY_TOTAL.labels("requeued").inc()
+    logger.info(f"孤儿任务重新入队: message_id={proc.message_id}, attempts={extra_info.get('recovery_attempts', 0)}, suspended={suspended}")
+    return message, identity_tag, extra_info.get("locale", "cn")
+
+
+def _follow_leader(db, proc: ResearchChatProcessInfo) -> Optional[str]:
+    """
+    已认领的去重 follower：leader 仍在运行时保持等待（认领已刷新心跳），leader 已完成时复制结果
+
+    Returns:
+        "waiting" / "cloned"；不是 follower 或需要独立执行时返回 None
+    """
+    from app.services.request_dedup import clone_result
+
+    leader_id = (proc.extra_info or {}).get("dedup_of")
+    if leader_id is None:
+        return None
+    leader_status = db.scalar(
+        select(ResearchChatProcessInfo.creation_status).where(ResearchChatProcessInfo.message_id == leader_id)
+    )
+    if leader_status in CreationStatus.IN_PROGRESS and not (proc.extra_info or {}).get("cancel_requested"):
+        return "waiting"
+    if leader_status == CreationStatus.CREATED and clone_result(db, leader_id, proc.message_id):
+        TASK_RECOVERY_TOTAL.labels("deduplicated").inc()
+        return "cloned"
+    return None
+
+
+def sweep_orphaned_tasks() -> int:
+    """清扫心跳超时的进行中任务，返回处理的任务数"""
+    # 延迟导入：chat_routes 依赖调度器，避免循环导入
+    from app.routes.chat_routes import _background_process_prompt_and_update
+
+    cutoff = _now() - timedelta(seconds=Config.TASK_HEARTBEAT_TIMEOUT_SECONDS)
+    handled = 0
+    db = SessionLocal()
+    try:
+        stale = db.execute(
+            select(ResearchChatProcessInfo)
+            .where(
+                ResearchChatProcessInfo.creation_status.in_(CreationStatus.IN_PROGRESS),
+                ResearchChatProcessInfo.updated_at < cutoff,
+            )
+            .limit(SWEEP_BATCH_SIZE)
+        ).scalars().all()
+
+        for proc in stale:
+            # 本进程仍在调度的任务不是孤儿（心跳可能尚未写入）
+            if task_scheduler.position(proc.message_id) is not None:
+                continue
+            try:
+                if not _claim(db, proc):
+                    continue
+                db.refresh(proc)
+                followed = _follow_leader(db, proc)
+                if followed == "waiting":
+                    continue
+                requeue = None if followed else _recover(db, proc)
+            except Exception as e:
+                logger.error(f"孤儿任务恢复失败: message_id={proc.message_id}, error={e}")
+                db.rollback()
+                continue
+            handled += 1
+            if requeue:
+                message, identity_tag, locale = requeue
+                try:
+                    task_scheduler.submit(
+                        message.id, message.user_id, identity_tag,
+                        _background_process_prompt_and_update,
+                        message.id, message.session_id, message.user_id, message.email, message.content, locale
+                    )
+                except PipelineRejectedError as e:
+                    # 排队已满：保持 pending，心跳超时后由下一轮清扫再次处理
+                    logger.warning(f"孤儿任务重新入队被拒绝: message_id={message.id}, {e}")
+    finally:
+        db.close()
+    return handled
+
+
+def mark_resumable(message_ids: list) -> int:
+    """
+    停机排空：将任务置为 pending 并标记 suspended，updated_at 设为已过期，
+    使任一存活 worker（或重启后的本服务）的下一轮清扫立即从断点恢复
+
+    Returns:
+        int: 标记的任务数
+    """
+    if not message_ids:
+        return 0
+    stale_at = _now() - timedelta(seconds=Config.TASK_HEARTBEAT_TIMEOUT_SECONDS + 1)
+    db = SessionLocal()
+    try:
+        procs = db.execute(
+            select(ResearchChatProcessInfo).where(
+                ResearchChatProcessInfo.message_id.in_(message_ids),
+                ResearchChatProcessInfo.creation_status.in_(CreationStatus.IN_PROGRESS),
+            )
+        ).scalars().all()
+        for proc in procs:
+            logs = list((proc.process_info or {}).get("logs", []))
+            logs.append(_log_entry("⏸️ 服务重启中，任务进度已保存，稍后自动恢复"))
+            proc.process_info = {"logs": logs}
+            proc.extra_info = {**(proc.extra_info or {}), "suspended": True}
+            proc.creation_status = CreationStatus.PENDING
+            proc.updated_at = stale_at
+        db.commit()
+        return len(procs)
+    except Exception as e:
+        logger.error(f"标记可恢复任务失败: message_ids={message_ids}, error={e}")
+        db.rollback()
+        return 0
+    finally:
+        db.close()
+
+
+def create_recovery_scheduler() -> BackgroundScheduler:
+    """创建心跳与清扫的后台调度器（调用方负责 start / shutdown）"""
+    scheduler = BackgroundScheduler(daemon=True, job_defaults={"coalesce": True, "max_instances": 1})
+    scheduler.add_job(
+        heartbeat_active_tasks, "interval", seconds=Config.TASK_HEARTBEAT_SECONDS, id="task_heartbeat"
+    )
+    # 启动时立即清扫一次，恢复上次进程退出时遗留的任务
+    scheduler.add_job(
+        sweep_orphaned_tasks, "interval", seconds=Config.TASK_SWEEP_INTERVAL_SECONDS, id="task_sweeper",
+        next_run_time=datetime.now(),
+    )
+    return scheduler
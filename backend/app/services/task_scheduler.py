@@ -0,0 +1,292 @@
+"""
+研究任务公平调度器
+Fair-share scheduler in front of the pipeline executor
+
+create_research 原先只限制"同一会话一个进行中任务"，同一用户开多个会话即可占满 LLM 容量。
+调度器位于 pipeline_executor 之前，是唯一的排队与准入点：
+- 全局并发上限 SCHEDULER_MAX_CONCURRENCY（不超过执行器线程数，派发的任务总能立即获得线程）
+- 单用户并发上限 SCHEDULER_PER_USER_LIMIT，超出的任务留在队列中等待
+- 排队总数上限 PIPELINE_QUEUE_SIZE，单用户排队上限 SCHEDULER_PER_USER_QUEUE_LIMIT（0 表示不限制），超出时拒绝
+- 按 User.identity_tag 划分优先级通道（student / researcher / pioneer），
+  通道权重见 SCHEDULER_TIER_WEIGHTS
+- 通道之间按加权公平排队（stride 调度：每次派发选择虚拟时间最小的通道，
+  派发后该通道虚拟时间增加 1/weight；空闲通道重新激活时追平全局虚拟时间，避免积攒额度）
+- 通道内按到达顺序派发，跳过已达单用户上限的任务
+
+排队中的任务在数据库中为 pending，派发执行后由流水线首条日志置为 creating。
+排队位置为进程内估算（忽略单用户上限），多 worker 部署时仅对本进程排队的任务可见。
+"""
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Hashable, Optional
+
+from app.core.config import Config
+from app.core.metrics import SCHEDULER_QUEUE_DEPTH, SCHEDULER_QUEUE_WAIT_SECONDS
+from app.services.pipeline_executor import PipelineExecutor, PipelineRejectedError, pipeline_executor
+from app.utils.logger import get_logger
+
+logger = get_logger('task_scheduler')
+
+DEFAULT_LANE = "default"
+
+
+def parse_tier_weights(spec: str) -> Dict[str, float]:
+    """解析 "pioneer:4,researcher:2,student:1" 形式的通道权重"""
+    weights = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, _, value = item.partition(":")
+        try:
+            weight = float(value)
+        except ValueError:
+            logger.warning(f"忽略无效的通道权重配置: {item!r}")
+            continue
+        if weight > 0:
+            weights[name.strip()] = weight
+    weights.setdefault(DEFAULT_LANE, 1.0)
+    return weights
+
+
+@dataclass
+class _Task:
+    key: Hashable
+    user_id: Hashable
+    lane: str
+    fn: Callable
+    args: tuple
+    kwargs: dict
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+@dataclass
+class _Lane:
+    weight: float
+    tasks: deque = field(default_factory=deque)
+    vtime: float = 0.0
+
+
+class FairShareScheduler:
+    """全局 / 单用户并发上限 + 按身份通道加权公平排队"""
+
+    def __init__(
+        self,
+        executor: PipelineExecutor,
+        max_concurrency: int,
+        per_user_limit: int,
+        max_queued: int,
+        tier_weights: Dict[str, float],
+        per_user_queue_limit: int = 0,
+    ):
+        self.executor = executor
+        self.max_concurrency = max(1, min(max_concurrency, executor.max_workers))
+        self.per_user_limit = max(1, per_user_limit)
+        self.max_queued = max(0, max_queued)
+        self.per_user_queue_limit = max(0, per_user_queue_limit)
+        self._lanes = {name: _Lane(weight) for name, weight in tier_weights.items()}
+        self._lock = threading.Lock()
+        self._vtime = 0.0
+        self._queued: Dict[Hashable, _Task] = {}
+        self._running: Dict[Hashable, _Task] = {}
+        self._running_per_user: Dict[Hashable, int] = {}
+        self._closed = False
+
+    def lane_for(self, identity_tag: Optional[str]) -> str:
+        return identity_tag if identity_tag in self._lanes else DEFAULT_LANE
+
+    def is_saturated(self) -> bool:
+        """排队已满（用于在写库前提前拒绝）"""
+        with self._lock:
+            return len(self._queued) >= self.max_queued
+
+    def submit(self, key: Hashable, user_id: Hashable, identity_tag: Optional[str], fn: Callable, *args, **kwargs) -> int:
+        """
+        提交任务
+
+        Args:
+            key: 任务标识（message_id），用于查询排队位置
+            user_id: 用户ID（单用户并发上限）
+            identity_tag: 用户身份（决定优先级通道）
+
+        Returns:
+            int: 排队位置，0 表示已立即派发执行
+
+        Raises:
+            PipelineRejectedError: 排队已满或该用户排队已满
+        """
+        lane_name = self.lane_for(identity_tag)
+        with self._lock:
+            if self._closed:
+                raise PipelineRejectedError("Scheduler is draining")
+            # 任务因单用户上限等待时执行数达不到全局上限，排队数必须单独限制
+            if len(self._queued) >= self.max_queued:
+                raise PipelineRejectedError(
+                    f"Scheduler queue is full ({len(self._running)} running, {len(self._queued)} queued)"
+                )
+            if self.per_user_queue_limit:
+                user_queued = sum(1 for task in self._queued.values() if task.user_id == user_id)
+                if user_queued >= self.per_user_queue_limit:
+                    raise PipelineRejectedError(f"Too many queued tasks for user {user_id} ({user_queued})")
+            lane = self._lanes[lane_name]
+            if not lane.tasks:
+                # 空闲通道重新激活：追平全局虚拟时间
+                lane.vtime = max(lane.vtime, self._vtime)
+            task = _Task(key, user_id, lane_name, fn, args, kwargs)
+            lane.tasks.append(task)
+            self._queued[key] = task
+            SCHEDULER_QUEUE_DEPTH.labels(lane_name).inc()
+            dispatched = self._dispatch_locked()
+            position = 0 if key in self._running else self._position_locked(key)
+
+        self._submit_to_executor(dispatched)
+        if position:
+            logger.info(f"任务进入排队: key={key}, user_id={user_id}, lane={lane_name}, position={position}")
+        return position
+
+    def cancel(self, key: Hashable) -> bool:
+        """将排队中的任务移出队列，返回是否移除（已在执行或不在本进程时返回 False）"""
+        with self._lock:
+            task = self._queued.pop(key, None)
+            if task is None:
+                return False
+            self._lanes[task.lane].tasks.remove(task)
+            SCHEDULER_QUEUE_DEPTH.labels(task.lane).dec()
+        logger.info(f"排队任务已取消: key={key}")
+        return True
+
+    def position(self, key: Hashable) -> Optional[int]:
+        """排队位置（从 1 开始）；执行中返回 0；本进程未知的任务返回 None"""
+        with self._lock:
+            if key in self._running:
+                return 0
+            if key not in self._queued:
+                return None
+            return self._position_locked(key)
+
+    def drain(self) -> list:
+        """停机排空：不再接收新任务，移出全部排队任务并返回其标识（执行中的任务不受影响）"""
+        with self._lock:
+            self._closed = True
+            keys = list(self._queued)
+            for task in self._queued.values():
+                SCHEDULER_QUEUE_DEPTH.labels(task.lane).dec()
+            self._queued.clear()
+            for lane in self._lanes.values():
+                lane.tasks.clear()
+        return keys
+
+    def running_keys(self) -> list:
+        with self._lock:
+            return list(self._running)
+
+    def active_keys(self) -> list:
+        """本进程排队中与执行中的任务标识（用于心跳）"""
+        with self._lock:
+            return list(self._queued) + list(self._running)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "running": len(self._running),
+                "queued": len(self._queued),
+                "lanes": {name: len(lane.tasks) for name, lane in self._lanes.items()},
+            }
+
+    # ==================== 内部实现（调用方持有 _lock） ====================
+
+    def _pick_locked(self) -> Optional[_Task]:
+        """选择下一个可派发任务：虚拟时间最小的通道中，首个未达单用户上限的任务"""
+        candidates = []
+        for name, lane in self._lanes.items():
+            for task in lane.tasks:
+                if self._running_per_user.get(task.user_id, 0) < self.per_user_limit:
+                    candidates.append((lane.vtime, name, task))
+                    break
+        if not candidates:
+            return None
+        _, name, task = min(candidates, key=lambda c: (c[0], c[2].enqueued_at))
+        lane = self._lanes[name]
+        lane.tasks.remove(task)
+        self._vtime = lane.vtime
+        lane.vtime += 1.0 / lane.weight
+        return task
+
+    def _dispatch_locked(self) -> list:
+        dispatched = []
+        while len(self._running) < self.max_concurrency:
+            task = self._pick_locked()
+            if task is None:
+                break
+            del self._queued[task.key]
+            self._running[task.key] = task
+            self._running_per_user[task.user_id] = self._running_per_user.get(task.user_id, 0) + 1
+            SCHEDULER_QUEUE_DEPTH.labels(task.lane).dec()
+            SCHEDULER_QUEUE_WAIT_SECONDS.labels(task.lane).observe(time.perf_counter() - task.enqueued_at)
+            dispatched.append(task)
+        return dispatched
+
+    def _position_locked(self, key: Hashable) -> int:
+        """按通道虚拟时间模拟派发顺序，估算排队位置（忽略单用户上限）"""
+        vtimes = {name: lane.vtime for name, lane in self._lanes.items()}
+        offsets = {name: 0 for name in self._lanes}
+        position = 0
+        while True:
+            active = [name for name, lane in self._lanes.items() if offsets[name] < len(lane.tasks)]
+            if not active:
+                return position
+            name = min(active, key=lambda n: (vtimes[n], self._lanes[n].tasks[offsets[n]].enqueued_at))
+            task = self._lanes[name].tasks[offsets[name]]
+            position += 1
+            if task.key == key:
+                return position
+            offsets[name] += 1
+            vtimes[name] += 1.0 / self._lanes[name].weight
+
+    # ==================== 执行 ====================
+
+    def _submit_to_executor(self, tasks: list):
+        for index, task in enumerate(tasks):
+            try:
+                self.executor.submit(self._run, task)
+            except PipelineRejectedError as e:
+                # 执行器已关闭（进程退出中）：本批剩余任务全部放弃且不再派发，
+                # 任务保持 pending，交由重启后的恢复流程处理
+                failed = tasks[index:]
+                logger.error(f"任务派发失败: keys={[t.key for t in failed]}, error={e}")
+                with self._lock:
+                    for failed_task in failed:
+                        self._finish_locked(failed_task)
+                return
+
+    def _run(self, task: _Task):
+        try:
+            return task.fn(*task.args, **task.kwargs)
+        finally:
+            self._release(task)
+
+    def _release(self, task: _Task):
+        with self._lock:
+            self._finish_locked(task)
+            dispatched = self._dispatch_locked()
+        self._submit_to_executor(dispatched)
+
+    def _finish_locked(self, task: _Task):
+        self._running.pop(task.key, None)
+        remaining = self._running_per_user.get(task.user_id, 1) - 1
+        if remaining > 0:
+            self._running_per_user[task.user_id] = remaining
+        else:
+            self._running_per_user.pop(task.user_id, None)
+
+
+# 进程级调度器
+task_scheduler = FairShareScheduler(
+    executor=pipeline_executor,
+    max_concurrency=Config.SCHEDULER_MAX_CONCURRENCY,
+    per_user_limit=Config.SCHEDULER_PER_USER_LIMIT,
+    max_queued=Config.PIPELINE_QUEUE_SIZE,
+    tier_weights=parse_tier_weights(Config.SCHEDULER_TIER_WEIGHTS),
+    per_user_queue_limit=Config.SCHEDULER_PER_USER_QUEUE_LIMIT,
+)
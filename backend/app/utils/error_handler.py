@@ -14,9 +14,12 @@ class ErrorCode(Enum):
     NOT_FOUND = 404    # 资源不存在
     CONFLICT = 409     # 资源冲突（如用户已注册）
     UNSUPPORTED_MEDIA_TYPE = 415  # 不支持的媒体类型
+    UNPROCESSABLE_ENTITY = 422  # 请求语义错误（如幂等键被用于不同请求）
+    TOO_MANY_REQUESTS = 429  # 请求过于频繁/系统繁忙
 
     # 服务端错误 5xx
     INTERNAL_SERVER_ERROR = 500  # 服务器内部错误
+    SERVICE_UNAVAILABLE = 503  # 服务繁忙/暂不可用
 
     # HTTP 错误
     HTTP_ERROR = 0  # HTTP 错误，使用原始 HTTP 状态码
@@ -142,6 +145,12 @@ class ErrorMessage:
     # 系统相关
     INTERNAL_SERVER_ERROR = "服务器内部错误"
     SERVICE_UNAVAILABLE = "服务不可用"
+    PIPELINE_BUSY = "当前研究任务较多，请稍后重试"
+    TOO_MANY_REQUESTS = "请求过于频繁，请稍后重试"
+    SERVICE_DRAINING = "服务正在重启，请稍后重试"
+    IDEMPOTENCY_KEY_INVALID = "Idempotency-Key 长度不能超过255个字符"
+    IDEMPOTENCY_IN_PROGRESS = "相同的请求正在处理中，请稍后重试"
+    IDEMPOTENCY_KEY_REUSED = "Idempotency-Key 已用于不同的请求参数"
 
     # 通用
     SUCCESS = "成功"
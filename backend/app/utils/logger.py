@@ -1,11 +1,24 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
 import os
+import queue
 import sys
-from datetime import datetime
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from typing import Optional
 
+from app.core.config import Config
+from app.utils.trace_context import TRACE_FIELDS, current_trace_context, bind_trace_context
+
 _logger_instance: Optional[logging.Logger] = None
 _log_dir: Optional[str] = None
+_queue_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
 
 
 class SimpleFormatter(logging.Formatter):
@@ -20,6 +33,10 @@ class SimpleFormatter(logging.Formatter):
         if record.exc_info:
             message += f" | Exception: {record.exc_info[1]}"
 
+        trace_id = getattr(record, 'trace_id', None)
+        if trace_id:
+            message += f" | trace_id={trace_id}"
+
         if level == 'ERROR':
             return f"[ERROR] {timestamp} | {record.filename}:{lineno} | {message}"
         elif level == 'WARNING':
@@ -49,19 +66,62 @@ class ColorFormatter(SimpleFormatter):
         return f"{color}{base}{reset}"
 
 
+class JsonFormatter(logging.Formatter):
+    """
+    结构化 JSON 日志格式器，每条日志一行
+
+    固定字段: ts, level, logger, file, line, message, trace_id, request_id,
+             message_id, step, duration_ms（缺失时为 null），异常时追加 exception
+    """
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "file": record.filename,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        for field in TRACE_FIELDS:
+            payload[field] = getattr(record, field, None)
+        payload["duration_ms"] = getattr(record, 'duration_ms', None)
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TraceContextFilter(logging.Filter):
+    """
+    将 contextvars 中的追踪字段写入 LogRecord
+
+    挂在 handler（异步模式下为 QueueHandler）上，在调用线程执行，
+    通过 extra 显式传入的同名字段优先
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for field, value in current_trace_context().items():
+            if getattr(record, field, None) is None:
+                setattr(record, field, value)
+        return True
+
+
 class _BelowErrorFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
         return record.levelno < logging.ERROR
 
 
 class DailySwitchingFileHandler(logging.Handler):
-    def __init__(self, log_dir: str, for_error: bool = False, encoding: str = 'utf-8'):
+    def __init__(self, log_dir: str, for_error: bool = False, encoding: str = 'utf-8', flush_each: bool = True):
         level = logging.ERROR if for_error else logging.DEBUG
         super().__init__(level=level)
         self.log_dir = log_dir
         self.for_error = for_error
         self.encoding = encoding
+        # 异步模式下由 QueueListener 按批次 flush，单条写入不再 flush
+        self.flush_each = flush_each
         self._current_date = None
+        self._next_rollover = 0.0
         self._stream = None
         self._rollover_if_needed()
 
@@ -74,6 +134,9 @@ class DailySwitchingFileHandler(logging.Handler):
         return os.path.join(self.log_dir, name)
 
     def _rollover_if_needed(self):
+        # 仅在跨过零点时才重新计算日期，避免每条日志都调用 strftime
+        if self._stream is not None and time.time() < self._next_rollover:
+            return
         os.makedirs(self.log_dir or '.', exist_ok=True)
         d = self._date_str()
         if self._current_date != d:
@@ -84,22 +147,29 @@ class DailySwitchingFileHandler(logging.Handler):
                     pass
             self._current_date = d
             self._stream = open(self._filepath(), 'a', encoding=self.encoding)
+        tomorrow = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        self._next_rollover = tomorrow.timestamp()
 
     def emit(self, record: logging.LogRecord):
         try:
             self._rollover_if_needed()
-            if self.for_error:
-                if record.levelno >= logging.ERROR:
-                    msg = self.format(record)
-                    self._stream.write(msg + "\n")
-                    self._stream.flush()
-            else:
-                msg = self.format(record)
-                self._stream.write(msg + "\n")
+            if self.for_error and record.levelno < logging.ERROR:
+                return
+            msg = self.format(record)
+            self._stream.write(msg + "\n")
+            if self.flush_each:
                 self._stream.flush()
         except Exception:
             self.handleError(record)
 
+    def flush(self):
+        self.acquire()
+        try:
+            if self._stream:
+                self._stream.flush()
+        finally:
+            self.release()
+
     def close(self):
         try:
             if self._stream:
@@ -108,80 +178,344 @@ class DailySwitchingFileHandler(logging.Handler):
             super().close()
 
 
-def _current_trace_id():
-    """获取当前追踪ID（FastAPI中从contextvars获取）"""
-    try:
-        from contextvars import ContextVar
-        # FastAPI使用contextvars存储请求上下文
-        # 这里暂时返回None，因为FastAPI的trace_id在中间件中处理
-        return None
-    except Exception:
-        return None
+TASK_LOGGER_NAME = 'research_task'
+
+
+class TaskLogFormatter(logging.Formatter):
+    """任务日志格式：[时间] [级别] [msg:消息ID] 内容"""
+
+    def __init__(self):
+        super().__init__('[%(asctime)s] [%(levelname)s] %(message)s', '%Y-%m-%d %H:%M:%S')
 
+    def formatMessage(self, record):
+        # 不修改共享的 LogRecord，其他 handler（如 JSON）仍看到缺失的 message_id
+        message_id = getattr(record, 'message_id', None)
+        return f"[{record.asctime}] [{record.levelname}] [msg:{'-' if message_id is None else message_id}] {record.message}"
+
+
+class TaskLogSinkHandler(logging.Handler):
+    """
+    研究任务共享日志汇
+
+    替代每个任务单独创建 FileHandler：所有任务日志按日期分目录，
+    再按 message_id 取模写入固定数量的分片文件
+        {log_dir}/tasks/YYYYMMDD/tasks_{shard:02d}.log
+    文件句柄与 inode 数量只与分片数相关，不随任务数增长
+    仅处理 research_task 日志器的记录，可直接挂在根日志器（或异步监听线程）上
+    """
 
-class TraceContextLogger(logging.Logger):
-    def _inject(self, msg):
-        tid = _current_trace_id()
-        if not tid:
-            return msg
+    def __init__(self, log_dir: str, shards: int = 16, encoding: str = 'utf-8', flush_each: bool = True):
+        super().__init__(level=logging.DEBUG)
+        self.base_dir = os.path.join(log_dir, 'tasks')
+        self.shards = max(1, shards)
+        self.encoding = encoding
+        self.flush_each = flush_each
+        self._current_date = None
+        self._next_rollover = 0.0
+        self._streams = {}
+        self.setFormatter(TaskLogFormatter())
+        self.addFilter(lambda record: record.name == TASK_LOGGER_NAME or record.name.startswith(TASK_LOGGER_NAME + '.'))
+
+    def shard_of(self, message_id) -> int:
+        try:
+            return int(message_id) % self.shards
+        except (TypeError, ValueError):
+            return 0
+
+    def path_for(self, message_id, date_str: Optional[str] = None) -> str:
+        """获取某个任务日志所在的分片文件路径"""
+        date_str = date_str or datetime.now().strftime('%Y%m%d')
+        return os.path.join(self.base_dir, date_str, f"tasks_{self.shard_of(message_id):02d}.log")
+
+    def _close_streams(self):
+        for stream in self._streams.values():
+            try:
+                stream.close()
+            except Exception:
+                pass
+        self._streams = {}
+
+    def _stream_for(self, message_id):
+        if time.time() >= self._next_rollover:
+            d = datetime.now().strftime('%Y%m%d')
+            if self._current_date != d:
+                self._close_streams()
+                self._current_date = d
+            tomorrow = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+            self._next_rollover = tomorrow.timestamp()
+        shard = self.shard_of(message_id)
+        stream = self._streams.get(shard)
+        if stream is None:
+            path = self.path_for(message_id, self._current_date)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            stream = open(path, 'a', encoding=self.encoding)
+            self._streams[shard] = stream
+        return stream
+
+    def emit(self, record: logging.LogRecord):
         try:
-            if isinstance(msg, str):
-                return f"{msg} | trace_id={tid}"
-            return msg
+            msg = self.format(record)
+            stream = self._stream_for(getattr(record, 'message_id', None))
+            stream.write(msg + "\n")
+            if self.flush_each:
+                stream.flush()
         except Exception:
-            return msg
+            self.handleError(record)
 
-    def _log(self, level, msg, args, exc_info=None, extra=None, stack_info=False, stacklevel=1, **kwargs):
-        msg = self._inject(msg)
-        super()._log(level, msg, args, exc_info=exc_info, extra=extra, stack_info=stack_info, stacklevel=stacklevel+1, **kwargs)
+    def flush(self):
+        self.acquire()
+        try:
+            for stream in self._streams.values():
+                stream.flush()
+        finally:
+            self.release()
 
+    def close(self):
+        try:
+            self._close_streams()
+        finally:
+            super().close()
+
+
+def get_task_logger(message_id) -> logging.LoggerAdapter:
+    """
+    获取研究任务日志器
+
+    所有任务共用同一个 research_task 日志器，通过 LoggerAdapter 附加 message_id，
+    不会为每个任务注册新的 Logger 对象
+    """
+    setup_logger()
+    return logging.LoggerAdapter(logging.getLogger(TASK_LOGGER_NAME), {"message_id": message_id})
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    有界队列日志处理器
+
+    调用线程只负责入队，格式化与磁盘 I/O 交给 QueueListener 线程
+    队列满时按 overflow 策略处理：
+        - drop_new:    丢弃当前日志（默认，调用方永不阻塞）
+        - drop_oldest: 丢弃队首最旧的日志后重试入队
+        - block:       阻塞等待最多 block_timeout 秒，超时后丢弃
+    """
+
+    OVERFLOW_POLICIES = ('drop_new', 'drop_oldest', 'block')
+
+    def __init__(self, log_queue: queue.Queue, overflow: str = 'drop_new', block_timeout: float = 1.0):
+        super().__init__(log_queue)
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unsupported log queue overflow policy: {overflow}")
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只合并 msg/args，保留 exc_info 交给监听线程中的格式器处理
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            if self.overflow == 'block':
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            dropped = self._evict_and_put(record) if self.overflow == 'drop_oldest' else 1
+            if dropped:
+                with self._dropped_lock:
+                    self.dropped += dropped
+
+    def _evict_and_put(self, record: logging.LogRecord) -> int:
+        """丢弃队首记录后重试入队，返回实际丢失的记录数（并发时腾出的位置可能被其他线程抢先占用）"""
+        dropped = 0
+        try:
+            self.queue.get_nowait()
+            dropped += 1
+            # 被丢弃的记录不会再交给监听线程，需在这里结束其计数，否则 queue.join() 永远等待
+            if hasattr(self.queue, 'task_done'):
+                self.queue.task_done()
+        except queue.Empty:
+            pass
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped += 1
+        return dropped
+
+
+class BatchingQueueListener(logging.handlers.QueueListener):
+    """
+    批量消费的日志监听线程
 
-def _init_logger(log_dir: str = None, log_level: str = 'INFO', max_bytes: int = 10 * 1024 * 1024, backup_count: int = 30):
-    global _logger_instance, _log_dir
+    每次唤醒后尽可能取出队列中已有的日志（最多 batch_size 条），
+    全部交给 handler 处理后统一 flush 一次
+    """
+
+    def __init__(self, log_queue: queue.Queue, *handlers, respect_handler_level: bool = True, batch_size: int = 512):
+        super().__init__(log_queue, *handlers, respect_handler_level=respect_handler_level)
+        self.batch_size = batch_size
+
+    def enqueue_sentinel(self):
+        # 队列可能已满，sentinel 必须阻塞入队
+        self.queue.put(self._sentinel)
+
+    def _flush_handlers(self):
+        for handler in self.handlers:
+            try:
+                handler.flush()
+            except Exception:
+                pass
+
+    def _monitor(self):
+        q = self.queue
+        has_task_done = hasattr(q, 'task_done')
+        while True:
+            record = self.dequeue(True)
+            batch = [record]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+
+            stop = False
+            for record in batch:
+                if record is self._sentinel:
+                    stop = True
+                else:
+                    self.handle(record)
+                if has_task_done:
+                    q.task_done()
+            self._flush_handlers()
+            if stop:
+                break
+
+
+@contextmanager
+def log_step(step_logger, step: str):
+    """
+    记录流水线步骤耗时
+
+    在上下文中绑定 step，结束时输出一条带 duration_ms 的日志（失败时为 ERROR 级别）
+    """
+    start = time.perf_counter()
+    with bind_trace_context(step=step):
+        try:
+            yield
+        except Exception:
+            duration_ms = int((time.perf_counter() - start) * 1000)
+            step_logger.error(f"Step {step} failed after {duration_ms} ms", extra={"duration_ms": duration_ms})
+            raise
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        step_logger.info(f"Step {step} finished in {duration_ms} ms", extra={"duration_ms": duration_ms})
+
+
+def _build_formatter(log_format: str) -> logging.Formatter:
+    if log_format == 'json':
+        return JsonFormatter()
+    return SimpleFormatter()
+
+
+def _init_logger(log_dir: str = None, log_level: str = 'INFO', max_bytes: int = 10 * 1024 * 1024, backup_count: int = 30,
+                 async_mode: bool = False, queue_size: int = 10000, overflow: str = 'drop_new', log_format: str = 'text',
+                 task_log_shards: int = 16):
+    global _logger_instance, _log_dir, _queue_listener, _queue_handler
     if _logger_instance is not None:
         return _logger_instance
     _log_dir = log_dir
     if log_dir and not os.path.exists(log_dir):
         os.makedirs(log_dir, exist_ok=True)
 
-    logging.setLoggerClass(TraceContextLogger)
-
     root_logger = logging.getLogger()
     root_logger.setLevel(logging.DEBUG)
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
 
+    logging.getLogger(TASK_LOGGER_NAME).setLevel(logging.INFO)
+
+    handlers = []
+
     # 控制台处理器
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setLevel(getattr(logging, log_level.upper()))
-    console_handler.setFormatter(SimpleFormatter())
-    root_logger.addHandler(console_handler)
+    console_handler.setFormatter(_build_formatter(log_format))
+    handlers.append(console_handler)
 
     if log_dir:
         # 日常日志文件 - 记录所有级别
-        info_handler = DailySwitchingFileHandler(log_dir=log_dir, for_error=False)
+        info_handler = DailySwitchingFileHandler(log_dir=log_dir, for_error=False, flush_each=not async_mode)
         info_handler.setLevel(logging.DEBUG)
-        info_handler.setFormatter(SimpleFormatter())
-        root_logger.addHandler(info_handler)
+        info_handler.setFormatter(_build_formatter(log_format))
+        handlers.append(info_handler)
 
         # 错误日志文件 - 只记录ERROR及以上
-        error_handler = DailySwitchingFileHandler(log_dir=log_dir, for_error=True)
+        error_handler = DailySwitchingFileHandler(log_dir=log_dir, for_error=True, flush_each=not async_mode)
         error_handler.setLevel(logging.ERROR)
-        error_handler.setFormatter(SimpleFormatter())
-        root_logger.addHandler(error_handler)
+        error_handler.setFormatter(_build_formatter(log_format))
+        handlers.append(error_handler)
+
+        # 研究任务日志 - 共享分片文件
+        task_handler = TaskLogSinkHandler(log_dir=log_dir, shards=task_log_shards, flush_each=not async_mode)
+        handlers.append(task_handler)
+
+    if async_mode:
+        # 异步模式：调用线程只入队，所有 handler 在监听线程中执行
+        log_queue = queue.Queue(maxsize=queue_size)
+        _queue_handler = BoundedQueueHandler(log_queue, overflow=overflow)
+        # 上下文字段必须在调用线程读取，监听线程中 contextvars 已不可见
+        _queue_handler.addFilter(TraceContextFilter())
+        _queue_listener = BatchingQueueListener(log_queue, *handlers, respect_handler_level=True)
+        _queue_listener.start()
+        atexit.register(shutdown_logging)
+        root_logger.addHandler(_queue_handler)
+    else:
+        for handler in handlers:
+            handler.addFilter(TraceContextFilter())
+            root_logger.addHandler(handler)
 
     _logger_instance = root_logger
     return _logger_instance
 
 
+def shutdown_logging():
+    """停止异步日志监听线程，确保队列中剩余日志写入磁盘"""
+    global _queue_listener
+    listener = _queue_listener
+    if listener is None:
+        return
+    _queue_listener = None
+    try:
+        listener.stop()
+    except Exception:
+        pass
+
+
+def get_logging_stats() -> dict:
+    """获取异步日志队列状态"""
+    if _queue_handler is None:
+        return {"async": False}
+    return {
+        "async": True,
+        "queue_size": _queue_handler.queue.qsize(),
+        "queue_maxsize": _queue_handler.queue.maxsize,
+        "overflow": _queue_handler.overflow,
+        "dropped": _queue_handler.dropped,
+    }
+
+
 def setup_logger(name: str = None, level: str = 'INFO') -> logging.Logger:
     global _logger_instance
     if _logger_instance is None:
         base_dir = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
-        log_dir = os.path.join(base_dir, "logs")
-        log_max_bytes = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
-        log_backup_count = int(os.getenv('LOG_BACKUP_COUNT', '30'))
-        _init_logger(log_dir=log_dir, log_level=level, max_bytes=log_max_bytes, backup_count=log_backup_count)
+        log_dir = Config.LOG_DIR or os.path.join(base_dir, "logs")
+        _init_logger(log_dir=log_dir, log_level=level, max_bytes=int(Config.LOG_MAX_BYTES),
+                     backup_count=int(Config.LOG_BACKUP_COUNT), async_mode=Config.LOG_ASYNC,
+                     queue_size=Config.LOG_QUEUE_SIZE, overflow=Config.LOG_QUEUE_OVERFLOW,
+                     log_format=Config.LOG_FORMAT, task_log_shards=Config.TASK_LOG_SHARDS)
     if name:
         return logging.getLogger(name)
     else:
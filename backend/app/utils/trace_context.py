@@ -0,0 +1,62 @@
+"""
+请求追踪上下文
+Request Trace Context (contextvars)
+
+中间件在请求入口写入 request_id / trace_id，同一请求内的协程与
+复制了上下文的线程均可读取，无需依赖 request.state 透传
+后台任务通过 bind_trace_context 重新绑定 trace_id，并附加 message_id / step
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+trace_id_var: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+message_id_var: ContextVar[Optional[int]] = ContextVar("message_id", default=None)
+step_var: ContextVar[Optional[str]] = ContextVar("step", default=None)
+
+_CONTEXT_VARS = {
+    "request_id": request_id_var,
+    "trace_id": trace_id_var,
+    "message_id": message_id_var,
+    "step": step_var,
+}
+
+# 日志记录中固定输出的上下文字段
+TRACE_FIELDS = tuple(_CONTEXT_VARS.keys())
+
+
+def get_request_id() -> Optional[str]:
+    """获取当前请求ID"""
+    return request_id_var.get()
+
+
+def get_trace_id() -> Optional[str]:
+    """获取当前追踪ID"""
+    return trace_id_var.get()
+
+
+def current_trace_context() -> dict:
+    """获取当前上下文中的全部追踪字段"""
+    return {name: var.get() for name, var in _CONTEXT_VARS.items()}
+
+
+@contextmanager
+def bind_trace_context(**fields):
+    """
+    在当前上下文中临时绑定追踪字段，退出时还原
+
+    Args:
+        **fields: request_id / trace_id / message_id / step，值为 None 的字段忽略
+    """
+    tokens = []
+    try:
+        for name, value in fields.items():
+            if name not in _CONTEXT_VARS:
+                raise ValueError(f"Unknown trace field: {name}")
+            if value is not None:
+                tokens.append((_CONTEXT_VARS[name], _CONTEXT_VARS[name].set(value)))
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
@@ -61,11 +61,20 @@ CREATE TABLE IF NOT EXISTS research_chat_process_infos (
   process_info JSON NULL,
   extra_info JSON NULL,
   creation_status ENUM('pending','creating','created','failed') NOT NULL DEFAULT 'pending',
+  -- 进行中任务的会话ID（否则为 NULL），配合唯一索引保证同一会话最多一个进行中任务
+  active_session_id BIGINT UNSIGNED AS (CASE WHEN creation_status IN ('pending','creating') THEN session_id END) STORED,
   created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
   updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  UNIQUE KEY uq_rc_active_session (active_session_id),
   INDEX idx_rc_message (message_id),
   INDEX idx_rc_session (session_id),
   INDEX idx_rc_user (user_id),
   INDEX idx_rc_email (email),
   CONSTRAINT fk_rc_message FOREIGN KEY (message_id) REFERENCES research_chat_messages(id) ON DELETE CASCADE ON UPDATE RESTRICT
-) ENGINE=InnoDB CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
\ No newline at end of file
+) ENGINE=InnoDB CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
+
+-- 已有数据库升级（执行前先确认同一会话没有多个进行中任务）：
+-- ALTER TABLE research_chat_process_infos
+--   ADD COLUMN active_session_id BIGINT UNSIGNED
+--     AS (CASE WHEN creation_status IN ('pending','creating') THEN session_id END) STORED AFTER creation_status,
+--   ADD UNIQUE KEY uq_rc_active_session (active_session_id);
@@ -0,0 +1,21 @@
+"""
+Gunicorn 配置
+配合命令行参数使用（见 deploy/start_services.sh），这里只放服务钩子
+"""
+import os
+import shutil
+
+
+def on_starting(server):
+    """主进程启动：清空上一轮遗留的多进程指标文件"""
+    metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """worker 退出：标记其 livesum 类指标失效"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,263 @@
+"""
+研究流水线回放基准测试
+Deterministic pipeline benchmark on recorded LLM / Semantic Scholar fixtures
+
+在 SQLite 内存库上重复执行 _background_process_prompt_and_update，外部调用全部由
+app/services/llm_fixtures.py 回放（默认零延迟），统计每个步骤的：
+- wall_ms: 墙钟耗时
+- cpu_ms:  线程 CPU 耗时（流水线在当前线程同步执行）
+- db_writes / db_statements: INSERT/UPDATE/DELETE 语句数 / 全部语句数
+步骤之外（任务开始、保存结果等）的开销计入 "_other"
+
+录制夹具（指向真实服务或 tests/mock/mock_servers.py）:
+    cd backend
+    python tests/benchmark/bench_pipeline_replay.py --record
+
+回放并记录历史（每次提交后运行，对比上一条记录）:
+    python tests/benchmark/bench_pipeline_replay.py --runs 20 --history tests/benchmark/.pipeline_history.jsonl
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..", "..")))
+
+from sqlalchemy import BigInteger, create_engine, event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.constants.task_status import CreationStatus
+from app.entity.research_chat import Base, ResearchChatMessage, ResearchChatProcessInfo, ResearchChatSession
+from app.routes import chat_routes
+from app.services import llm_fixtures
+
+DEFAULT_CONTENT = "graph neural networks for drug discovery"
+OTHER = "_other"
+
+
+@compiles(BigInteger, "sqlite")
+def _compile_big_integer_sqlite(type_, compiler, **kw):
+    # SQLite 仅对 INTEGER PRIMARY KEY 自增
+    return "INTEGER"
+
+
+class StepProfiler:
+    """按步骤聚合墙钟、CPU 与 SQL 语句数"""
+
+    def __init__(self):
+        self.current = OTHER
+        self.stats = defaultdict(lambda: defaultdict(float))
+
+    @contextmanager
+    def step(self, name: str):
+        previous = self.current
+        self.current = name
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.stats[name]["wall_ms"] += (time.perf_counter() - wall_start) * 1000
+            self.stats[name]["cpu_ms"] += (time.thread_time() - cpu_start) * 1000
+            self.current = previous
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        verb = statement.lstrip().split(" ", 1)[0].upper()
+        stats = self.stats[self.current]
+        stats["db_statements"] += 1
+        if verb in ("INSERT", "UPDATE", "DELETE"):
+            stats["db_writes"] += 1
+
+
+def _build_sessionmaker(profiler: StepProfiler):
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(engine)
+    event.listen(engine, "before_cursor_execute", profiler.on_execute)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _seed_task(Session, content: str):
+    with Session() as db:
+        session = ResearchChatSession(page_session_id="bench", user_id=1, email="bench@example.com", session_name="bench")
+        db.add(session)
+        db.flush()
+        message = ResearchChatMessage(session_id=session.id, user_id=1, email="bench@example.com", content=content)
+        db.add(message)
+        db.flush()
+        db.add(ResearchChatProcessInfo(
+            session_id=session.id, message_id=message.id, user_id=1, email="bench@example.com",
+            creation_status=CreationStatus.CREATING, process_info={"logs": []},
+        ))
+        db.commit()
+        return message.id, session.id
+
+
+def _status(Session, message_id: int) -> str:
+    with Session() as db:
+        proc = db.query(ResearchChatProcessInfo).filter_by(message_id=message_id).one()
+        return proc.creation_status
+
+
+def run_once(content: str, locale: str, quiet: bool = True) -> dict:
+    """执行一次完整流水线，返回 {步骤: 指标} 与总耗时"""
+    profiler = StepProfiler()
+    Session = _build_sessionmaker(profiler)
+    message_id, session_db_id = _seed_task(Session, content)
+    profiler.stats.clear()
+
+    original_session, original_track = chat_routes.SessionLocal, chat_routes.track_pipeline_step
+
+    @contextmanager
+    def track(step):
+        with original_track(step), profiler.step(step):
+            yield
+
+    chat_routes.SessionLocal = Session
+    chat_routes.track_pipeline_step = track
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        sink = io.StringIO() if quiet else sys.stdout
+        with contextlib.redirect_stdout(sink):
+            chat_routes._background_process_prompt_and_update(
+                message_id, session_db_id, 1, "bench@example.com", content, locale
+            )
+    finally:
+        chat_routes.SessionLocal = original_session
+        chat_routes.track_pipeline_step = original_track
+
+    wall_ms = (time.perf_counter() - wall_start) * 1000
+    cpu_ms = (time.thread_time() - cpu_start) * 1000
+
+    status = _status(Session, message_id)
+    steps = {name: dict(values) for name, values in profiler.stats.items()}
+    other = steps.setdefault(OTHER, {})
+    other.setdefault("db_writes", 0)
+    other.setdefault("db_statements", 0)
+    # 步骤之外的耗时取总耗时与各步骤之和的差值
+    other["wall_ms"] = wall_ms - sum(v.get("wall_ms", 0.0) for k, v in steps.items() if k != OTHER)
+    other["cpu_ms"] = cpu_ms - sum(v.get("cpu_ms", 0.0) for k, v in steps.items() if k != OTHER)
+    return {"status": status, "wall_ms": wall_ms, "cpu_ms": cpu_ms, "steps": steps}
+
+
+def aggregate(runs: list) -> dict:
+    """各指标取多次运行的中位数"""
+    result = {
+        "runs": len(runs),
+        "failed_runs": sum(1 for r in runs if r["status"] != CreationStatus.CREATED),
+        "wall_ms": statistics.median(r["wall_ms"] for r in runs),
+        "cpu_ms": statistics.median(r["cpu_ms"] for r in runs),
+        "steps": {},
+    }
+    step_names = sorted({name for r in runs for name in r["steps"]})
+    for name in step_names:
+        metrics = sorted({m for r in runs for m in r["steps"].get(name, {})})
+        result["steps"][name] = {
+            m: round(statistics.median(r["steps"].get(name, {}).get(m, 0.0) for r in runs), 3)
+            for m in metrics
+        }
+    return result
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def _last_history_entry(path: str):
+    if not path or not os.path.exists(path):
+        return None
+    last = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                last = json.loads(line)
+    return last
+
+
+def print_report(result: dict, previous: dict = None):
+    def delta(cur, prev):
+        if prev is None or prev == 0:
+            return ""
+        return f" ({(cur - prev) / prev * 100:+.1f}%)"
+
+    prev_steps = (previous or {}).get("steps", {})
+    print(f"runs={result['runs']} failed={result['failed_runs']} "
+          f"wall_ms={result['wall_ms']:.2f}{delta(result['wall_ms'], (previous or {}).get('wall_ms'))} "
+          f"cpu_ms={result['cpu_ms']:.2f}{delta(result['cpu_ms'], (previous or {}).get('cpu_ms'))}")
+    if previous:
+        print(f"compared with {previous.get('commit')} ({previous.get('timestamp')})")
+    print(f"{'step':<12} {'wall_ms':>18} {'cpu_ms':>18} {'db_writes':>10} {'db_stmts':>10}")
+    for name, stats in result["steps"].items():
+        prev = prev_steps.get(name, {})
+        print(f"{name:<12} "
+              f"{stats.get('wall_ms', 0):>9.2f}{delta(stats.get('wall_ms', 0), prev.get('wall_ms')):<9} "
+              f"{stats.get('cpu_ms', 0):>9.2f}{delta(stats.get('cpu_ms', 0), prev.get('cpu_ms')):<9} "
+              f"{stats.get('db_writes', 0):>10.0f} {stats.get('db_statements', 0):>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay-based pipeline benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--content", default=DEFAULT_CONTENT)
+    parser.add_argument("--locale", default="en")
+    parser.add_argument("--fixtures", default=None, help="夹具目录，默认 backend/tests/fixtures/replay")
+    parser.add_argument("--latency", choices=(llm_fixtures.LATENCY_ZERO, llm_fixtures.LATENCY_RECORDED),
+                        default=llm_fixtures.LATENCY_ZERO)
+    parser.add_argument("--record", action="store_true", help="调用已配置的真实/模拟服务录制夹具后退出")
+    parser.add_argument("--output", default=None, help="将本次结果写入 JSON 文件")
+    parser.add_argument("--history", default=None, help="追加到 JSONL 历史文件，并与上一条记录对比")
+    parser.add_argument("--with-logging", action="store_true", help="保留 INFO 级别日志（默认关闭以免干扰计时）")
+    args = parser.parse_args()
+
+    if not args.with_logging:
+        logging.disable(logging.INFO)
+
+    if args.record:
+        llm_fixtures.set_fixture_store(llm_fixtures.FixtureStore(llm_fixtures.MODE_RECORD, args.fixtures))
+        result = run_once(args.content, args.locale, quiet=False)
+        print(f"recorded fixtures: status={result['status']} wall_ms={result['wall_ms']:.0f}")
+        return
+
+    llm_fixtures.set_fixture_store(
+        llm_fixtures.FixtureStore(llm_fixtures.MODE_REPLAY, args.fixtures, latency=args.latency)
+    )
+    for _ in range(args.warmup):
+        run_once(args.content, args.locale)
+    runs = [run_once(args.content, args.locale) for _ in range(args.runs)]
+    result = aggregate(runs)
+    result.update({"commit": _git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "latency": args.latency})
+
+    previous = _last_history_entry(args.history)
+    print_report(result, previous)
+    if result["failed_runs"]:
+        print("WARNING: some runs failed (missing fixtures? run with --record first)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.history:
+        with open(args.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+请求追踪中间件开销基准测试
+Request tracing middleware overhead benchmark
+
+对比三种配置下单请求的平均耗时（进程内直接调用 ASGI 应用，不经过网络）：
+- none:   不挂载追踪中间件
+- legacy: 原 @app.middleware("http")（BaseHTTPMiddleware）实现
+- asgi:   RequestTracingMiddleware 纯 ASGI 实现
+
+用法:
+    cd backend && python tests/benchmark/bench_request_tracing.py --requests 5000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..", "..")))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from app.core.middleware import RequestTracingMiddleware
+from app.utils.logger import get_logger
+
+logger = get_logger('main')
+
+
+def _legacy_middleware(app: FastAPI):
+    """基线：迁移前的 BaseHTTPMiddleware 实现"""
+    @app.middleware("http")
+    async def add_process_time_header(request: Request, call_next):
+        start_time = time.time()
+        request_id = request.headers.get('X-Request-Id') or request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        trace_id = request.headers.get('X-Trace-Id') or request.headers.get('X-Trace-ID') or request_id
+        request.state.request_id = request_id
+        request.state.trace_id = trace_id
+        request.state.start_time = start_time
+        response = await call_next(request)
+        response.headers["X-Request-Id"] = request_id
+        response.headers["X-Trace-Id"] = trace_id
+        response.headers["X-Process-Time"] = str(time.time() - start_time)
+        if not any(path in request.url.path for path in ['/docs', '/redoc', '/openapi.json', '/health']):
+            duration_ms = int((time.time() - start_time) * 1000)
+            logger.info(
+                f"event: {request.method}, path: {request.url.path}, "
+                f"status: {response.status_code}, duration_ms: {duration_ms}"
+            )
+        return response
+
+
+def build_app(variant: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"code": 200, "message": "ok"}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(10):
+                yield f"chunk-{i}\n".encode()
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    if variant == "legacy":
+        _legacy_middleware(app)
+    elif variant == "asgi":
+        app.add_middleware(RequestTracingMiddleware)
+    return app
+
+
+async def _call(app, path: str):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 12345),
+        "server": ("bench", 80),
+    }
+
+    request_sent = False
+    response_done = asyncio.Event()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # 模拟客户端收完响应后断开（StreamingResponse 会监听断开事件）
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and not message.get("more_body", False):
+            response_done.set()
+
+    await app(scope, receive, send)
+
+
+async def run_variant(variant: str, path: str, n: int, warmup: int) -> float:
+    app = build_app(variant)
+    # 首次调用会构建中间件栈，计入预热
+    for _ in range(warmup):
+        await _call(app, path)
+    start = time.perf_counter()
+    for _ in range(n):
+        await _call(app, path)
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000, help="每种配置的请求数")
+    parser.add_argument("--warmup", type=int, default=200, help="预热请求数")
+    parser.add_argument("--with-logging", action="store_true", help="保留访问日志输出（默认关闭以单独衡量中间件开销）")
+    args = parser.parse_args()
+
+    if not args.with_logging:
+        logging.disable(logging.INFO)
+
+    for path in ("/ping", "/stream"):
+        results = {}
+        for variant in ("none", "legacy", "asgi"):
+            results[variant] = asyncio.run(run_variant(variant, path, args.requests, args.warmup))
+        base = results["none"]
+        print(f"== {path} ({args.requests} requests) ==")
+        for variant, us in results.items():
+            print(f"  {variant:<7} {us:8.1f} us/req   overhead {us - base:+8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+WebSocket 扇出基准与连接规模测试
+WebSocket fan-out benchmark for /ws/status/{message_id}
+
+在子进程中启动完整应用（create_app，含中间件与全部路由），数据库替换为 SQLite 文件库，
+预置 N 个处于 creating 状态的任务（不会结束，连接保持轮询）。客户端逐级建立连接
+（例如 1000 → 5000 → 10000），每一级保持一段时间后采样：
+- 握手耗时 p50/p95/p99/max（包含 authenticate_websocket 与 validate_message_exists 依赖）
+- 服务端 RSS 与每连接内存增量
+- 事件循环延迟（服务端每 100ms 的调度偏差）p50/p99/max
+- 数据库查询 QPS（SQLAlchemy before_cursor_execute 计数）
+
+用法:
+    cd backend
+    python tests/benchmark/bench_websocket_fanout.py --levels 1000,5000,10000 --hold 20
+    python tests/benchmark/bench_websocket_fanout.py --levels 200 --hold 5 --poll-interval 1 --output /tmp/ws.json
+
+注意：10k 连接需要足够的文件描述符，脚本会把软限制提升到硬限制（ulimit -Hn）。
+"""
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(__file__)
+BACKEND_DIR = os.path.abspath(os.path.join(HERE, "..", ".."))
+sys.path.insert(0, BACKEND_DIR)
+
+WS_PATH = "/digital_twin/research_chat/ws/status/{message_id}"
+STATS_PATH = "/bench/stats"
+LAG_INTERVAL = 0.1
+
+
+def _raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # macOS 上 ru_maxrss 单位为字节，Linux 为 KB；这里只作为兜底（峰值）
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round((len(ordered) - 1) * q / 100.0))))
+    return ordered[index]
+
+
+# ===== 服务端（子进程） =====
+
+def _seed_database(db_path: str, tasks: int):
+    from sqlalchemy import BigInteger, create_engine, insert
+    from sqlalchemy.ext.compiler import compiles
+
+    from app.entity.research_chat import Base, ResearchChatMessage, ResearchChatProcessInfo, ResearchChatSession
+
+    @compiles(BigInteger, "sqlite")
+    def _compile_big_integer_sqlite(type_, compiler, **kw):
+        return "INTEGER"
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    logs = {"logs": [f"[2025-01-01 08:00:{i:02d}] step log line {i}" for i in range(8)]}
+    with engine.begin() as conn:
+        conn.execute(insert(ResearchChatSession), [
+            {"id": 1, "page_session_id": "bench", "user_id": 1, "email": "bench@example.com", "is_active": True}
+        ])
+        conn.execute(insert(ResearchChatMessage), [
+            {"id": i, "session_id": 1, "user_id": 1, "email": "bench@example.com", "content": "bench"}
+            for i in range(1, tasks + 1)
+        ])
+        conn.execute(insert(ResearchChatProcessInfo), [
+            {"session_id": 1, "message_id": i, "user_id": 1, "email": "bench@example.com",
+             "creation_status": "creating", "process_info": logs}
+            for i in range(1, tasks + 1)
+        ])
+    engine.dispose()
+
+
+def serve(args):
+    os.environ["WS_POLL_INTERVAL_SECONDS"] = str(args.poll_interval)
+    _raise_fd_limit()
+    if not args.with_logging:
+        logging.disable(logging.INFO)
+
+    from sqlalchemy import create_engine, event
+    from sqlalchemy.orm import sessionmaker
+
+    from app.main import create_app
+    from app.routes import websocket_routes
+
+    engine = create_engine(
+        f"sqlite:///{args.db}",
+        connect_args={"check_same_thread": False},
+        pool_size=20,
+        max_overflow=40,
+    )
+    queries = {"count": 0}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(*_):
+        queries["count"] += 1
+
+    websocket_routes.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    app = create_app()
+    lag_samples = collections.deque(maxlen=100000)
+
+    async def monitor_loop_lag():
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + LAG_INTERVAL
+            await asyncio.sleep(LAG_INTERVAL)
+            lag_samples.append(max(0.0, loop.time() - expected))
+
+    @app.get(STATS_PATH)
+    async def stats(reset: bool = False):
+        from prometheus_client import REGISTRY
+
+        # 应用使用 lifespan，startup 事件不会触发；首次抓取时启动延迟监控
+        if getattr(app.state, "lag_task", None) is None:
+            app.state.lag_task = asyncio.create_task(monitor_loop_lag())
+        lags = list(lag_samples)
+        if reset:
+            lag_samples.clear()
+        return {
+            "rss_bytes": _rss_bytes(),
+            "db_queries": queries["count"],
+            "active_ws": REGISTRY.get_sample_value("research_chat_websocket_active_connections"),
+            "loop_lag_ms": {
+                "samples": len(lags),
+                "p50": (_percentile(lags, 50) or 0) * 1000,
+                "p99": (_percentile(lags, 99) or 0) * 1000,
+                "max": max(lags, default=0) * 1000,
+            },
+            "time": time.time(),
+        }
+
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_config=None, log_level="warning", backlog=4096)
+
+
+# ===== 客户端 =====
+
+class FanoutClient:
+    def __init__(self, port: int, token: str, tasks: int):
+        self.base = f"127.0.0.1:{port}"
+        self.token = token
+        self.tasks = tasks
+        self.connections = []
+        self.readers = []
+        self.messages = 0
+        self.failures = collections.Counter()
+
+    async def stats(self, reset: bool = False) -> dict:
+        import requests
+
+        url = f"http://{self.base}{STATS_PATH}?reset={'true' if reset else 'false'}"
+        return await asyncio.to_thread(lambda: requests.get(url, timeout=30).json())
+
+    async def _reader(self, ws):
+        try:
+            async for _ in ws:
+                self.messages += 1
+        except Exception:
+            pass
+
+    async def _open_one(self, index: int, semaphore: asyncio.Semaphore, handshakes: list):
+        import websockets
+
+        message_id = index % self.tasks + 1
+        url = f"ws://{self.base}{WS_PATH.format(message_id=message_id)}?token={self.token}"
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ws = await websockets.connect(url, open_timeout=120, ping_interval=None, close_timeout=1)
+            except Exception as e:
+                self.failures[type(e).__name__] += 1
+                return
+            handshakes.append(time.perf_counter() - start)
+        self.connections.append(ws)
+        self.readers.append(asyncio.create_task(self._reader(ws)))
+
+    async def ramp_to(self, target: int, concurrency: int) -> dict:
+        handshakes = []
+        semaphore = asyncio.Semaphore(concurrency)
+        start_index = len(self.connections) + sum(self.failures.values())
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            self._open_one(i, semaphore, handshakes)
+            for i in range(start_index, start_index + target - len(self.connections))
+        ))
+        elapsed = time.perf_counter() - started
+        return {
+            "opened": len(handshakes),
+            "ramp_seconds": round(elapsed, 2),
+            "handshakes_per_second": round(len(handshakes) / elapsed, 1) if elapsed > 0 else None,
+            "handshake_ms": {
+                q: round(_percentile(handshakes, p) * 1000, 2) if handshakes else None
+                for q, p in (("p50", 50), ("p95", 95), ("p99", 99), ("max", 100))
+            },
+        }
+
+    async def close_all(self):
+        for task in self.readers:
+            task.cancel()
+        await asyncio.gather(*(ws.close() for ws in self.connections), return_exceptions=True)
+        self.connections.clear()
+        self.readers.clear()
+
+
+def _wait_for_server(port: int, proc: subprocess.Popen, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start in time")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def run_levels(args, port: int) -> list:
+    from app.services.auth import jwt_manager
+
+    client = FanoutClient(port, jwt_manager.generate_token(1, "bench@example.com"), args.tasks)
+    idle = await client.stats(reset=True)
+    results = []
+    try:
+        for level in args.levels:
+            ramp = await client.ramp_to(level, args.concurrency)
+            before = await client.stats(reset=True)
+            await asyncio.sleep(args.hold)
+            after = await client.stats(reset=True)
+
+            held = len(client.connections)
+            elapsed = after["time"] - before["time"]
+            rss_delta = after["rss_bytes"] - idle["rss_bytes"]
+            results.append({
+                "level": level,
+                "connections": held,
+                "server_active_ws": after["active_ws"],
+                "failures": dict(client.failures),
+                **ramp,
+                "rss_mb": round(after["rss_bytes"] / 1024 / 1024, 1),
+                "rss_per_connection_kb": round(rss_delta / held / 1024, 1) if held else None,
+                "loop_lag_ms": {k: round(v, 2) for k, v in after["loop_lag_ms"].items()},
+                "db_qps": round((after["db_queries"] - before["db_queries"]) / elapsed, 1) if elapsed > 0 else None,
+                "messages_received": client.messages,
+            })
+            print(_format_row(results[-1]), flush=True)
+    finally:
+        await client.close_all()
+    return results
+
+
+def _format_row(r: dict) -> str:
+    hs = r["handshake_ms"]
+    lag = r["loop_lag_ms"]
+    return (
+        f"level={r['level']:<6} conns={r['connections']:<6} fail={sum(r['failures'].values()):<4} "
+        f"handshake p50/p95/p99/max={hs['p50']}/{hs['p95']}/{hs['p99']}/{hs['max']}ms "
+        f"rate={r['handshakes_per_second']}/s rss={r['rss_mb']}MB ({r['rss_per_connection_kb']}KB/conn) "
+        f"lag p50/p99/max={lag['p50']}/{lag['p99']}/{lag['max']}ms db_qps={r['db_qps']}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebSocket fan-out benchmark")
+    parser.add_argument("--levels", default="1000,5000,10000", help="逐级连接数，逗号分隔")
+    parser.add_argument("--tasks", type=int, default=None, help="预置任务数（默认等于最大连接数，每个连接监听不同任务）")
+    parser.add_argument("--hold", type=float, default=20, help="每级保持时间（秒）")
+    parser.add_argument("--concurrency", type=int, default=200, help="同时进行的握手数")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="服务端 WS_POLL_INTERVAL_SECONDS")
+    parser.add_argument("--output", default=None, help="将结果写入 JSON 文件")
+    parser.add_argument("--with-logging", action="store_true", help="服务端保留 INFO 级别日志")
+    # 内部使用：子进程服务端
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--db", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    args.levels = sorted(int(x) for x in args.levels.split(",") if x.strip())
+    args.tasks = args.tasks or args.levels[-1]
+    fd_limit = _raise_fd_limit()
+    if fd_limit < args.levels[-1] + 100:
+        print(f"WARNING: open file limit {fd_limit} is below the largest level {args.levels[-1]}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "ws_bench.sqlite3")
+        _seed_database(db_path, args.tasks)
+        port = _free_port()
+        cmd = [sys.executable, os.path.abspath(__file__), "--serve", "--port", str(port), "--db", db_path,
+               "--poll-interval", str(args.poll_interval)]
+        if args.with_logging:
+            cmd.append("--with-logging")
+        proc = subprocess.Popen(cmd, cwd=BACKEND_DIR)
+        try:
+            _wait_for_server(port, proc)
+            print(f"server pid={proc.pid} port={port} tasks={args.tasks} poll_interval={args.poll_interval}s")
+            results = asyncio.run(run_levels(args, port))
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"poll_interval": args.poll_interval, "levels": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import atexit
+import os, sys
+import random
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
+import pytest
+
+# Ensure backend dir on sys.path for benchmark tests
+HERE = os.path.dirname(__file__)
+BACKEND_DIR = os.path.abspath(os.path.join(HERE, "..", ".."))
+sys.path.insert(0, BACKEND_DIR)
+
+# 日志写入临时目录（需在导入 app 模块前设置），避免测试在工作区 logs/ 下生成文件
+_LOG_DIR = tempfile.mkdtemp(prefix="research_chat_test_logs_")
+os.environ.setdefault("LOG_DIR", _LOG_DIR)
+atexit.register(shutil.rmtree, _LOG_DIR, ignore_errors=True)
+
+# 未安装 pytest-benchmark 时跳过整个目录（见 tests/run_benchmark.sh）
+pytest.importorskip("pytest_benchmark")
+
+_WORDS = (
+    "graph neural network molecular representation learning message passing drug discovery "
+    "protein ligand binding affinity benchmark dataset transformer attention self-supervised "
+    "contrastive pretraining generalization scaffold split out-of-distribution uncertainty"
+).split()
+
+
+def _sentence(rng, n):
+    return " ".join(rng.choice(_WORDS) for _ in range(n)).capitalize() + "."
+
+
+@pytest.fixture(scope="session")
+def realistic_papers():
+    """三组各 3 篇论文，摘要长度约 1500 字符（接近 Semantic Scholar 实际返回）"""
+    rng = random.Random(42)
+
+    def paper(i):
+        return {
+            "paperId": f"p{i}",
+            "title": _sentence(rng, 10),
+            "abstract": " ".join(_sentence(rng, 18) for _ in range(12)),
+        }
+
+    return [paper(i) for i in range(3)], [paper(i) for i in range(3, 6)], [paper(i) for i in range(6, 9)]
+
+
+class Row:
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+@pytest.fixture(scope="session")
+def large_history():
+    """200 轮对话历史（消息 + 最新进程信息），每条包含完整结果与进度日志"""
+    base = datetime(2025, 1, 1, 8, 0, 0)
+    logs = [f"[2025-01-01 08:00:{i:02d}] step log line {i}" for i in range(16)]
+    rows = []
+    for i in range(200):
+        created = base + timedelta(minutes=i)
+        message = Row(
+            id=i + 1, content=f"question {i} " * 20,
+            result_papers={"response": "plan " * 800, "intermediate_results": {"keywords": "a, b"}},
+            created_at=created, updated_at=created + timedelta(minutes=3),
+        )
+        process = Row(
+            id=i + 1, creation_status="created", process_info={"logs": logs},
+            created_at=created, updated_at=created + timedelta(minutes=3),
+        )
+        rows.append((message, process))
+    return rows
@@ -0,0 +1,45 @@
+import asyncio
+
+from app.services import auth as auth_mod
+from app.services.auth import JWTManager, get_current_user
+
+
+class DummyResult:
+    def __init__(self, value):
+        self._value = value
+
+    def scalar_one_or_none(self):
+        return self._value
+
+
+class DummyDB:
+    def __init__(self, value):
+        self._value = value
+
+    def execute(self, query):
+        return DummyResult(self._value)
+
+
+class DummyUser:
+    id = 1
+    email = "u@e.com"
+    is_active = True
+    identity_tag = "student"
+
+
+def test_bench_decode_token(benchmark):
+    manager = JWTManager()
+    token = manager.generate_token(1, "u@e.com")
+    payload = benchmark(manager.decode_token, token)
+    assert payload["user_id"] == 1
+
+
+def test_bench_get_current_user_stub_db(benchmark):
+    token = auth_mod.jwt_manager.generate_token(1, "u@e.com")
+    db = DummyDB(DummyUser())
+    loop = asyncio.new_event_loop()
+    try:
+        user = benchmark(lambda: loop.run_until_complete(get_current_user(authorization=f"Bearer {token}", db=db)))
+    finally:
+        loop.close()
+    assert user["user_id"] == 1
@@ -0,0 +1,41 @@
+import json
+import types
+from datetime import datetime
+
+from sqlalchemy import JSON
+from sqlalchemy.dialects import mysql
+
+from app.constants.task_status import CreationStatus
+from app.routes.chat_routes import _save_logs, _to_conversations
+
+
+def test_bench_to_conversations_large_history(benchmark, large_history):
+    convs = benchmark(_to_conversations, large_history)
+    assert len(convs) == 200
+
+
+def test_bench_db_log_json_rewrite(benchmark):
+    """db_log 每次都把完整 logs 列表整列写回（_save_logs，提交时按 MySQL JSON 绑定序列化）"""
+    bind = JSON().bind_processor(mysql.dialect())
+
+    class StubSession:
+        def __init__(self):
+            self.proc = types.SimpleNamespace(process_info=None, creation_status=None, updated_at=None)
+            self.written = None
+
+        def scalar(self, stmt):
+            return self.proc
+
+        def commit(self):
+            self.written = bind(self.proc.process_info)
+
+    def run_task_logs():
+        db = StubSession()
+        logs = []
+        for i in range(16):
+            logs.append(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 🔄 step message {i}")
+            _save_logs(db, 1, logs, CreationStatus.CREATING)
+        return db
+
+    db = benchmark(run_task_logs)
+    assert len(json.loads(db.written)["logs"]) == 16
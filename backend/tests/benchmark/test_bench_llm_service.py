@@ -0,0 +1,16 @@
+from app.services.llm_service import construct_paper, get_prompt
+
+
+def test_bench_construct_paper(benchmark, realistic_papers):
+    paper = benchmark(construct_paper, *realistic_papers)
+    assert "The relevent paper:" in paper
+
+
+def test_bench_get_prompt_with_papers(benchmark, realistic_papers):
+    paper = construct_paper(*realistic_papers)
+    prompt = benchmark(
+        get_prompt, "critic_research_plan", locale="cn",
+        user_query="graph neural networks for drug discovery", paper=paper,
+        inspiration="inspiration " * 200, research_plan="plan " * 1500,
+    )
+    assert prompt.endswith("(中文).")
@@ -0,0 +1,14 @@
+import logging
+
+from app.utils.logger import SimpleFormatter
+
+
+def test_bench_simple_formatter(benchmark):
+    formatter = SimpleFormatter()
+    record = logging.LogRecord(
+        "research_chat_fastapi", logging.INFO, __file__, 10,
+        "event: %s, path: %s, status: %s, duration_ms: %s", ("POST", "/create", 200, 12), None,
+    )
+    record.trace_id = "0123456789abcdef0123456789abcdef"
+    line = benchmark(formatter.format, record)
+    assert "trace_id=" in line
@@ -0,0 +1,20 @@
+from app.routes.websocket_routes import build_status_message
+
+
+class Row:
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+def test_bench_websocket_status_diffing(benchmark):
+    """单次轮询：组装状态消息并与上次发送的消息比较（日志未变化时不推送）"""
+    logs = [f"[2025-01-01 08:00:{i:02d}] step log line {i}" for i in range(16)]
+    result = Row(message_id=1, creation_status="creating", process_info={"logs": list(logs)})
+    last_sent = build_status_message(Row(message_id=1, creation_status="creating", process_info={"logs": list(logs)}))
+
+    def poll_once():
+        message = build_status_message(result)
+        return message != last_sent
+
+    changed = benchmark(poll_once)
+    assert changed is False
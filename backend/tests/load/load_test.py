@@ -0,0 +1,363 @@
+"""
+端到端压测脚本
+End-to-end load test harness for /create + /ws/status/{message_id}
+
+每个虚拟用户循环执行：POST /create（每次新建会话，避免 409）→ 连接 WebSocket →
+等待任务结束（created / failed）。压测前后各抓取一次 /metrics，报告：
+- 吞吐：完成任务数 / 总耗时
+- 客户端延迟 p50/p95/p99：create、WebSocket 握手、各流水线步骤（按 WS 日志中 "Step N" 的到达时间切分）、端到端
+- 服务端各步骤耗时 p50/p95/p99（由 research_chat_pipeline_step_duration_seconds 直方图增量估算）
+- 数据库语句数（research_chat_db_queries_total 增量）及每任务平均值
+
+配合 tests/mock/mock_servers.py 使用可完全离线、不消耗 token：
+    cd backend
+    python tests/mock/mock_servers.py llm --port 9001 &
+    python tests/mock/mock_servers.py s2 --port 9002 &
+    CUSTOM_API_ENDPOINT=http://127.0.0.1:9001/v1 \\
+    SEMANTIC_SCHOLAR_BASE_URL=http://127.0.0.1:9002/graph/v1 \\
+    uvicorn asgi:app --port 5000 &
+
+    # 使用已有 token（可重复传入多个，虚拟用户轮流使用）
+    python tests/load/load_test.py --users 20 --requests-per-user 3 --token <JWT>
+    # 或用本地 JWT 密钥为已存在的用户签发 token（需与服务端 JWT_SECRET_KEY 一致）
+    python tests/load/load_test.py --users 20 --user 1:someone@example.com
+
+注意：服务端多 worker 运行时需设置 PROMETHEUS_MULTIPROC_DIR，/metrics 才是全部 worker 的汇总。
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+HERE = os.path.dirname(__file__)
+sys.path.insert(0, os.path.abspath(os.path.join(HERE, "..", "..")))
+
+DEFAULT_BASE_URL = "http://127.0.0.1:5000/digital_twin/research_chat/api"
+
+# 与 chat_routes 中 track_pipeline_step 的步骤名一致
+STAGES = ("keywords", "papers", "inspiration", "plan", "review", "finalize")
+_STEP_PATTERN = re.compile(r"Step (\d):")
+
+PIPELINE_STEP_METRIC = "research_chat_pipeline_step_duration_seconds"
+DB_QUERIES_METRIC = "research_chat_db_queries_total"
+
+
+# ===== 统计工具 =====
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """线性插值分位数，q 取值 0~100"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * q / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values: List[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }
+
+
+def parse_metrics(text: str) -> Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float]:
+    """解析 Prometheus 文本格式，返回 {(样本名, 排序后的标签): 值}"""
+    from prometheus_client.parser import text_string_to_metric_families
+
+    samples = {}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            samples[(sample.name, tuple(sorted(sample.labels.items())))] = sample.value
+    return samples
+
+
+def metric_delta(before: dict, after: dict, name: str, **labels) -> float:
+    """同名同标签样本在两次抓取间的增量（标签为子集匹配，多条求和）"""
+    total = 0.0
+    for (sample_name, sample_labels), value in after.items():
+        if sample_name != name:
+            continue
+        label_map = dict(sample_labels)
+        if any(label_map.get(k) != v for k, v in labels.items()):
+            continue
+        total += value - before.get((sample_name, sample_labels), 0.0)
+    return total
+
+
+def histogram_quantile(buckets: List[Tuple[float, float]], q: float) -> Optional[float]:
+    """
+    按 Prometheus histogram_quantile 的方式由累计桶估算分位数
+
+    Args:
+        buckets: [(上界 le, 累计计数)]，需包含 +Inf
+        q: 0~1
+    """
+    buckets = sorted(buckets)
+    if not buckets or buckets[-1][1] <= 0:
+        return None
+    rank = q * buckets[-1][1]
+    prev_bound, prev_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if math.isinf(bound):
+                return prev_bound
+            if count == prev_count:
+                return bound
+            return prev_bound + (bound - prev_bound) * (rank - prev_count) / (count - prev_count)
+        prev_bound, prev_count = bound, count
+    return prev_bound
+
+
+def server_stage_quantiles(before: dict, after: dict) -> dict:
+    """由流水线步骤直方图增量估算各步骤（成功）耗时分位数，单位毫秒"""
+    buckets = defaultdict(list)
+    for (name, labels), _ in after.items():
+        if name != f"{PIPELINE_STEP_METRIC}_bucket":
+            continue
+        label_map = dict(labels)
+        if label_map.get("status") != "success":
+            continue
+        delta = metric_delta(before, after, name, **label_map)
+        buckets[label_map["step"]].append((float(label_map["le"]), delta))
+
+    result = {}
+    for step in STAGES:
+        step_buckets = buckets.get(step)
+        if not step_buckets or max(c for _, c in step_buckets) <= 0:
+            continue
+        result[step] = {
+            "count": int(max(c for _, c in step_buckets)),
+            **{
+                f"p{int(q * 100)}": _to_ms(histogram_quantile(step_buckets, q))
+                for q in (0.5, 0.95, 0.99)
+            },
+        }
+    return result
+
+
+def stage_durations(events: List[Tuple[float, str]], finished_at: float) -> Dict[str, float]:
+    """
+    由 WebSocket 日志到达时间切分各步骤耗时
+
+    Args:
+        events: [(到达时间, 日志行)]，按到达顺序
+        finished_at: 收到终态消息的时间
+    """
+    starts = []
+    for ts, line in events:
+        match = _STEP_PATTERN.search(line)
+        if match:
+            index = int(match.group(1)) - 1
+            if 0 <= index < len(STAGES) and all(s != STAGES[index] for s, _ in starts):
+                starts.append((STAGES[index], ts))
+    durations = {}
+    for i, (stage, start) in enumerate(starts):
+        end = starts[i + 1][1] if i + 1 < len(starts) else finished_at
+        durations[stage] = end - start
+    return durations
+
+
+def _to_ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+# ===== 压测执行 =====
+
+class LoadTestRunner:
+    """压测执行器：虚拟用户以线程方式并发运行"""
+
+    def __init__(self, base_url: str, tokens: List[str], content: str, locale: str, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.ws_base = re.sub(r"^http", "ws", self.base_url)
+        self.tokens = tokens
+        self.content = content
+        self.locale = locale
+        self.timeout = timeout
+        self.results = []
+        self._lock = threading.Lock()
+
+    def run_user(self, user_index: int, iterations: int):
+        token = self.tokens[user_index % len(self.tokens)]
+        session = requests.Session()
+        session.headers.update({"Authorization": f"Bearer {token}"})
+        for i in range(iterations):
+            result = self._run_task(session, token, f"{self.content} (user {user_index}, #{i})")
+            with self._lock:
+                self.results.append(result)
+
+    def _run_task(self, session: requests.Session, token: str, content: str) -> dict:
+        from websockets.sync.client import connect
+
+        result = {"status": "error", "stages": {}}
+        started = time.perf_counter()
+        try:
+            resp = session.post(
+                f"{self.base_url}/create",
+                json={"content": content, "locale": self.locale},
+                timeout=30,
+            )
+            result["create_s"] = time.perf_counter() - started
+            body = resp.json() if resp.headers.get("content-type", "").startswith("application/json") else {}
+            message_id = (body.get("data") or {}).get("message_id") if isinstance(body, dict) else None
+            if resp.status_code != 200 or not message_id:
+                result["status"] = f"create_http_{resp.status_code}"
+                return result
+
+            ws_started = time.perf_counter()
+            url = f"{self.ws_base}/ws/status/{message_id}?token={token}&locale={self.locale}"
+            events = []
+            seen_logs = 0
+            with connect(url, open_timeout=30, close_timeout=1) as ws:
+                result["ws_connect_s"] = time.perf_counter() - ws_started
+                deadline = time.perf_counter() + self.timeout
+                while True:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        result["status"] = "timeout"
+                        return result
+                    payload = json.loads(ws.recv(timeout=remaining))
+                    now = time.perf_counter()
+                    if "first_update_s" not in result:
+                        result["first_update_s"] = now - started
+                    data = payload.get("data") or {}
+                    logs = data.get("logs") or []
+                    events.extend((now, line) for line in logs[seen_logs:])
+                    seen_logs = max(seen_logs, len(logs))
+                    if data.get("status") in ("created", "failed"):
+                        result["status"] = data["status"]
+                        result["end_to_end_s"] = now - started
+                        result["stages"] = stage_durations(events, now)
+                        return result
+        except Exception as e:
+            result["status"] = f"error_{type(e).__name__}"
+            return result
+
+
+def scrape_metrics(metrics_url: str) -> dict:
+    try:
+        resp = requests.get(metrics_url, timeout=10)
+        resp.raise_for_status()
+        return parse_metrics(resp.text)
+    except Exception as e:
+        print(f"[load] 抓取 /metrics 失败 ({metrics_url}): {e}")
+        return {}
+
+
+def build_report(results: List[dict], wall_seconds: float, before: dict, after: dict) -> dict:
+    statuses = defaultdict(int)
+    for r in results:
+        statuses[r["status"]] += 1
+    completed = statuses.get("created", 0)
+
+    def collect(key):
+        return [r[key] * 1000 for r in results if key in r]
+
+    client = {
+        "create_ms": summarize(collect("create_s")),
+        "ws_connect_ms": summarize(collect("ws_connect_s")),
+        "first_update_ms": summarize(collect("first_update_s")),
+        "end_to_end_ms": summarize([r["end_to_end_s"] * 1000 for r in results if r["status"] == "created"]),
+        "stages_ms": {
+            stage: summarize([r["stages"][stage] * 1000 for r in results if stage in r["stages"]])
+            for stage in STAGES
+        },
+    }
+    db_queries = metric_delta(before, after, DB_QUERIES_METRIC) if after else None
+    return {
+        "tasks": len(results),
+        "statuses": dict(statuses),
+        "wall_seconds": round(wall_seconds, 2),
+        "throughput_tasks_per_second": round(completed / wall_seconds, 3) if wall_seconds > 0 else None,
+        "client": client,
+        "server_stages_ms": server_stage_quantiles(before, after) if after else {},
+        "db_queries": db_queries,
+        "db_queries_per_task": round(db_queries / len(results), 1) if db_queries is not None and results else None,
+    }
+
+
+def print_report(report: dict):
+    def fmt(v):
+        return "-" if v is None else f"{v:.1f}"
+
+    def row(name, s):
+        print(f"  {name:<16} n={s['count']:<5} p50={fmt(s['p50']):>10}  p95={fmt(s['p95']):>10}  p99={fmt(s['p99']):>10}")
+
+    print(f"tasks={report['tasks']} statuses={report['statuses']} wall={report['wall_seconds']}s "
+          f"throughput={report['throughput_tasks_per_second']} tasks/s")
+    print("client latency (ms):")
+    for key in ("create_ms", "ws_connect_ms", "first_update_ms", "end_to_end_ms"):
+        row(key[:-3], report["client"][key])
+    print("client stages (ms, from WS log arrival):")
+    for stage, s in report["client"]["stages_ms"].items():
+        row(stage, s)
+    if report["server_stages_ms"]:
+        print("server stages (ms, from /metrics histogram):")
+        for stage, s in report["server_stages_ms"].items():
+            row(stage, s)
+    print(f"db queries: total={report['db_queries']} per_task={report['db_queries_per_task']}")
+
+
+def _resolve_tokens(args) -> List[str]:
+    tokens = list(args.token or [])
+    if args.user:
+        from app.services.auth import jwt_manager
+        for spec in args.user:
+            user_id, _, email = spec.partition(":")
+            tokens.append(jwt_manager.generate_token(int(user_id), email))
+    return [t[7:] if t.lower().startswith("bearer ") else t for t in tokens]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end load test for /create + WebSocket status")
+    parser.add_argument("--base-url", default=os.getenv("API_BASE_URL", DEFAULT_BASE_URL))
+    parser.add_argument("--metrics-url", default=None, help="默认为 base-url 所在主机的 /metrics")
+    parser.add_argument("--users", type=int, default=10, help="并发虚拟用户数")
+    parser.add_argument("--requests-per-user", type=int, default=1)
+    parser.add_argument("--token", action="append", help="JWT，可重复传入")
+    parser.add_argument("--user", action="append", help="user_id:email，用本地 JWT 密钥签发 token，可重复传入")
+    parser.add_argument("--content", default="graph neural networks for drug discovery")
+    parser.add_argument("--locale", default="en", help="需为 en，步骤切分依赖英文日志中的 'Step N:'")
+    parser.add_argument("--timeout", type=float, default=1800, help="单个任务的最长等待时间（秒）")
+    parser.add_argument("--output", default=None, help="将报告写入 JSON 文件")
+    args = parser.parse_args()
+
+    tokens = _resolve_tokens(args)
+    if not tokens:
+        parser.error("需要至少一个 --token 或 --user")
+
+    metrics_url = args.metrics_url or re.sub(r"^(https?://[^/]+).*$", r"\1/metrics", args.base_url)
+    runner = LoadTestRunner(args.base_url, tokens, args.content, args.locale, args.timeout)
+
+    before = scrape_metrics(metrics_url)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        for i in range(args.users):
+            pool.submit(runner.run_user, i, args.requests_per_user)
+    wall = time.perf_counter() - started
+    after = scrape_metrics(metrics_url)
+
+    report = build_report(runner.results, wall, before, after)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[load] 报告已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+离线模拟服务
+Offline mock LLM (OpenAI-compatible) and Semantic Scholar servers
+
+用于压测与性能回归，避免消耗真实 token / 触发 S2 限流：
+- LLM: POST /v1/chat/completions，返回 OpenAI 兼容的非流式响应（含 usage）
+- S2:  GET /graph/v1/paper/search 与 /graph/v1/paper/search/bulk，返回 S2 兼容的 {"data": [...]}
+
+可配置项（命令行参数）：
+- 延迟分布：对数正态分布，--latency-median / --latency-sigma（秒），--latency-max 截断
+- 生成速度：--tokens-per-second（LLM 按 completion_tokens 追加生成耗时，0 表示不追加）
+- 错误率：--error-rate（返回 500）、--rate-limit-rate（返回 429；S2 与真实接口一致返回无 data 的 JSON）
+
+用法:
+    cd backend
+    python tests/mock/mock_servers.py llm --port 9001 --latency-median 2 --tokens-per-second 40
+    python tests/mock/mock_servers.py s2 --port 9002 --latency-median 0.3 --rate-limit-rate 0.1
+
+    # 后端指向模拟服务
+    CUSTOM_API_ENDPOINT=http://127.0.0.1:9001/v1 \\
+    SEMANTIC_SCHOLAR_BASE_URL=http://127.0.0.1:9002/graph/v1 \\
+    uvicorn asgi:app --port 5000
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+@dataclass
+class MockProfile:
+    """模拟服务行为配置"""
+    latency_median: float = 0.0
+    latency_sigma: float = 0.5
+    latency_max: float = 600.0
+    tokens_per_second: float = 0.0
+    completion_tokens: int = 800
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    seed: Optional[int] = None
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+
+    def sample_latency(self) -> float:
+        """按对数正态分布采样基础延迟（中位数为 latency_median）"""
+        if self.latency_median <= 0:
+            return 0.0
+        value = self.latency_median * self._rng.lognormvariate(0.0, self.latency_sigma)
+        return min(value, self.latency_max)
+
+    def sample_outcome(self) -> str:
+        """采样本次请求结果：ok / rate_limited / error"""
+        roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            return "rate_limited"
+        if roll < self.rate_limit_rate + self.error_rate:
+            return "error"
+        return "ok"
+
+
+# ===== LLM =====
+
+# 按提示模板返回的固定内容（关键词提取需要返回可直接用于检索的短语）
+# 标记取自各模板首行的角色描述："research inspiration"、"critical evaluation" 等词会出现在多个模板的正文中
+_CANNED_COMPLETIONS = {
+    "retrieve_query": ("you are an expert at extracting keywords", "graph neural network, drug discovery"),
+    "get_inspiration": ("you are a professional research paper analyst",
+                        "Inspiration: treat molecular graphs as dynamic systems and learn their evolution."),
+    "generate_research_plan": ("you are an experienced research proposal writer",
+                               "Research Background ...\nLimitations of Current Work ...\nProposed Research Plan ..."),
+    "critic_research_plan": ("you are a rigorous research proposal reviewer",
+                             "Weaknesses: limited novelty in the encoder. Suggestion: add a causal objective."),
+    "refine_research_plan": ("you are a professional research proposal optimizer",
+                             "Research Background (revised) ...\nLimitations of Current Work ...\nProposed Research Plan ..."),
+}
+
+
+def _canned_completion(prompt: str) -> str:
+    role = prompt.lstrip().split("\n", 1)[0].lower()
+    for marker, content in _CANNED_COMPLETIONS.values():
+        if marker in role:
+            return content
+    return "mock completion"
+
+
+def create_llm_app(profile: MockProfile) -> FastAPI:
+    """OpenAI 兼容的模拟 LLM 服务"""
+    app = FastAPI(title="Mock LLM")
+    app.state.profile = profile
+    app.state.requests = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        app.state.requests += 1
+        body = await request.json()
+        messages = body.get("messages") or []
+        prompt = "".join(str(m.get("content", "")) for m in messages)
+
+        await asyncio.sleep(profile.sample_latency())
+        outcome = profile.sample_outcome()
+        if outcome == "rate_limited":
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                headers={"Retry-After": "1"},
+            )
+        if outcome == "error":
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"message": "Mock upstream error", "type": "server_error"}},
+            )
+
+        completion_tokens = profile.completion_tokens
+        if profile.tokens_per_second > 0:
+            await asyncio.sleep(completion_tokens / profile.tokens_per_second)
+
+        prompt_tokens = max(1, len(prompt) // 4)
+        return {
+            "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock-model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": _canned_completion(prompt)},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    return app
+
+
+# ===== Semantic Scholar =====
+
+def _canned_papers(query: str, sort: Optional[str], limit: int = 10) -> list:
+    tag = (sort or "relevance").split(":")[0]
+    return [
+        {
+            "paperId": f"mock-{tag}-{i}",
+            "title": f"{query.title()} ({tag} #{i})",
+            "abstract": f"This mock paper studies {query} from the {tag} perspective. " * 3,
+        }
+        for i in range(limit)
+    ]
+
+
+def create_s2_app(profile: MockProfile) -> FastAPI:
+    """Semantic Scholar 兼容的模拟检索服务"""
+    app = FastAPI(title="Mock Semantic Scholar")
+    app.state.profile = profile
+    app.state.requests = 0
+
+    async def _search(query: str, sort: Optional[str]):
+        app.state.requests += 1
+        await asyncio.sleep(profile.sample_latency())
+        outcome = profile.sample_outcome()
+        if outcome == "rate_limited":
+            # 与真实接口一致：429 且响应体中没有 data 字段
+            return JSONResponse(status_code=429, content={"message": "Too Many Requests. Please wait and try again or apply for a key for higher rate limits."})
+        if outcome == "error":
+            return JSONResponse(status_code=500, content={"message": "Internal Server Error"})
+        papers = _canned_papers(query, sort)
+        return {"total": len(papers), "offset": 0, "data": papers}
+
+    @app.get("/graph/v1/paper/search")
+    async def search(query: str = "", sort: Optional[str] = None):
+        return await _search(query, sort)
+
+    @app.get("/graph/v1/paper/search/bulk")
+    async def search_bulk(query: str = "", sort: Optional[str] = None):
+        return await _search(query, sort)
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock LLM / Semantic Scholar server")
+    parser.add_argument("kind", choices=("llm", "s2"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None, help="默认 llm=9001, s2=9002")
+    parser.add_argument("--latency-median", type=float, default=None, help="基础延迟中位数（秒），默认 llm=1.0, s2=0.3")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="对数正态分布 sigma")
+    parser.add_argument("--latency-max", type=float, default=600.0)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=800)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    profile = MockProfile(
+        latency_median=args.latency_median if args.latency_median is not None else (1.0 if args.kind == "llm" else 0.3),
+        latency_sigma=args.latency_sigma,
+        latency_max=args.latency_max,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+    )
+    app = create_llm_app(profile) if args.kind == "llm" else create_s2_app(profile)
+    port = args.port or (9001 if args.kind == "llm" else 9002)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
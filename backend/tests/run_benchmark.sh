@@ -0,0 +1,102 @@
+#!/usr/bin/env bash
+set -euo pipefail
+set -o pipefail
+
+# 热路径微基准（pytest-benchmark）
+# - 首次运行（或 BENCH_SAVE_BASELINE=1）：保存为基线
+# - 之后运行：与最近一次保存的基线对比，均值退化超过阈值时失败
+#
+# 基线与机器相关，不提交到仓库（backend/tests/benchmark/.benchmarks/ 已忽略）。新检出的代码或 CI 中
+# 需要先在改动前的代码上运行一次生成基线（CI 可缓存 BENCH_STORAGE_DIR），否则首次运行只保存基线、不做回归对比。
+# BENCH_REQUIRE_BASELINE=1 时缺少基线直接失败，避免 CI 在没有基线的情况下误报通过。
+#
+# 用法:
+#   bash backend/tests/run_benchmark.sh                      # 对比基线
+#   BENCH_SAVE_BASELINE=1 bash backend/tests/run_benchmark.sh  # 重新保存基线
+#   BENCH_FAIL_THRESHOLD=mean:10% bash backend/tests/run_benchmark.sh
+
+# ========= Config =========
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+REPO_ROOT="$(cd "$SCRIPT_DIR/../.." && pwd)"
+TEST_DIR="$REPO_ROOT/backend/tests/benchmark"
+OUT_DIR="$REPO_ROOT/backend/tests/reports"
+REPORT_PREFIX="benchmark"
+STORAGE_DIR="${BENCH_STORAGE_DIR:-$REPO_ROOT/backend/tests/benchmark/.benchmarks}"
+BASELINE_NAME="baseline"
+FAIL_THRESHOLD="${BENCH_FAIL_THRESHOLD:-mean:20%}"
+SAVE_BASELINE="${BENCH_SAVE_BASELINE:-0}"
+REQUIRE_BASELINE="${BENCH_REQUIRE_BASELINE:-0}"
+JSON_REPORT="$OUT_DIR/report_${REPORT_PREFIX}.json"
+LOG_FILE="$OUT_DIR/pytest_${REPORT_PREFIX}_output.txt"
+
+mkdir -p "$OUT_DIR" "$STORAGE_DIR"
+
+# Make sure Python can import backend/app package
+export PYTHONPATH="$REPO_ROOT/backend:${PYTHONPATH:-}"
+
+# ========= Banner =========
+echo "[run_${REPORT_PREFIX}] Starting ${REPORT_PREFIX} tests"
+echo "[run_${REPORT_PREFIX}] TEST_DIR=$TEST_DIR"
+echo "[run_${REPORT_PREFIX}] STORAGE_DIR=$STORAGE_DIR"
+
+# ========= Plugin detection =========
+if ! python -c "import pytest_benchmark" >/dev/null 2>&1; then
+  echo "[run_${REPORT_PREFIX}] pytest-benchmark not installed (pip install -r backend/requirements.txt)"
+  exit 1
+fi
+
+# ========= Build pytest args =========
+export PYTEST_DISABLE_PLUGIN_AUTOLOAD=1
+
+PYTEST_ARGS=(
+  "$TEST_DIR"
+  -p pytest_benchmark.plugin
+  -q
+  -o console_output_style=classic
+  -W ignore::DeprecationWarning
+  --benchmark-only
+  --benchmark-storage="file://$STORAGE_DIR"
+  --benchmark-json="$JSON_REPORT"
+  --benchmark-sort=name
+  --benchmark-columns=min,mean,median,stddev,rounds
+)
+
+# 最近一次保存的基线编号（文件名形如 0003_baseline.json）
+LATEST_BASELINE="$(find "$STORAGE_DIR" -name "*_${BASELINE_NAME}.json" 2>/dev/null | sort | tail -n 1 || true)"
+
+if [[ -z "$LATEST_BASELINE" && "$SAVE_BASELINE" != "1" && "$REQUIRE_BASELINE" == "1" ]]; then
+  echo "[run_${REPORT_PREFIX}] No baseline in $STORAGE_DIR; generate one first with BENCH_SAVE_BASELINE=1"
+  exit 1
+fi
+
+if [[ "$SAVE_BASELINE" == "1" || -z "$LATEST_BASELINE" ]]; then
+  if [[ -z "$LATEST_BASELINE" ]]; then
+    echo "[run_${REPORT_PREFIX}] No baseline found: saving one, regression check skipped on this run"
+  fi
+  echo "[run_${REPORT_PREFIX}] Saving new baseline"
+  PYTEST_ARGS+=( --benchmark-save="$BASELINE_NAME" )
+else
+  BASELINE_ID="$(basename "$LATEST_BASELINE" | cut -d_ -f1)"
+  echo "[run_${REPORT_PREFIX}] Comparing against baseline $(basename "$LATEST_BASELINE") (fail on $FAIL_THRESHOLD)"
+  PYTEST_ARGS+=( --benchmark-compare="$BASELINE_ID" --benchmark-compare-fail="$FAIL_THRESHOLD" )
+fi
+
+# Pass through any extra args to pytest
+if [[ $# -gt 0 ]]; then
+  echo "[run_${REPORT_PREFIX}] Extra pytest args: $*"
+  PYTEST_ARGS+=( "$@" )
+fi
+
+# ========= Run pytest =========
+set +e
+python -m pytest "${PYTEST_ARGS[@]}" | tee "$LOG_FILE"
+PYTEST_STATUS=${PIPESTATUS[0]}
+set -e
+
+# ========= Exit status =========
+if [[ $PYTEST_STATUS -ne 0 ]]; then
+  echo "[run_${REPORT_PREFIX}] pytest exited with status $PYTEST_STATUS"
+  exit $PYTEST_STATUS
+fi
+
+echo "[run_${REPORT_PREFIX}] Done (JSON report: $JSON_REPORT)"
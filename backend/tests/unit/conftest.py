@@ -1,4 +1,9 @@
+import atexit
 import os, sys
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+
 import pytest
 import warnings as _warnings
 
@@ -7,6 +12,11 @@ HERE = os.path.dirname(__file__)
 BACKEND_DIR = os.path.abspath(os.path.join(HERE, "..", ".."))
 sys.path.insert(0, BACKEND_DIR)
 
+# 日志写入临时目录（需在导入 app 模块前设置），避免测试在工作区 logs/ 下生成文件
+_LOG_DIR = tempfile.mkdtemp(prefix="research_chat_test_logs_")
+os.environ.setdefault("LOG_DIR", _LOG_DIR)
+atexit.register(shutil.rmtree, _LOG_DIR, ignore_errors=True)
+
 # Test-only warning filters to reduce noise
 _warnings.filterwarnings(
     "ignore",
@@ -31,3 +41,92 @@ def _suppress_deprecation_warnings():
         category=UserWarning,
         message=r"Using the in-memory storage for tracking rate limits.*",
     )
+
+
+# ===== 共享的 SQLite + 调度器环境（任务恢复 / 排空 / 去重 / 相似题目 / 推测检索测试使用） =====
+# app 模块需在上面设置 LOG_DIR 之后导入
+from sqlalchemy import BigInteger, create_engine  # noqa: E402
+from sqlalchemy.ext.compiler import compiles  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app.constants.task_status import CreationStatus  # noqa: E402
+from app.entity import auth as auth_entity  # noqa: E402
+from app.entity.research_chat import (  # noqa: E402
+    Base, ResearchChatMessage, ResearchChatProcessInfo, ResearchChatSession,
+)
+from app.routes import chat_routes  # noqa: E402
+from app.services import task_recovery  # noqa: E402
+from app.services.task_scheduler import FairShareScheduler, parse_tier_weights  # noqa: E402
+from app.utils.tools import UTC8  # noqa: E402
+
+
+@compiles(BigInteger, "sqlite")
+def _compile_big_integer_sqlite(type_, compiler, **kw):
+    # SQLite 只对 INTEGER PRIMARY KEY 自增
+    return "INTEGER"
+
+
+class ManualExecutor:
+    """只记录提交的任务，由测试手动执行"""
+    max_workers = 4
+
+    def __init__(self):
+        self.pending = []
+
+    def submit(self, fn, *args):
+        self.pending.append((fn, args))
+
+
+@pytest.fixture
+def manual_executor():
+    return ManualExecutor()
+
+
+@pytest.fixture
+def env(monkeypatch, manual_executor):
+    """内存 SQLite + 手动执行的调度器，返回 (Session, scheduler, executor)"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    auth_entity.Base.metadata.create_all(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    scheduler = FairShareScheduler(manual_executor, 4, 4, 10, parse_tier_weights(""))
+    monkeypatch.setattr(task_recovery, "SessionLocal", Session)
+    monkeypatch.setattr(task_recovery, "task_scheduler", scheduler)
+    monkeypatch.setattr(chat_routes, "SessionLocal", Session)
+    return Session, scheduler, manual_executor
+
+
+def _seed(Session, status=CreationStatus.CREATING, age_seconds=3600, extra_info=None, checkpoint=None):
+    """创建会话 + 消息 + 任务状态，返回 message_id（updated_at 为 age_seconds 秒前）"""
+    with Session() as db:
+        session = ResearchChatSession(page_session_id="p", user_id=1, email="e", session_name="s")
+        db.add(session)
+        db.flush()
+        message = ResearchChatMessage(session_id=session.id, user_id=1, email="e", content="graph learning",
+                                      extra_info={"checkpoint": checkpoint} if checkpoint else None)
+        db.add(message)
+        db.flush()
+        db.add(ResearchChatProcessInfo(
+            session_id=session.id, message_id=message.id, user_id=1, email="e",
+            creation_status=status, process_info={"logs": ["[t] step1"]},
+            extra_info=extra_info or {"locale": "en"},
+            updated_at=datetime.now(UTC8) - timedelta(seconds=age_seconds),
+        ))
+        db.commit()
+        return message.id
+
+
+def _load_proc(Session, message_id):
+    with Session() as db:
+        return db.query(ResearchChatProcessInfo).filter_by(message_id=message_id).one()
+
+
+@pytest.fixture
+def seed():
+    return _seed
+
+
+@pytest.fixture
+def load_proc():
+    return _load_proc
@@ -42,3 +42,25 @@ def test_get_jwt_config_bad_expires_fallback(monkeypatch):
     cfg = get_jwt_config()
     # 1 day in seconds
     assert 86400 - 5 <= cfg["expires"] <= 86400 + 5
+
+
+def test_load_llm_routes_parses_template_and_field():
+    routes = config_module.load_llm_routes({
+        "LLM_ROUTE_RETRIEVE_QUERY_MODEL": "small-model",
+        "LLM_ROUTE_RETRIEVE_QUERY_MAX_TOKENS": "64",
+        "LLM_ROUTE_CRITIC_RESEARCH_PLAN_TEMPERATURE": "0.2",
+        "LLM_ROUTE_GET_INSPIRATION_API_KEY": "sk-x",
+        "LLM_ROUTE_GET_INSPIRATION_ENDPOINT": "",
+        "LLM_ROUTE_MODEL": "missing-template",
+        "CUSTOM_MODEL": "ignored",
+    })
+    assert routes == {
+        "retrieve_query": {"model": "small-model", "max_tokens": 64},
+        "critic_research_plan": {"temperature": 0.2},
+        "get_inspiration": {"api_key": "sk-x"},
+    }
+
+
+def test_load_llm_routes_rejects_bad_number():
+    with pytest.raises(ValueError):
+        config_module.load_llm_routes({"LLM_ROUTE_RETRIEVE_QUERY_TEMPERATURE": "hot"})
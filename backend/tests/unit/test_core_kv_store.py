@@ -0,0 +1,24 @@
+import time
+
+from app.core.kv_store import KeyValueStore
+
+
+def test_set_if_absent_respects_ttl():
+    kv = KeyValueStore(None)
+    assert kv.set_if_absent("k", 1, 0.05) is True
+    assert kv.set_if_absent("k", 2, 0.05) is False
+    time.sleep(0.06)
+    assert kv.get("k") is None
+    assert kv.set_if_absent("k", 3, 1) is True
+
+
+def test_lock_is_exclusive_and_released_by_owner_only():
+    kv = KeyValueStore(None)
+    with kv.lock("s1", 5) as first:
+        with kv.lock("s1", 5) as second:
+            assert first is True and second is False
+        # 未获得锁的一方退出时不能释放他人的锁
+        with kv.lock("s1", 5) as third:
+            assert third is False
+    with kv.lock("s1", 5) as again:
+        assert again is True
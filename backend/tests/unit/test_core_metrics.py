@@ -0,0 +1,61 @@
+import pytest
+from prometheus_client import REGISTRY
+from sqlalchemy import create_engine, text
+from starlette.testclient import TestClient
+
+from app import main as app_main
+from app.core import metrics
+
+
+def _sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+def test_metrics_endpoint_exposes_route_histogram():
+    client = TestClient(app_main.create_app())
+    client.get("/health")
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    body = resp.text
+    assert 'research_chat_http_request_duration_seconds_count{method="GET",route="/health",status="200"}' in body
+    assert "research_chat_websocket_active_connections" in body
+
+
+def test_unmatched_route_uses_fixed_label():
+    client = TestClient(app_main.create_app())
+    before = _sample("research_chat_http_request_duration_seconds_count",
+                     {"method": "GET", "route": "unmatched", "status": "404"})
+    client.get("/no/such/path/123")
+    after = _sample("research_chat_http_request_duration_seconds_count",
+                    {"method": "GET", "route": "unmatched", "status": "404"})
+    assert after == before + 1
+
+
+def test_track_pipeline_step_labels_status():
+    ok = {"step": "unit_step", "status": "success"}
+    bad = {"step": "unit_step", "status": "failed"}
+    before_ok = _sample("research_chat_pipeline_step_duration_seconds_count", ok)
+    before_bad = _sample("research_chat_pipeline_step_duration_seconds_count", bad)
+    with metrics.track_pipeline_step("unit_step"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.track_pipeline_step("unit_step"):
+            raise ValueError("x")
+    assert _sample("research_chat_pipeline_step_duration_seconds_count", ok) == before_ok + 1
+    assert _sample("research_chat_pipeline_step_duration_seconds_count", bad) == before_bad + 1
+
+
+def test_instrument_engine_counts_queries_and_checkouts():
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    queries_before = _sample("research_chat_db_queries_total")
+    checkouts_before = _sample("research_chat_db_pool_checkouts_total")
+    checked_out_before = _sample("research_chat_db_pool_checked_out")
+    with engine.connect() as conn:
+        conn.execute(text("select 1"))
+        conn.execute(text("select 2"))
+        assert _sample("research_chat_db_pool_checked_out") == checked_out_before + 1
+    assert _sample("research_chat_db_queries_total") == queries_before + 2
+    assert _sample("research_chat_db_pool_checkouts_total") == checkouts_before + 1
+    assert _sample("research_chat_db_pool_checked_out") == checked_out_before
@@ -0,0 +1,61 @@
+from fastapi import FastAPI, WebSocket
+from fastapi.responses import StreamingResponse
+from starlette.testclient import TestClient
+
+from app.core.middleware import RequestTracingMiddleware
+from app.utils.trace_context import get_request_id, get_trace_id
+
+
+def _build_app():
+    app = FastAPI()
+    app.add_middleware(RequestTracingMiddleware)
+
+    @app.get("/ctx")
+    async def ctx():
+        return {"request_id": get_request_id(), "trace_id": get_trace_id()}
+
+    @app.get("/stream")
+    async def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"c{i}".encode()
+        return StreamingResponse(chunks(), media_type="text/plain")
+
+    @app.websocket("/ws")
+    async def ws(websocket: WebSocket):
+        await websocket.accept()
+        await websocket.send_json({"trace_id": get_trace_id()})
+        await websocket.close()
+
+    return app
+
+
+def test_generates_ids_and_exposes_them_via_contextvars():
+    client = TestClient(_build_app())
+    resp = client.get("/ctx")
+    body = resp.json()
+    assert resp.headers["X-Request-Id"] == body["request_id"]
+    assert resp.headers["X-Trace-Id"] == body["trace_id"] == body["request_id"]
+    assert float(resp.headers["X-Process-Time"]) >= 0
+    # 请求结束后上下文被还原
+    assert get_request_id() is None
+
+
+def test_propagates_incoming_headers():
+    client = TestClient(_build_app())
+    resp = client.get("/ctx", headers={"X-Request-ID": "r1", "X-Trace-Id": "t1"})
+    assert resp.json() == {"request_id": "r1", "trace_id": "t1"}
+    assert resp.headers["X-Trace-Id"] == "t1"
+
+
+def test_streaming_response_passes_through():
+    client = TestClient(_build_app())
+    resp = client.get("/stream")
+    assert resp.text == "c0c1c2"
+    assert "X-Request-Id" in resp.headers
+
+
+def test_websocket_gets_trace_context():
+    client = TestClient(_build_app())
+    with client.websocket_connect("/ws", headers={"X-Trace-Id": "ws-trace"}) as ws:
+        assert ws.receive_json() == {"trace_id": "ws-trace"}
@@ -0,0 +1,107 @@
+import pytest
+from starlette.testclient import TestClient
+
+from tests.load import load_test
+from tests.mock.mock_servers import MockProfile, create_llm_app, create_s2_app
+
+
+def test_mock_llm_returns_openai_compatible_completion():
+    client = TestClient(create_llm_app(MockProfile(completion_tokens=42, seed=1)))
+    resp = client.post("/v1/chat/completions", json={
+        "model": "m", "messages": [{"role": "user", "content": "You are an expert at extracting keywords ..."}],
+    })
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["choices"][0]["message"]["content"] == "graph neural network, drug discovery"
+    assert body["usage"]["completion_tokens"] == 42
+
+
+def test_mock_llm_maps_each_prompt_template_to_its_own_completion():
+    from app.services.llm_service import PROMPT_TEMPLATES, get_prompt
+    from tests.mock.mock_servers import _CANNED_COMPLETIONS, _canned_completion
+
+    # 正文中混入其他模板的关键词，确认只按模板本身匹配
+    fields = dict(user_query="q", paper="research inspiration, critical evaluation", inspiration="research inspiration",
+                  research_plan="proposal writer", criticism="critical evaluation")
+    assert set(_CANNED_COMPLETIONS) == set(PROMPT_TEMPLATES)
+    completions = {name: _canned_completion(get_prompt(name, **fields)) for name in PROMPT_TEMPLATES}
+    assert completions == {name: content for name, (_, content) in _CANNED_COMPLETIONS.items()}
+    assert len(set(completions.values())) == len(completions)
+
+
+def test_mock_llm_rate_limit_and_error_rates():
+    limited = TestClient(create_llm_app(MockProfile(rate_limit_rate=1.0)))
+    assert limited.post("/v1/chat/completions", json={"messages": []}).status_code == 429
+    failing = TestClient(create_llm_app(MockProfile(error_rate=1.0)))
+    assert failing.post("/v1/chat/completions", json={"messages": []}).status_code == 500
+
+
+def test_mock_s2_search_and_rate_limit():
+    client = TestClient(create_s2_app(MockProfile()))
+    resp = client.get("/graph/v1/paper/search/bulk", params={"query": "gnn", "sort": "citationCount:desc"})
+    data = resp.json()["data"]
+    assert data and {"title", "abstract"} <= set(data[0])
+
+    limited = TestClient(create_s2_app(MockProfile(rate_limit_rate=1.0)))
+    resp = limited.get("/graph/v1/paper/search", params={"query": "gnn"})
+    assert resp.status_code == 429 and "data" not in resp.json()
+
+
+def test_search_papers_uses_configured_base_url(monkeypatch):
+    from app.core.config import Config
+    from app.services import llm_service
+
+    monkeypatch.setattr(Config, "SEMANTIC_SCHOLAR_BASE_URL", "http://mock-s2/graph/v1")
+    seen = {}
+
+    class _Resp:
+        def json(self):
+            return {"data": [{"title": "t", "abstract": "a"}]}
+
+    def fake_get(url, params=None, timeout=None):
+        seen["url"] = url
+        return _Resp()
+
+    monkeypatch.setattr(llm_service.requests, "get", fake_get)
+    assert llm_service.get_newest_paper("gnn") == [{"title": "t", "abstract": "a"}]
+    assert seen["url"] == "http://mock-s2/graph/v1/paper/search/bulk"
+
+
+def test_percentile_and_histogram_quantile():
+    assert load_test.percentile([], 50) is None
+    assert load_test.percentile([1, 2, 3, 4], 50) == pytest.approx(2.5)
+    buckets = [(1.0, 0), (2.0, 10), (float("inf"), 10)]
+    assert load_test.histogram_quantile(buckets, 0.5) == pytest.approx(1.5)
+
+
+def test_stage_durations_from_ws_log_arrivals():
+    events = [
+        (0.0, "[t] 🚀 Research task started!"),
+        (1.0, "[t] 🔄 Step 1: Extracting research keywords..."),
+        (3.0, "[t] 🔄 Step 2: Retrieving related papers..."),
+        (3.5, "[t] ✅ Paper retrieval completed!"),
+    ]
+    assert load_test.stage_durations(events, finished_at=4.0) == {"keywords": 2.0, "papers": 1.0}
+
+
+def test_server_stage_quantiles_and_db_delta():
+    text_before = (
+        "# TYPE research_chat_db_queries_total counter\n"
+        "research_chat_db_queries_total 10\n"
+    )
+    text_after = (
+        "# TYPE research_chat_db_queries_total counter\n"
+        "research_chat_db_queries_total 25\n"
+        "# TYPE research_chat_pipeline_step_duration_seconds histogram\n"
+        'research_chat_pipeline_step_duration_seconds_bucket{le="1.0",status="success",step="keywords"} 0\n'
+        'research_chat_pipeline_step_duration_seconds_bucket{le="2.5",status="success",step="keywords"} 4\n'
+        'research_chat_pipeline_step_duration_seconds_bucket{le="+Inf",status="success",step="keywords"} 4\n'
+        'research_chat_pipeline_step_duration_seconds_count{status="success",step="keywords"} 4\n'
+        'research_chat_pipeline_step_duration_seconds_sum{status="success",step="keywords"} 6\n'
+    )
+    before = load_test.parse_metrics(text_before)
+    after = load_test.parse_metrics(text_after)
+    assert load_test.metric_delta(before, after, "research_chat_db_queries_total") == 15
+    stages = load_test.server_stage_quantiles(before, after)
+    assert stages["keywords"]["count"] == 4
+    assert stages["keywords"]["p50"] == pytest.approx(1750.0)
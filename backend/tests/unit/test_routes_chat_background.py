@@ -108,3 +108,38 @@ def test_background_process_prompt_and_update_success(monkeypatch, tmp_path):
     assert isinstance(msg.result_papers, dict)
     assert 'response' in msg.result_papers
     assert sess.commits >= 1
+
+
+def test_background_process_stops_at_next_step_when_cancelled(monkeypatch):
+    proc = DummyProc(message_id=1)
+    msg = DummyMsg(id=1)
+    sess = DummySession(proc, msg)
+    monkeypatch.setattr(routes, 'SessionLocal', lambda: sess)
+
+    def fake_select(target):
+        class _S:
+            marker = 'message' if target is routes.ResearchChatMessage else (
+                'process' if target is routes.ResearchChatProcessInfo else 'other'
+            )
+            def where(self, *a, **k):
+                return self
+        return _S()
+    monkeypatch.setattr(routes, 'select', fake_select)
+
+    class CancellingLLM(DummyLLM):
+        def get_response(self, prompt, **kwargs):
+            routes.request_cancel(1)  # 用户在第一步执行期间取消
+            return super().get_response(prompt, **kwargs)
+
+    monkeypatch.setattr(routes, 'LLMClient', CancellingLLM)
+    searched = []
+    monkeypatch.setattr(routes, 'get_newest_paper', lambda q: searched.append(q) or [])
+
+    routes._background_process_prompt_and_update(
+        message_id=1, session_db_id=1, user_id=1, user_email='e', content='topic', locale='en'
+    )
+
+    assert proc.creation_status == CreationStatus.FAILED
+    assert "cancelled" in proc.process_info["logs"][-1]
+    assert searched == []
+    assert msg.result_papers is None
@@ -157,7 +157,7 @@ def test_create_research_conflict(monkeypatch):
         request=routes.CreateResearchRequest(content="hello", session_id="p1", locale="cn"),
         response=resp,
         x_page_id=None,
-        background_tasks=None,
+        idempotency_key=None,
         current_user={"user_id": 1, "email": "e"},
         db=sess,
     ))
@@ -204,11 +204,14 @@ def test_create_research_new_session_and_background(monkeypatch):
     # Make generate_page_session_id deterministic
     monkeypatch.setattr(routes, 'generate_page_session_id', lambda x: 'new_session_id')
 
-    class Bg:
+    class Scheduler:
         def __init__(self):
             self.calls = []
-        def add_task(self, fn, *args):
+        def is_saturated(self):
+            return False
+        def submit(self, key, user_id, identity_tag, fn, *args):
             self.calls.append((fn, args))
+            return 3
 
     # Session that assigns IDs on add() and tracks flush/commit
     class Sess:
@@ -246,19 +249,21 @@ def test_create_research_new_session_and_background(monkeypatch):
             self.rollbacks += 1
 
     sess = Sess()
-    bg = Bg()
+    bg = Scheduler()
+    monkeypatch.setattr(routes, 'task_scheduler', bg)
     resp = type("Resp", (), {"status_code": 200})()
 
     out = asyncio.run(routes.create_research(
         request=routes.CreateResearchRequest(content="topic content for new session", session_id=None, locale="en"),
         response=resp,
         x_page_id="x",
-        background_tasks=bg,
+        idempotency_key=None,
         current_user={"user_id": 1, "email": "e"},
         db=sess,
     ))
 
     assert out["code"] == 200
+    assert out["data"]["queue_position"] == 3
     assert any(c[0] is routes._background_process_prompt_and_update for c in bg.calls)
     # Ensure the call args include message_id (20) and session_db_id (10)
     fn, args = bg.calls[0]
@@ -266,6 +271,31 @@ def test_create_research_new_session_and_background(monkeypatch):
     assert sess.commits == 1 and sess.flushed >= 1
 
 
+def test_create_research_rejected_when_scheduler_saturated(monkeypatch):
+    class Scheduler:
+        def is_saturated(self):
+            return True
+        def stats(self):
+            return {}
+        def submit(self, *args):
+            raise AssertionError("should not submit")
+
+    monkeypatch.setattr(routes, 'task_scheduler', Scheduler())
+    sess = DummySession()
+    resp = type("Resp", (), {"status_code": 200})()
+    out = asyncio.run(routes.create_research(
+        request=routes.CreateResearchRequest(content="hello", session_id=None, locale="cn"),
+        response=resp,
+        x_page_id=None,
+        idempotency_key=None,
+        current_user={"user_id": 1, "email": "e"},
+        db=sess,
+    ))
+    assert resp.status_code == ErrorCode.SERVICE_UNAVAILABLE.value
+    assert out["code"] == ErrorCode.SERVICE_UNAVAILABLE.value
+    assert sess.commits == 0
+
+
 def test_update_session_name_rollback_on_commit_error(monkeypatch):
     # session exists but commit fails -> rollback and 500
     class S: pass
@@ -304,3 +334,195 @@ def test_delete_session_rollback_on_commit_error(monkeypatch):
     assert out["code"] == ErrorCode.INTERNAL_SERVER_ERROR.value
     assert obj in sess.deleted
     assert sess.rollback_called == 1
+
+
+def test_create_research_admission_rejected_sets_retry_after(monkeypatch):
+    from app.services.admission import AdmissionDecision
+
+    class Controller:
+        def check(self, user_id):
+            return AdmissionDecision("rate_limited", 12)
+
+    monkeypatch.setattr(routes, 'admission_controller', Controller())
+    sess = DummySession()
+    resp = type("Resp", (), {"status_code": 200, "headers": {}})()
+    out = asyncio.run(routes.create_research(
+        request=routes.CreateResearchRequest(content="hello", session_id=None, locale="cn"),
+        response=resp,
+        x_page_id=None,
+        idempotency_key=None,
+        current_user={"user_id": 1, "email": "e"},
+        db=sess,
+    ))
+    assert resp.status_code == ErrorCode.TOO_MANY_REQUESTS.value
+    assert resp.headers["Retry-After"] == "12"
+    assert out["data"] == {"reason": "rate_limited", "retry_after": 12}
+    assert sess.commits == 0
+
+
+def test_create_research_rejected_while_draining(monkeypatch):
+    from app.services.task_drain import DrainState
+
+    state = DrainState()
+    state.start()
+    monkeypatch.setattr(routes, 'drain_state', state)
+    sess = DummySession()
+    resp = type("Resp", (), {"status_code": 200, "headers": {}})()
+    asyncio.run(routes.create_research(
+        request=routes.CreateResearchRequest(content="hello", session_id=None, locale="cn"),
+        response=resp,
+        x_page_id=None,
+        idempotency_key=None,
+        current_user={"user_id": 1, "email": "e"},
+        db=sess,
+    ))
+    assert resp.status_code == ErrorCode.SERVICE_UNAVAILABLE.value
+    assert "Retry-After" in resp.headers
+    assert sess.commits == 0
+
+
+def test_cancel_research_pending_task_removed_from_queue(monkeypatch):
+    proc = type("P", (), {"creation_status": routes.CreationStatus.PENDING, "extra_info": None,
+                          "process_info": {"logs": []}})()
+
+    class Scheduler:
+        def cancel(self, key):
+            return key == 5
+
+    monkeypatch.setattr(routes, 'task_scheduler', Scheduler())
+    sess = DummySession()
+    sess.scalar = lambda stmt: proc
+    out = asyncio.run(routes.cancel_research(5, current_user={"user_id": 1}, db=sess))
+    assert out["code"] == 200
+    assert proc.creation_status == routes.CreationStatus.FAILED
+    assert proc.extra_info["cancel_requested"] is True
+    assert sess.commits == 1
+
+
+def test_cancel_research_finished_task_conflict(monkeypatch):
+    proc = type("P", (), {"creation_status": routes.CreationStatus.CREATED, "extra_info": None})()
+    sess = DummySession()
+    sess.scalar = lambda stmt: proc
+    out = asyncio.run(routes.cancel_research(5, current_user={"user_id": 1}, db=sess))
+    assert out["code"] == ErrorCode.CONFLICT.value
+    assert proc.extra_info is None
+
+
+def _sqlite_create_env(monkeypatch, tmp_path):
+    """文件型 SQLite 库 + 一个会话 p1，create_research 的外部依赖替换为桩"""
+    from sqlalchemy import BigInteger, create_engine
+    from sqlalchemy.ext.compiler import compiles
+    from sqlalchemy.orm import sessionmaker
+
+    from app.core.kv_store import KeyValueStore
+    from app.entity.research_chat import Base, ResearchChatSession
+
+    @compiles(BigInteger, "sqlite")
+    def _compile_big_integer_sqlite(type_, compiler, **kw):
+        return "INTEGER"
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}", connect_args={"check_same_thread": False, "timeout": 30})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with Session() as db:
+        db.add(ResearchChatSession(page_session_id="p1", user_id=1, email="e", session_name="s"))
+        db.commit()
+
+    class Scheduler:
+        def is_saturated(self):
+            return False
+
+        def submit(self, *args):
+            return 0
+
+    monkeypatch.setattr(routes, "task_scheduler", Scheduler())
+    monkeypatch.setattr(routes, "admission_controller", type("A", (), {"check": lambda self, uid: None})())
+    monkeypatch.setattr(routes, "kv_store", KeyValueStore(None))
+    return Session
+
+
+def _create(db, content="hello"):
+    resp = type("Resp", (), {"status_code": 200, "headers": {}})()
+    return asyncio.run(routes.create_research(
+        request=routes.CreateResearchRequest(content=content, session_id="p1", locale="cn"),
+        response=resp,
+        x_page_id=None,
+        idempotency_key=None,
+        current_user={"user_id": 1, "email": "e"},
+        db=db,
+    ))
+
+
+def test_concurrent_creates_on_same_session_start_one_task(monkeypatch, tmp_path):
+    import threading
+
+    from sqlalchemy import func, select
+
+    from app.entity.research_chat import ResearchChatProcessInfo
+
+    Session = _sqlite_create_env(monkeypatch, tmp_path)
+
+    workers = 16
+    barrier = threading.Barrier(workers)
+    codes = []
+
+    def fire():
+        db = Session()
+        barrier.wait()
+        try:
+            codes.append(_create(db)["code"])
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=fire) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert codes.count(200) == 1
+    assert codes.count(ErrorCode.CONFLICT.value) == workers - 1
+    with Session() as db:
+        assert db.scalar(select(func.count()).select_from(ResearchChatProcessInfo)) == 1
+
+
+def test_sequential_create_with_stale_snapshot_hits_db_guard(monkeypatch, tmp_path):
+    """锁释放后另一 worker 再获取锁，但其事务快照看不到已提交的任务：由唯一约束兜底"""
+    from sqlalchemy import func, select
+
+    from app.entity.research_chat import ResearchChatProcessInfo
+
+    Session = _sqlite_create_env(monkeypatch, tmp_path)
+    with Session() as db:
+        assert _create(db)["code"] == 200
+
+    class StaleSnapshotSession:
+        """模拟 REPEATABLE READ 快照：进行中任务的检查读不到其他 worker 已提交的行"""
+
+        def __init__(self, db):
+            self._db = db
+            self.locking_reads = []
+
+        def scalar(self, stmt):
+            entity = stmt.column_descriptions[0].get("entity")
+            if entity is ResearchChatProcessInfo:
+                self.locking_reads.append(stmt._for_update_arg is not None)
+                return None
+            return self._db.scalar(stmt)
+
+        def __getattr__(self, name):
+            return getattr(self._db, name)
+
+    with Session() as db:
+        stale = StaleSnapshotSession(db)
+        out = _create(stale, content="second")
+    assert out["code"] == ErrorCode.CONFLICT.value
+    assert stale.locking_reads == [True]
+    with Session() as db:
+        assert db.scalar(select(func.count()).select_from(ResearchChatProcessInfo)) == 1
+
+    # 前一任务结束后可以再次创建
+    with Session() as db:
+        db.query(ResearchChatProcessInfo).one().creation_status = routes.CreationStatus.CREATED
+        db.commit()
+        assert _create(db, content="third")["code"] == 200
@@ -213,3 +213,14 @@ def test_websocket_status_close_timeout_path(monkeypatch):
     assert dummy.close_started is True
     # Since close timed out, our dummy did not flip to DISCONNECTED/closed
     assert dummy._closed is False
+
+
+def test_build_status_message_includes_queue_position_for_pending(monkeypatch):
+    monkeypatch.setattr(ws.task_scheduler, "position", lambda key: 4 if key == 7 else None)
+    pending = types.SimpleNamespace(message_id=7, creation_status=ws.CreationStatus.PENDING, process_info={"logs": []})
+    out = ws.build_status_message(pending)
+    assert out["data"]["queue_position"] == 4
+    assert out["message"] == "任务排队中"
+
+    running = types.SimpleNamespace(message_id=7, creation_status=ws.CreationStatus.CREATING, process_info={"logs": []})
+    assert "queue_position" not in ws.build_status_message(running)["data"]
@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.config import Config
+from app.services import admission
+from app.services.admission import AdmissionController, EventLoopLagMonitor, EwmaLatency, UserRateLimiter
+
+
+def make_controller(rate_limiter=None, queued=0, checked_out=0, latency=None, lag=0.0):
+    monitor = EventLoopLagMonitor()
+    monitor.lag = lag
+    return AdmissionController(
+        rate_limiter=rate_limiter,
+        queue_stats=lambda: {"queued": queued},
+        max_queued=10,
+        pool_checked_out=lambda: checked_out,
+        pool_capacity=60,
+        llm_latency=latency or EwmaLatency(),
+        loop_monitor=monitor,
+    )
+
+
+def test_rate_limiter_returns_retry_after_when_exceeded():
+    limiter = UserRateLimiter("2 per minute", None)
+    assert limiter.hit("u1") is None
+    assert limiter.hit("u1") is None
+    retry_after = limiter.hit("u1")
+    assert 1 <= retry_after <= 61
+    assert limiter.hit("u2") is None
+
+
+def test_rate_limiter_falls_back_to_memory_when_storage_down():
+    class BrokenLimiter:
+        def hit(self, item, key):
+            raise ConnectionError("redis down")
+
+    limiter = UserRateLimiter("1 per minute", None)
+    limiter._primary = BrokenLimiter()
+    assert limiter.hit("u1") is None
+    assert limiter.hit("u1") is not None
+    assert limiter._primary_failed_at > 0
+
+
+def test_overload_signals(monkeypatch):
+    monkeypatch.setattr(Config, "ADMISSION_QUEUE_HIGH_WATERMARK", 0.8)
+    monkeypatch.setattr(Config, "ADMISSION_DB_POOL_HIGH_WATERMARK", 0.9)
+    monkeypatch.setattr(Config, "ADMISSION_LLM_LATENCY_SECONDS", 60.0)
+    monkeypatch.setattr(Config, "ADMISSION_LOOP_LAG_SECONDS", 0.5)
+    monkeypatch.setattr(Config, "ADMISSION_RETRY_AFTER_SECONDS", 7)
+
+    slow = EwmaLatency()
+    slow.observe(90)
+
+    assert make_controller().check(1) is None
+    assert make_controller(queued=8).check(1).reason == "queue_depth"
+    assert make_controller(checked_out=54).check(1).reason == "db_pool"
+    assert make_controller(latency=slow).check(1).reason == "llm_latency"
+    decision = make_controller(lag=0.6).check(1)
+    assert (decision.reason, decision.retry_after) == ("loop_lag", 7)
+
+    monkeypatch.setattr(Config, "ADMISSION_LOOP_LAG_SECONDS", 0)
+    assert make_controller(lag=5).check(1) is None
+
+
+def test_ewma_latency_smooths_observations():
+    ewma = EwmaLatency(alpha=0.5, half_life=0)
+    ewma.observe(10)
+    ewma.observe(20)
+    assert ewma.value == 15
+
+
+def test_ewma_latency_decays_without_new_samples(monkeypatch):
+    monkeypatch.setattr(Config, "ADMISSION_LLM_LATENCY_SECONDS", 60.0)
+    now = [0.0]
+    slow = EwmaLatency(alpha=0.5, half_life=30, clock=lambda: now[0])
+    slow.observe(200)
+    controller = make_controller(latency=slow)
+    assert controller.check(1).reason == "llm_latency"
+
+    # 拒绝期间没有新的调用，信号仍随时间恢复
+    now[0] = 60
+    assert slow.value == 50
+    now[0] = 90
+    assert controller.check(1) is None
+    # 新样本与衰减后的值混合
+    slow.observe(25)
+    assert slow.value == 25
+
+
+def test_llm_failures_raise_latency_signal(monkeypatch):
+    import requests
+
+    from app.services import llm_service
+
+    latency = EwmaLatency(alpha=1.0, half_life=0)
+    monkeypatch.setattr(llm_service, "llm_latency", latency)
+
+    def refused(url, headers=None, json=None, timeout=None):
+        raise requests.exceptions.ConnectionError("refused")
+
+    monkeypatch.setattr(requests, "post", refused)
+    client = llm_service.LLMClient(provider="custom", max_retries=1, timeout=45)
+    with pytest.raises(Exception):
+        client.get_response("hello")
+    assert latency.value == 45
+
+
+def test_loop_lag_monitor_measures_blocking(monkeypatch):
+    monkeypatch.setattr(admission.EVENT_LOOP_LAG_SECONDS, "set", lambda v: None)
+
+    async def scenario():
+        monitor = EventLoopLagMonitor(interval=0.01)
+        monitor.start()
+        await asyncio.sleep(0)
+        time.sleep(0.1)  # 阻塞事件循环
+        await asyncio.sleep(0.005)  # 让监控协程在下一个间隔之前醒来一次
+        lag = monitor.lag
+        await monitor.stop()
+        return lag
+
+    assert asyncio.run(scenario()) >= 0.05
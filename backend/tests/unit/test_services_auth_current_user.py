@@ -72,7 +72,7 @@ def test_get_current_user_success(monkeypatch):
     monkeypatch.setattr(auth_mod.jwt_manager, "decode_token", lambda t: {"user_id": 1, "email": "e"})
     user = DummyUser(id=1, email="e", is_active=True)
     out = asyncio.run(get_current_user(authorization="Bearer x", db=DummyDB(user)))
-    assert out == {"user_id": 1, "email": "e"}
+    assert out == {"user_id": 1, "email": "e", "identity_tag": None}
 
 
 def test_verify_user_credentials_success(monkeypatch):
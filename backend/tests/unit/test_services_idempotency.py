@@ -0,0 +1,81 @@
+import asyncio
+
+import redis
+
+from app.core.kv_store import KeyValueStore
+from app.routes import chat_routes as routes
+from app.services.idempotency import IN_PROGRESS, MISMATCH, NEW, REPLAY, IdempotencyStore
+from app.utils.error_handler import ErrorCode, ErrorResponse
+
+
+def make_store():
+    return IdempotencyStore(KeyValueStore(None), ttl_seconds=60, lock_seconds=5)
+
+
+def test_begin_is_atomic_and_replays_completed_result():
+    store = make_store()
+    assert store.begin("create", 1, "k", "fp") == (NEW, None)
+    assert store.begin("create", 1, "k", "fp") == (IN_PROGRESS, None)
+    assert store.begin("create", 2, "k", "fp") == (NEW, None)  # 按用户隔离
+    assert store.begin("create", 1, "k", "other") == (MISMATCH, None)
+
+    store.complete("create", 1, "k", "fp", {"message_id": 7})
+    assert store.begin("create", 1, "k", "fp") == (REPLAY, {"message_id": 7})
+
+    store.abort("create", 2, "k")
+    assert store.begin("create", 2, "k", "fp") == (NEW, None)
+
+
+def test_kv_store_falls_back_to_memory_when_redis_fails():
+    class BrokenRedis:
+        def set(self, *args, **kwargs):
+            raise redis.ConnectionError("down")
+
+        get = delete = set
+
+    kv = KeyValueStore(None)
+    kv._redis = BrokenRedis()
+    assert kv.set_if_absent("a", {"v": 1}, 10) is True
+    assert kv.set_if_absent("a", {"v": 2}, 10) is False
+    assert kv.get("a") == {"v": 1}
+
+
+def call_create(key, content="hello"):
+    resp = type("Resp", (), {"status_code": 200, "headers": {}})()
+    out = asyncio.run(routes.create_research(
+        request=routes.CreateResearchRequest(content=content, session_id=None, locale="cn"),
+        response=resp,
+        x_page_id=None,
+        idempotency_key=key,
+        current_user={"user_id": 1, "email": "e"},
+        db=None,
+    ))
+    return resp, out
+
+
+def test_create_research_duplicate_key_returns_original_message(monkeypatch):
+    results = [
+        ErrorResponse.create_error_response(ErrorCode.TOO_MANY_REQUESTS, "busy"),
+        ErrorResponse.success_response("ok", {"message_id": 20, "session_id": "s1", "queue_position": 0}),
+    ]
+    calls = []
+
+    def fake_create(*args):
+        calls.append(args)
+        return results[len(calls) - 1]
+
+    monkeypatch.setattr(routes, "idempotency_store", make_store())
+    monkeypatch.setattr(routes, "_create_research", fake_create)
+
+    # 首次被拒绝时释放占位，重试可以正常创建
+    assert call_create("retry-1")[1]["code"] == ErrorCode.TOO_MANY_REQUESTS.value
+    assert call_create("retry-1")[1]["data"]["message_id"] == 20
+
+    resp, out = call_create("retry-1")
+    assert len(calls) == 2
+    assert out["data"] == {"message_id": 20, "session_id": "s1", "queue_position": 0}
+    assert resp.headers["Idempotent-Replayed"] == "true"
+
+    resp, out = call_create("retry-1", content="something else")
+    assert resp.status_code == ErrorCode.UNPROCESSABLE_ENTITY.value
+    assert len(calls) == 2
@@ -0,0 +1,61 @@
+import pytest
+
+from app.core.config import Config
+from app.services.keyword_extractor import extract_keywords, keyword_agreement, rake_keywords
+
+
+def test_rake_extracts_noun_phrases_and_skips_request_boilerplate():
+    result = rake_keywords("I want to research graph neural networks for drug discovery")
+    assert result.keywords == ["graph neural networks", "drug discovery"]
+    assert result.confidence == 1.0
+
+
+def test_confidence_drops_for_chinese_and_long_queries():
+    assert rake_keywords("大语言模型幻觉检测").keywords == []
+    assert rake_keywords("基于 transformer 的时间序列预测").confidence < 0.6
+    long_query = ("privacy attacks, model compression, edge devices, communication cost, "
+                  "client drift and fairness in federated learning")
+    assert rake_keywords(long_query).confidence < 0.6
+
+
+def test_low_quality_phrases_have_low_confidence():
+    assert rake_keywords("make it better").keywords == []
+    vague = rake_keywords("I want to do research on how transformers work")
+    assert vague.keywords == ["transformers"]
+    assert vague.confidence < Config.KEYWORD_LOCAL_MIN_CONFIDENCE
+
+
+def test_agreement_is_word_level_jaccard():
+    assert keyword_agreement(["graph neural networks"], "graph neural networks, drug discovery") == pytest.approx(0.6)
+    assert keyword_agreement([], "") == 1.0
+
+
+def test_local_mode_skips_llm_when_confident(monkeypatch):
+    monkeypatch.setattr(Config, "KEYWORD_EXTRACTOR_MODE", "local")
+    calls = []
+
+    def call_llm():
+        calls.append(1)
+        return "time series, transformer"
+
+    assert extract_keywords("diffusion models for protein design", call_llm) == ("diffusion models, protein design", "local")
+    assert extract_keywords("基于 transformer 的时间序列预测", call_llm) == ("time series, transformer", "llm")
+    assert len(calls) == 1
+
+
+def test_local_mode_falls_back_to_llm_for_low_quality_input(monkeypatch):
+    monkeypatch.setattr(Config, "KEYWORD_EXTRACTOR_MODE", "local")
+    calls = []
+
+    def call_llm():
+        calls.append(1)
+        return "transformer architecture"
+
+    assert extract_keywords("make it better", call_llm) == ("transformer architecture", "llm")
+    assert extract_keywords("I want to do research on how transformers work", call_llm) == ("transformer architecture", "llm")
+    assert len(calls) == 2
+
+
+def test_shadow_mode_always_uses_llm(monkeypatch):
+    monkeypatch.setattr(Config, "KEYWORD_EXTRACTOR_MODE", "shadow")
+    assert extract_keywords("diffusion models", lambda: "diffusion model") == ("diffusion model", "llm")
@@ -0,0 +1,162 @@
+import pytest
+import requests
+
+from app.core.config import Config
+from app.services import llm_balancer
+from app.services.llm_balancer import EndpointPool, is_endpoint_failure, parse_endpoints
+from app.services.llm_service import LLMClient
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class DummyResp:
+    def __init__(self, content="ok"):
+        self.content = content
+
+    def raise_for_status(self):
+        return None
+
+    def json(self):
+        return {"choices": [{"message": {"content": self.content}}]}
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f"{status}", response=response)
+
+
+@pytest.fixture(autouse=True)
+def fresh_pools():
+    llm_balancer.reset_endpoint_pools()
+    yield
+    llm_balancer.reset_endpoint_pools()
+
+
+def test_parse_endpoints_weights_and_errors():
+    assert parse_endpoints(" http://a/v1/|2, http://b/v1 ,") == [("http://a/v1", 2.0), ("http://b/v1", 1.0)]
+    with pytest.raises(ValueError):
+        parse_endpoints("http://a/v1|0")
+    with pytest.raises(ValueError):
+        parse_endpoints(" , ")
+
+
+def test_endpoint_failure_classification():
+    assert is_endpoint_failure(requests.exceptions.ConnectionError())
+    assert is_endpoint_failure(http_error(503))
+    assert is_endpoint_failure(http_error(429))
+    assert not is_endpoint_failure(http_error(400))
+
+
+def test_pool_prefers_low_latency_weighted_endpoint():
+    pool = EndpointPool([("a", 1.0), ("b", 1.0), ("c", 4.0)], clock=Clock())
+    # 尚无耗时数据的端点先被试探
+    seen = set()
+    for _ in range(3):
+        endpoint = pool.acquire()
+        seen.add(endpoint.url)
+        pool.release(endpoint, {"a": 1.0, "b": 3.0, "c": 2.0}[endpoint.url], True)
+    assert seen == {"a", "b", "c"}
+    # c: 2.0 / 4 < a: 1.0 / 1
+    assert pool.acquire().url == "c"
+    # 进行中请求数计入得分：c 变为 2.0 * 2 / 4，与 a 持平时选进行中请求较少的 a
+    assert pool.acquire().url == "a"
+    assert pool.acquire().url == "c"
+
+
+def test_slow_endpoint_is_probed_again_after_latency_decays():
+    clock = Clock()
+    pool = EndpointPool([("a", 1.0), ("b", 1.0)], half_life=60, clock=clock)
+    for url, seconds in (("a", 1.0), ("b", 8.0)):
+        endpoint = pool.acquire(exclude=[e.url for e in pool.endpoints if e.url != url])
+        pool.release(endpoint, seconds, True)
+
+    # 流量持续时 a 的耗时保持新鲜（约 1s）；b 没有新样本，8s 约 3 个半衰期后衰减到 1s 以下，再收到一次请求
+    picks = []
+    for _ in range(30):
+        clock.now += 10
+        endpoint = pool.acquire()
+        picks.append(endpoint.url)
+        pool.release(endpoint, 1.0, True)
+    first_probe = picks.index("b")
+    assert 15 <= first_probe <= 20
+    # b 已恢复，新样本拉低其耗时，重新参与分流
+    assert picks[first_probe + 1:].count("b") > 0
+
+
+def test_breaker_opens_half_opens_and_recovers():
+    clock = Clock()
+    pool = EndpointPool([("a", 1.0), ("b", 1.0)], failure_threshold=2, cooldown_seconds=30, clock=clock)
+    pool.release(pool.acquire(exclude={"b"}), 0.1, True)
+    pool.release(pool.acquire(exclude={"a"}), 0.5, True)
+
+    for _ in range(2):
+        endpoint = pool.acquire(exclude={"b"})
+        assert endpoint.url == "a"
+        pool.release(endpoint, 5.0, False)
+    assert {s["url"]: s["state"] for s in pool.stats()} == {"a": "open", "b": "closed"}
+    assert pool.acquire(exclude={"b"}).url == "b"  # 熔断端点即使未被排除也不选择
+
+    clock.now += 30
+    probe = pool.acquire(exclude={"b"})
+    assert probe.url == "a" and probe.state == "half_open"
+    # 试探期间不再放行其他请求
+    assert not pool.has_alternative({"b"})
+    pool.release(probe, 5.0, False)
+    assert probe.state == "open" and probe.opened_at == clock.now
+
+    clock.now += 30
+    probe = pool.acquire(exclude={"b"})
+    pool.release(probe, 0.1, True)
+    assert probe.state == "closed" and probe.consecutive_failures == 0
+
+
+def test_client_errors_do_not_trip_breaker():
+    pool = EndpointPool([("a", 1.0)], failure_threshold=1)
+    endpoint = pool.acquire()
+    pool.release(endpoint, 0.1, None)
+    assert endpoint.state == "closed" and endpoint.failures == 0 and endpoint.in_flight == 0
+
+
+def test_all_open_falls_back_to_earliest_recovering_endpoint():
+    clock = Clock()
+    pool = EndpointPool([("a", 1.0), ("b", 1.0)], failure_threshold=1, cooldown_seconds=30, clock=clock)
+    pool.release(pool.acquire(exclude={"b"}), 1.0, False)
+    clock.now += 5
+    pool.release(pool.acquire(exclude={"a"}), 1.0, False)
+    assert pool.acquire().url == "a"
+
+
+def test_client_fails_over_without_backoff(monkeypatch):
+    monkeypatch.setattr(Config, "CUSTOM_API_ENDPOINT", "http://bad/v1,http://good/v1")
+    urls = []
+
+    def fake_post(url, headers=None, json=None, timeout=None):
+        urls.append(url)
+        if url.startswith("http://bad"):
+            raise requests.exceptions.ConnectionError("refused")
+        return DummyResp()
+
+    sleeps = []
+    monkeypatch.setattr(requests, "post", fake_post)
+    monkeypatch.setattr("time.sleep", lambda seconds: sleeps.append(seconds))
+
+    client = LLMClient(provider="custom")
+    # 首次调用两个端点都没有耗时数据，按配置顺序先选中 bad
+    assert client.get_response("hello") == "ok"
+    assert urls == ["http://bad/v1/chat/completions", "http://good/v1/chat/completions"]
+    assert sleeps == []
+    # 之后优先选择健康且更快的端点
+    urls.clear()
+    assert client.get_response("hello") == "ok"
+    assert urls == ["http://good/v1/chat/completions"]
+
+    stats = {s["url"]: s for s in client.get_config_info()["endpoints"]}
+    assert stats["http://bad/v1"]["failures"] == 1
+    assert stats["http://good/v1"]["requests"] == 2 and stats["http://good/v1"]["in_flight"] == 0
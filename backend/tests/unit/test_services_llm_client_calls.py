@@ -66,3 +66,37 @@ def test_llm_client_request_exception_raises(monkeypatch):
     client.max_retries = 2
     with pytest.raises(Exception):
         client.get_response("hello")
+
+
+def test_llm_client_routes_by_template(monkeypatch):
+    from app.core.config import Config
+
+    calls = []
+
+    def fake_post(url, headers=None, json=None, timeout=None):
+        calls.append((url, headers["Authorization"], json))
+        return DummyResp()
+
+    monkeypatch.setattr(requests, "post", fake_post)
+    monkeypatch.setattr(Config, "CUSTOM_MODEL", "big-model")
+    monkeypatch.setattr(Config, "CUSTOM_API_ENDPOINT", "http://big/v1")
+    monkeypatch.setattr(Config, "CUSTOM_API_KEY", "sk-big")
+    monkeypatch.setattr(Config, "CUSTOM_MAX_TOKENS", 0)
+    monkeypatch.setattr(Config, "LLM_ROUTES", {
+        "retrieve_query": {"model": "small-model", "endpoint": "http://small/v1", "temperature": 0.0, "max_tokens": 32},
+    })
+
+    client = LLMClient(provider="custom")
+    client.get_response("keywords", template="retrieve_query")
+    client.get_response("plan", template="generate_research_plan")
+    client.get_response("critique", template="retrieve_query", temperature=0.3)
+
+    (url, auth, body), (plan_url, plan_auth, plan_body), (_, _, override_body) = calls
+    assert url == "http://small/v1/chat/completions" and auth == "Bearer sk-big"
+    assert body["model"] == "small-model" and body["temperature"] == 0.0 and body["max_tokens"] == 32
+    assert plan_url == "http://big/v1/chat/completions"
+    assert plan_body["model"] == "big-model" and "max_tokens" not in plan_body
+    assert override_body["temperature"] == 0.3
+    # 调用结束后恢复客户端默认参数
+    assert client.llm == "big-model" and client.endpoint == "http://big/v1" and client.max_tokens == 0
+    assert client.get_config_info()["routes"]["retrieve_query"] == "small-model"
@@ -0,0 +1,77 @@
+import pytest
+import requests
+
+from app.services import llm_fixtures, llm_service
+from app.services.llm_fixtures import FixtureNotFoundError, FixtureStore
+from app.services.llm_service import LLMClient
+
+
+class DummyResp:
+    def __init__(self, payload):
+        self._payload = payload
+
+    def raise_for_status(self):
+        return None
+
+    def json(self):
+        return self._payload
+
+
+@pytest.fixture
+def use_store():
+    def _use(store):
+        llm_fixtures.set_fixture_store(store)
+        return store
+    yield _use
+    llm_fixtures.set_fixture_store(None)
+
+
+def test_llm_record_then_replay_without_network(monkeypatch, tmp_path, use_store):
+    use_store(FixtureStore("record", str(tmp_path)))
+    monkeypatch.setattr(requests, "post", lambda *a, **k: DummyResp({
+        "choices": [{"message": {"content": "recorded"}}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 5},
+    }))
+    assert LLMClient(provider="custom").get_response("hello") == "recorded"
+    assert len(list((tmp_path / "llm").iterdir())) == 1
+
+    use_store(FixtureStore("replay", str(tmp_path), latency="zero"))
+
+    def no_network(*a, **k):
+        raise AssertionError("network call during replay")
+
+    monkeypatch.setattr(requests, "post", no_network)
+    assert LLMClient(provider="custom").get_response("hello") == "recorded"
+
+    # 温度不同视为不同请求
+    with pytest.raises(FixtureNotFoundError):
+        LLMClient(provider="custom").get_response("hello", temperature=0.1)
+
+
+def test_s2_record_then_replay_respects_max_results(monkeypatch, tmp_path, use_store):
+    papers = [{"title": f"t{i}", "abstract": "a"} for i in range(5)]
+    use_store(FixtureStore("record", str(tmp_path)))
+    monkeypatch.setattr(llm_service.requests, "get", lambda *a, **k: DummyResp({"data": papers}))
+    assert len(llm_service.get_relevence_paper("gnn", max_results=5)) == 5
+
+    use_store(FixtureStore("replay", str(tmp_path), latency="zero"))
+    monkeypatch.setattr(llm_service.requests, "get", lambda *a, **k: pytest.fail("network call during replay"))
+    assert llm_service.get_relevence_paper("gnn", max_results=2) == papers[:2]
+    with pytest.raises(FixtureNotFoundError):
+        llm_service.get_newest_paper("gnn")
+
+
+def test_replay_sleeps_for_recorded_latency(monkeypatch, tmp_path):
+    store = FixtureStore("record", str(tmp_path))
+    store.record("llm", {"k": 1}, {"content": "x"}, elapsed=1.5)
+    slept = []
+    monkeypatch.setattr(llm_fixtures.time, "sleep", slept.append)
+
+    assert FixtureStore("replay", str(tmp_path)).replay("llm", {"k": 1}) == {"content": "x"}
+    assert FixtureStore("replay", str(tmp_path), latency="zero").replay("llm", {"k": 1}) == {"content": "x"}
+    assert slept == [1.5]
+
+
+def test_invalid_mode_rejected():
+    with pytest.raises(ValueError):
+        FixtureStore("rewind")
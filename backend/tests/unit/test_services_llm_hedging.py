@@ -0,0 +1,110 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from app.core.config import Config
+from app.services import llm_balancer, llm_service
+from app.services.llm_hedging import HedgePolicy, first_success
+from app.services.llm_service import LLMClient
+
+
+class DummyResp:
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        return None
+
+    def json(self):
+        return {"choices": [{"message": {"content": self.content}}]}
+
+
+def test_delay_requires_min_samples_and_is_per_key():
+    policy = HedgePolicy(percentile=90, min_samples=10, window=10)
+    for i in range(1, 10):
+        policy.observe("plan", float(i))
+    assert policy.delay("plan") is None
+    policy.observe("plan", 10.0)
+    assert policy.delay("plan") == 10.0
+    # 只保留最近 window 个样本
+    for _ in range(10):
+        policy.observe("plan", 1.0)
+    assert policy.delay("plan") == 1.0
+    assert policy.delay("retrieve_query") is None
+
+
+def test_budget_caps_hedge_rate():
+    policy = HedgePolicy(max_rate=0.1, burst=2)
+    hedges = 0
+    for _ in range(100):
+        policy.on_request()
+        hedges += policy.try_hedge()
+    assert 9 <= hedges <= 10
+    # 空闲期间累积的令牌不超过 burst
+    for _ in range(100):
+        policy.on_request()
+    assert sum(policy.try_hedge() for _ in range(5)) == 2
+
+
+def test_first_success_skips_failures():
+    with ThreadPoolExecutor(2) as pool:
+        failing = pool.submit(lambda: (_ for _ in ()).throw(ValueError("boom")))
+        slow = pool.submit(lambda: time.sleep(0.05) or "ok")
+        assert first_success([failing, slow]).result() == "ok"
+        with pytest.raises(ValueError):
+            first_success([pool.submit(lambda: (_ for _ in ()).throw(ValueError("boom")))])
+
+
+@pytest.fixture
+def hedged(monkeypatch):
+    policy = HedgePolicy(percentile=50, min_samples=1, max_rate=1.0, burst=1)
+    policy.observe("get_inspiration", 0.05)
+    monkeypatch.setattr(llm_service, "hedge_policy", policy)
+    monkeypatch.setattr(Config, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(Config, "CUSTOM_API_ENDPOINT", "http://slow/v1,http://fast/v1")
+    llm_balancer.reset_endpoint_pools()
+    # 先选中 slow 端点
+    pool = llm_balancer.get_endpoint_pool(Config.CUSTOM_API_ENDPOINT)
+    pool.release(pool.acquire(exclude={"http://fast/v1"}), 0.01, True)
+    pool.release(pool.acquire(exclude={"http://slow/v1"}), 0.02, True)
+    release = threading.Event()
+    calls = []
+
+    def fake_post(url, headers=None, json=None, timeout=None):
+        calls.append(url)
+        if url.startswith("http://slow"):
+            release.wait(5)
+            return DummyResp("slow")
+        return DummyResp("fast")
+
+    monkeypatch.setattr(requests, "post", fake_post)
+    yield policy, pool, calls, release
+    release.set()
+    llm_balancer.reset_endpoint_pools()
+
+
+def test_hedge_to_other_endpoint_wins(hedged):
+    policy, pool, calls, release = hedged
+    client = LLMClient(provider="custom")
+    assert client.get_response("hello", template="get_inspiration") == "fast"
+    assert calls == ["http://slow/v1/chat/completions", "http://fast/v1/chat/completions"]
+    assert "get_inspiration" in client.get_config_info()["hedging"]["samples"]
+
+
+def test_hedge_budget_exhausted_waits_for_primary(hedged):
+    policy, pool, calls, release = hedged
+    policy.max_rate = 0.0
+    client = LLMClient(provider="custom")
+
+    result = {}
+    worker = threading.Thread(target=lambda: result.update(out=client.get_response("hello", template="get_inspiration")))
+    worker.start()
+    time.sleep(0.2)
+    assert calls == ["http://slow/v1/chat/completions"]
+    release.set()
+    worker.join(5)
+    assert result["out"] == "slow"
+    assert {s["url"]: s["in_flight"] for s in pool.stats()} == {"http://slow/v1": 0, "http://fast/v1": 0}
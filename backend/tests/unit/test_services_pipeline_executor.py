@@ -0,0 +1,44 @@
+import contextvars
+import threading
+
+import pytest
+
+from app.services.pipeline_executor import PipelineExecutor, PipelineRejectedError
+
+
+@pytest.fixture
+def executor():
+    ex = PipelineExecutor(max_workers=1, name="test-pipeline")
+    yield ex
+    ex.shutdown(wait=True)
+
+
+def test_tracks_active_tasks(executor):
+    started, release = threading.Event(), threading.Event()
+
+    def blocking():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    future = executor.submit(blocking)
+    assert started.wait(5)
+    assert executor.stats() == {"max_workers": 1, "active": 1}
+
+    release.set()
+    assert future.result(5) == "done"
+    assert executor.stats()["active"] == 0
+
+
+def test_submit_propagates_contextvars(executor):
+    var = contextvars.ContextVar("trace", default=None)
+    var.set("trace-123")
+    assert executor.submit(var.get).result(5) == "trace-123"
+
+
+def test_submit_after_shutdown_is_rejected():
+    ex = PipelineExecutor(max_workers=1)
+    ex.shutdown(wait=True)
+    with pytest.raises(PipelineRejectedError):
+        ex.submit(lambda: None)
+    assert ex.stats()["active"] == 0
@@ -0,0 +1,81 @@
+from app.services.llm_service import construct_paper
+from app.services.prompt_budget import (
+    abstract_limit,
+    compact_abstract,
+    dedupe_papers,
+    estimate_tokens,
+)
+
+
+def test_estimate_tokens_counts_cjk_per_char():
+    assert estimate_tokens(None) == 0
+    assert estimate_tokens("abcd" * 10) == 10
+    assert estimate_tokens("大语言模型") == 5
+
+
+def test_dedupe_by_paper_id_then_title():
+    newest = [{"paperId": "1", "title": "A"}, {"title": "Graph  Learning!"}]
+    cited = [{"paperId": "1", "title": "A (dup)"}, {"paperId": "2", "title": "B"}]
+    relevant = [{"title": "graph learning"}, {"paperId": "2", "title": "B"}, {"paperId": "3", "title": "C"}]
+    result = dedupe_papers([newest, cited, None, relevant])
+    assert [[p["title"] for p in papers] for papers in result] == [["A", "Graph  Learning!"], ["B"], [], ["C"]]
+
+
+def test_dedupe_prefers_copy_with_abstract():
+    newest = [{"paperId": "1", "title": "A", "abstract": None}, {"paperId": "2", "title": "B", "abstract": "kept"}]
+    cited = [{"paperId": "3", "title": "C", "abstract": ""}, {"paperId": "1", "title": "A", "abstract": "found"}]
+    relevant = [{"paperId": "3", "title": "C", "abstract": "late"}, {"paperId": "2", "title": "B", "abstract": "other"}]
+    result = dedupe_papers([newest, cited, relevant])
+    # 位置不变，缺摘要的副本被后续带摘要的副本替换，已有摘要的不被覆盖
+    assert [[p["abstract"] for p in papers] for papers in result] == [["found", "kept"], ["late"], []]
+
+
+def test_abstract_limit_water_fills():
+    # 短摘要用不完的额度留给长摘要
+    assert abstract_limit([10, 100, 100], 110) == 50
+    assert abstract_limit([10, 20], 100) == 20
+    assert abstract_limit([], 100) == 0
+    assert abstract_limit([50], -5) == 0
+
+
+def test_compact_abstract_keeps_leading_sentences():
+    abstract = "First sentence here.  Second sentence follows!\nThird one is long " + "word " * 50
+    assert compact_abstract(abstract, None) == " ".join(abstract.split())
+    assert compact_abstract(abstract, 0) == ""
+    assert compact_abstract(abstract, 1) == ""
+    compact = compact_abstract(abstract, 15)
+    assert compact == "First sentence here. Second sentence follows! …"
+    assert estimate_tokens(compact) <= 15
+    # 单句超限时按词截断
+    long_sentence = compact_abstract("word " * 100, 10)
+    assert long_sentence.endswith(" …") and estimate_tokens(long_sentence) <= 10
+    cjk = compact_abstract("这是第一句。这是第二句，比较长一些。", 8)
+    assert cjk == "这是第一句。 …"
+
+
+def test_construct_paper_dedupes_drops_empty_and_fits_budget():
+    long_abstract = " ".join(f"Sentence number {i} describes the method." for i in range(40))
+    newest = [{"paperId": "1", "title": "T1", "abstract": long_abstract}, {"paperId": "2", "title": "T2", "abstract": None}]
+    cited = [{"paperId": "1", "title": "T1", "abstract": long_abstract}, {"paperId": "3", "title": "T3", "abstract": "Short."}]
+    relevant = [{"paperId": "4", "title": "T4", "abstract": "  "}]
+
+    paper = construct_paper(newest, cited, relevant, token_budget=120, abstract_max_tokens=300)
+    assert paper.count("Title: T1") == 1
+    assert "None" not in paper and "Title: T2\n\n" in paper and "Title: T4\n\n" in paper
+    assert "Abstract: Short.\n" in paper
+    assert "The relevent paper:\nTitle: T4" in paper
+    assert estimate_tokens(paper) <= 120
+
+    unlimited = construct_paper(newest, cited, relevant, token_budget=0, abstract_max_tokens=0)
+    assert long_abstract in unlimited
+    capped = construct_paper(newest, cited, relevant, token_budget=0, abstract_max_tokens=50)
+    assert long_abstract not in capped and " …\n" in capped
+
+
+def test_construct_paper_titles_only_when_titles_exhaust_budget():
+    abstract = " ".join(f"Sentence number {i} describes the method." for i in range(40))
+    newest = [{"paperId": str(i), "title": f"A fairly long paper title number {i}", "abstract": abstract} for i in range(10)]
+
+    paper = construct_paper(newest, [], [], token_budget=50, abstract_max_tokens=300)
+    assert "Abstract:" not in paper
+    assert paper.count("Title: ") == 10
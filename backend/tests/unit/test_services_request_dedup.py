@@ -0,0 +1,121 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.constants.task_status import CreationStatus
+from app.core.kv_store import KeyValueStore
+from app.entity.research_chat import ResearchChatMessage, ResearchChatProcessInfo
+from app.routes import chat_routes as routes
+from app.services import request_dedup as dedup
+from app.services import task_recovery
+from app.utils.tools import UTC8
+
+
+@pytest.fixture
+def dedup_env(env, monkeypatch):
+    deduplicator = dedup.RequestDeduplicator(KeyValueStore(None), True, 3600, 3600)
+    monkeypatch.setattr(dedup, "request_dedup", deduplicator)
+    monkeypatch.setattr(dedup, "SessionLocal", env[0])
+    return env + (deduplicator,)
+
+
+def finish(Session, message_id, status=CreationStatus.CREATED):
+    with Session() as db:
+        db.get(ResearchChatMessage, message_id).result_papers = {"response": "plan"}
+        db.query(ResearchChatProcessInfo).filter_by(message_id=message_id).one().creation_status = status
+        db.commit()
+
+
+def test_fingerprint_ignores_case_and_whitespace_but_not_locale():
+    fp = dedup.content_fingerprint("Graph  Learning\n", "cn", "m")
+    assert fp == dedup.content_fingerprint(" graph learning", "cn", "m")
+    assert fp != dedup.content_fingerprint("graph learning", "en", "m")
+    assert fp != dedup.content_fingerprint("graph learning", "cn", "other")
+
+
+def test_fingerprint_changes_with_template_routes(monkeypatch):
+    from app.core.config import Config
+
+    deduplicator = dedup.RequestDeduplicator(KeyValueStore(None), True, 3600, 3600)
+    before = deduplicator.fingerprint("graph learning", "cn")
+    monkeypatch.setattr(Config, "LLM_ROUTES", {"critic_research_plan": {"model": "small-model"}})
+    assert deduplicator.fingerprint("graph learning", "cn") != before
+
+
+def test_leader_success_fans_out_and_publishes_result(dedup_env, seed, load_proc):
+    Session, scheduler, executor, deduplicator = dedup_env
+    leader = seed(Session, age_seconds=0)
+    follower = seed(Session, status=CreationStatus.PENDING, age_seconds=0, extra_info={"dedup_of": leader})
+    fp = deduplicator.fingerprint("graph learning", "cn")
+    assert deduplicator.claim_leader(fp, leader)
+    assert deduplicator.find(fp) == (dedup.RUNNING, leader)
+    deduplicator.attach(leader, follower)
+
+    finish(Session, leader)
+    dedup.finish_leader("graph learning", "cn", leader, True)
+
+    proc = load_proc(Session, follower)
+    assert proc.creation_status == CreationStatus.CREATED
+    assert proc.extra_info["deduplicated_from"] == leader
+    with Session() as db:
+        # 返回给客户端的结果不暴露其他用户的 message_id
+        assert db.get(ResearchChatMessage, follower).result_papers == {"response": "plan"}
+    assert deduplicator.find(fp) == (dedup.COMPLETED, leader)
+
+
+def test_leader_failure_releases_followers_to_run_independently(dedup_env, seed, load_proc):
+    Session, scheduler, executor, deduplicator = dedup_env
+    leader = seed(Session, age_seconds=0)
+    follower = seed(Session, status=CreationStatus.PENDING, age_seconds=0,
+                    extra_info={"locale": "cn", "recovery_attempts": 1, "dedup_of": leader})
+    deduplicator.claim_leader(deduplicator.fingerprint("graph learning", "cn"), leader)
+    deduplicator.attach(leader, follower)
+
+    finish(Session, leader, CreationStatus.FAILED)
+    dedup.finish_leader("graph learning", "cn", leader, False)
+    assert deduplicator.find(deduplicator.fingerprint("graph learning", "cn")) == (None, None)
+
+    assert task_recovery.sweep_orphaned_tasks() == 1
+    proc = load_proc(Session, follower)
+    assert proc.creation_status == CreationStatus.PENDING
+    assert proc.extra_info == {"locale": "cn", "recovery_attempts": 1}
+    assert scheduler.position(follower) == 0
+
+
+def test_sweeper_keeps_follower_waiting_while_leader_runs(dedup_env, seed, load_proc):
+    Session, scheduler, executor, deduplicator = dedup_env
+    leader = seed(Session, age_seconds=0)
+    follower = seed(Session, status=CreationStatus.PENDING, extra_info={"dedup_of": leader})
+
+    assert task_recovery.sweep_orphaned_tasks() == 0
+    proc = load_proc(Session, follower)
+    assert proc.creation_status == CreationStatus.PENDING
+    assert (datetime.now(UTC8) - proc.updated_at.replace(tzinfo=UTC8)).total_seconds() < 60
+    assert executor.pending == []
+
+
+def test_create_research_clones_fresh_result_without_pipeline(dedup_env, monkeypatch, seed, load_proc):
+    Session, scheduler, executor, deduplicator = dedup_env
+    source = seed(Session, age_seconds=0)
+    finish(Session, source)
+    deduplicator.kv.set(f"dedup:done:{deduplicator.fingerprint('Graph learning', 'cn')}", source, 60)
+
+    monkeypatch.setattr(routes, "request_dedup", deduplicator)
+    monkeypatch.setattr(routes, "kv_store", KeyValueStore(None))
+    monkeypatch.setattr(routes, "admission_controller", type("A", (), {"check": lambda self, uid: None})())
+    db = Session()
+    resp = type("Resp", (), {"status_code": 200, "headers": {}})()
+    out = asyncio.run(routes.create_research(
+        request=routes.CreateResearchRequest(content="Graph learning", session_id=None, locale="cn"),
+        response=resp,
+        x_page_id=None,
+        idempotency_key=None,
+        current_user={"user_id": 2, "email": "e2"},
+        db=db,
+    ))
+    db.close()
+
+    assert out["data"]["deduplicated"] == "cloned"
+    assert load_proc(Session, out["data"]["message_id"]).creation_status == CreationStatus.CREATED
+    assert executor.pending == []
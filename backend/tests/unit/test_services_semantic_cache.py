@@ -0,0 +1,146 @@
+import pytest
+
+from app.constants.task_status import CreationStatus
+from app.core.config import Config
+from app.entity.research_chat import ResearchChatMessage
+from app.routes import chat_routes
+from app.services import semantic_cache
+from app.services.semantic_cache import HashingEmbedder, SemanticIndex
+
+
+def test_embedder_scores_rephrasings_above_unrelated_topics():
+    embedder = HashingEmbedder(1024)
+    base = embedder.embed("Graph neural networks for drug discovery")
+    assert float(base @ embedder.embed("drug discovery with a graph neural network")) > 0.85
+    assert float(base @ embedder.embed("LLM hallucination detection")) < 0.2
+    zh = embedder.embed("大语言模型幻觉检测")
+    assert float(zh @ embedder.embed("大语言模型的幻觉检测")) > 0.85
+
+
+def test_index_grows_and_is_shared_between_instances(tmp_path):
+    index = SemanticIndex(str(tmp_path), HashingEmbedder(256), initial_capacity=2)
+    topics = ["graph neural networks", "diffusion models", "federated learning", "protein folding", "robot learning"]
+    for i, topic in enumerate(topics):
+        index.add(i, topic, "en")
+    index.add(99, "graph neural networks", "cn")
+
+    [(message_id, score)] = index.search("Federated  Learning", "en")
+    assert message_id == 2 and score == pytest.approx(1.0, abs=1e-5)
+    assert index.search("graph neural networks", "cn")[0][0] == 99
+    assert index.search("anything", "fr") == []
+    ranked = index.search("graph neural networks", "en", limit=3)
+    assert len(ranked) == 3 and ranked[0][0] == 0
+    assert [score for _, score in ranked] == sorted((score for _, score in ranked), reverse=True)
+    # 已索引的 message_id 不重复写入
+    assert not index.add(0, "graph neural networks", "en")
+
+    # 另一个进程打开同一目录，并增量看到之后写入的条目
+    other = SemanticIndex(str(tmp_path), HashingEmbedder(256), initial_capacity=2)
+    assert len(other) == 6
+    index.add(6, "quantum error correction", "en")
+    assert other.search("quantum error correction", "en")[0][0] == 6
+
+
+def test_pipeline_reuses_retrieval_of_similar_topic(env, monkeypatch, tmp_path, seed, load_proc):
+    Session, scheduler, executor = env
+    retrieval = {"keywords": "gnn", "query": "gnn", "newest": [], "highly_cited": [], "relevant": [],
+                 "inspiration": "old idea"}
+    source = seed(Session, status=CreationStatus.CREATED)
+    with Session() as db:
+        db.get(ResearchChatMessage, source).extra_info = {"generation_complete": True, "retrieval": retrieval}
+        db.commit()
+    target = seed(Session, status=CreationStatus.PENDING)
+
+    index = SemanticIndex(str(tmp_path), HashingEmbedder(256))
+    index.add(source, "Graph neural networks for drug discovery", "en")
+    semantic_cache.set_semantic_index(index)
+    monkeypatch.setattr(Config, "SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(Config, "SEMANTIC_CACHE_THRESHOLD", 0.85)
+
+    prompts = []
+
+    class FakeLLM:
+        def __init__(self, *a, **k):
+            pass
+
+        def get_response(self, prompt, **kwargs):
+            prompts.append(prompt)
+            return f"answer {len(prompts)}"
+
+    monkeypatch.setattr(chat_routes, "LLMClient", FakeLLM)
+    monkeypatch.setattr(chat_routes, "get_newest_paper", lambda q: pytest.fail("papers step should be reused"))
+    try:
+        chat_routes._background_process_prompt_and_update(
+            target, 1, 1, "e", "drug discovery with graph neural networks", "en"
+        )
+    finally:
+        semantic_cache.set_semantic_index(None)
+
+    assert load_proc(Session, target).creation_status == CreationStatus.CREATED
+    assert len(prompts) == 4  # inspiration / plan / review / finalize
+    with Session() as db:
+        assert db.get(ResearchChatMessage, target).extra_info["retrieval"]["query"] == "gnn"
+    assert len(index) == 2
+
+
+@pytest.fixture
+def finished(seed):
+    """创建一条指定状态 / 内容 / 结果的历史消息"""
+    def _finished(Session, content, extra_info, result_papers=None, status=CreationStatus.CREATED):
+        message_id = seed(Session, status=status)
+        with Session() as db:
+            message = db.get(ResearchChatMessage, message_id)
+            message.content = content
+            message.extra_info = extra_info
+            message.result_papers = result_papers
+            db.commit()
+        return message_id
+    return _finished
+
+
+def test_backfill_indexes_completed_history_once(env, monkeypatch, tmp_path, finished):
+    Session, scheduler, executor = env
+    retrieval = {"keywords": "gnn", "query": "gnn", "newest": [], "highly_cited": [], "relevant": []}
+    with_snapshot = finished(Session, "graph neural networks", {"generation_complete": True, "retrieval": retrieval})
+    keywords_only = finished(Session, "diffusion models", {"generation_complete": True},
+                              {"intermediate_results": {"keywords": "diffusion", "query": "diffusion"}})
+    finished(Session, "no payload", {"generation_complete": True})
+    finished(Session, "still running", {}, status=CreationStatus.CREATING)
+
+    index = SemanticIndex(str(tmp_path), HashingEmbedder(256))
+    semantic_cache.set_semantic_index(index)
+    try:
+        assert semantic_cache.backfill_index(Session, batch_size=2) == 2
+        assert semantic_cache.backfill_index(Session, batch_size=2) == 0
+    finally:
+        semantic_cache.set_semantic_index(None)
+    assert len(index) == 2
+    assert index.search("graph neural networks", "en")[0][0] == with_snapshot
+    assert index.search("diffusion models", "en")[0][0] == keywords_only
+
+
+def test_reuse_falls_through_to_next_valid_hit(env, monkeypatch, tmp_path, finished):
+    Session, scheduler, executor = env
+    retrieval = {"keywords": "gnn", "query": "gnn", "newest": [], "highly_cited": [], "relevant": []}
+    keywords_only = finished(Session, "graph neural networks for drug discovery", {"generation_complete": True},
+                              {"intermediate_results": {"keywords": "old", "query": "old"}})
+    full = finished(Session, "graph neural network drug discovery", {"generation_complete": True, "retrieval": retrieval})
+
+    index = SemanticIndex(str(tmp_path), HashingEmbedder(256))
+    index.add(12345, "graph neural networks for drug discovery", "en")  # 源消息已删除
+    index.add(keywords_only, "graph neural networks for drug discovery", "en")
+    index.add(full, "graph neural network drug discovery", "en")
+    semantic_cache.set_semantic_index(index)
+    monkeypatch.setattr(Config, "SEMANTIC_CACHE_ENABLED", True)
+    monkeypatch.setattr(Config, "SEMANTIC_CACHE_THRESHOLD", 0.85)
+    try:
+        with Session() as db:
+            reused = chat_routes._reuse_similar_retrieval(db, "graph neural networks for drug discovery", "en")
+            assert reused[0] == full and reused[2] == ["keywords", "papers"]
+            db.get(ResearchChatMessage, full).extra_info = {"generation_complete": True}
+            db.commit()
+            reused = chat_routes._reuse_similar_retrieval(db, "graph neural networks for drug discovery", "en")
+            assert reused[0] == keywords_only and reused[2] == ["keywords"]
+            assert reused[3] == {"keywords": "old", "query": "old"}
+    finally:
+        semantic_cache.set_semantic_index(None)
@@ -0,0 +1,106 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app.constants.task_status import CreationStatus
+from app.core.config import Config
+from app.routes import chat_routes
+from app.services.speculative_retrieval import SpeculativeRetrieval, keyword_set, start_speculative_retrieval
+
+
+def test_keyword_set_ignores_order_case_and_plural():
+    assert keyword_set("Graph Neural Networks, drug  discovery") == keyword_set("drug discovery,graph neural network")
+    assert keyword_set("graph neural networks") != keyword_set("graph neural networks, drug discovery")
+
+
+def test_take_returns_results_on_match_and_discards_on_miss():
+    pool = ThreadPoolExecutor(max_workers=2)
+    release = threading.Event()
+    queries = []
+
+    def fetch(query):
+        queries.append(query)
+        release.wait(5)
+        return [query]
+
+    hit = SpeculativeRetrieval(["graph neural networks", "drug discovery"], [fetch, fetch], pool)
+    release.set()
+    assert hit.take("drug discovery, graph neural network") == (
+        ['"graph neural networks" | "drug discovery"'], ['"graph neural networks" | "drug discovery"'])
+
+    release.clear()
+    miss = SpeculativeRetrieval(["protein design"], [fetch, fetch, fetch], pool)
+    assert miss.take("protein folding") is None
+    release.set()
+    pool.shutdown(wait=True)
+    assert len(queries) < 5  # 第三个检索尚未开始即被取消
+
+
+def test_take_falls_back_when_speculative_fetch_fails():
+    def broken(query):
+        raise RuntimeError("s2 down")
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        assert SpeculativeRetrieval(["diffusion models"], [broken], pool).take("diffusion models") is None
+
+
+def test_start_requires_flag_and_confident_guess(monkeypatch):
+    fetchers = [lambda q: []]
+    assert start_speculative_retrieval("diffusion models", fetchers) is None
+    monkeypatch.setattr(Config, "SPECULATIVE_RETRIEVAL_ENABLED", True)
+    assert start_speculative_retrieval("大语言模型幻觉检测", fetchers) is None
+    assert start_speculative_retrieval("diffusion models", fetchers).query == "diffusion models"
+
+
+def test_pipeline_uses_speculative_papers_when_keywords_match(env, monkeypatch, seed, load_proc):
+    Session, scheduler, executor = env
+    message_id = seed(Session, status=CreationStatus.PENDING)
+    monkeypatch.setattr(Config, "SPECULATIVE_RETRIEVAL_ENABLED", True)
+    calls = []
+
+    def fetch(name):
+        def _fetch(query):
+            calls.append((name, query))
+            return [{"title": name, "abstract": query}]
+        return _fetch
+
+    class FakeLLM:
+        def __init__(self, *a, **k):
+            pass
+
+        def get_response(self, prompt, **kwargs):
+            return "graph neural network, drug discovery"
+
+    monkeypatch.setattr(chat_routes, "LLMClient", FakeLLM)
+    monkeypatch.setattr(chat_routes, "get_newest_paper", fetch("newest"))
+    monkeypatch.setattr(chat_routes, "get_highly_cited_paper", fetch("cited"))
+    monkeypatch.setattr(chat_routes, "get_relevence_paper", fetch("relevant"))
+    chat_routes._background_process_prompt_and_update(
+        message_id, 1, 1, "e", "graph neural networks for drug discovery", "en"
+    )
+
+    assert load_proc(Session, message_id).creation_status == CreationStatus.CREATED
+    assert sorted(name for name, _ in calls) == ["cited", "newest", "relevant"]
+    assert {query for _, query in calls} == {'"graph neural networks" | "drug discovery"'}
+
+
+def test_pipeline_discards_speculation_when_keyword_step_fails(env, monkeypatch, seed, load_proc):
+    Session, scheduler, executor = env
+    message_id = seed(Session, status=CreationStatus.PENDING)
+    discarded = []
+
+    class FakeSpeculation:
+        def discard(self):
+            discarded.append(True)
+
+    def broken_extract(content, llm_call):
+        raise RuntimeError("llm down")
+
+    monkeypatch.setattr(chat_routes, "LLMClient", lambda *a, **k: object())
+    monkeypatch.setattr(chat_routes, "start_speculative_retrieval", lambda content, fetchers: FakeSpeculation())
+    monkeypatch.setattr(chat_routes, "extract_keywords", broken_extract)
+    chat_routes._background_process_prompt_and_update(
+        message_id, 1, 1, "e", "graph neural networks for drug discovery", "en"
+    )
+
+    assert load_proc(Session, message_id).creation_status == CreationStatus.FAILED
+    assert discarded == [True]
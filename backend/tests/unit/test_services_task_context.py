@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+import requests
+
+from app.services import task_context
+from app.services.llm_service import LLMClient
+from app.services.task_context import (
+    TaskCancelledError,
+    TaskContext,
+    TaskDeadlineExceeded,
+    bind_task_context,
+    call_timeout,
+    request_cancel,
+)
+
+
+def test_deadline_bounds_call_timeout_and_expires():
+    ctx = TaskContext(timeout_seconds=5)
+    assert call_timeout(180) == 180  # 不在任务中
+    with bind_task_context(1, ctx):
+        assert 4 < call_timeout(180) <= 5
+        ctx.deadline = 0
+        with pytest.raises(TaskDeadlineExceeded):
+            call_timeout(180)
+    assert task_context.current_task_context() is None
+
+
+def test_cancel_flag_is_polled_with_throttle():
+    polls = []
+
+    def flag():
+        polls.append(1)
+        return len(polls) >= 2
+
+    ctx = TaskContext(timeout_seconds=60, is_cancel_requested=flag, poll_interval=3600)
+    ctx.check()  # 首次检查立即轮询
+    ctx.check()  # 节流期内不再轮询
+    assert len(polls) == 1
+    ctx._last_poll -= 3600
+    with pytest.raises(TaskCancelledError):
+        ctx.check()
+
+
+def test_request_cancel_interrupts_backoff_sleep():
+    ctx = TaskContext(timeout_seconds=60)
+    with bind_task_context(7, ctx):
+        threading.Timer(0.05, request_cancel, args=(7,)).start()
+        with pytest.raises(TaskCancelledError):
+            ctx.sleep(30)
+    assert request_cancel(7) is False
+
+
+def test_llm_retry_loop_stops_when_cancelled(monkeypatch):
+    calls = []
+
+    def failing_post(*a, **k):
+        calls.append(k["timeout"])
+        request_cancel(9)
+        raise requests.exceptions.ConnectionError("down")
+
+    monkeypatch.setattr(requests, "post", failing_post)
+    ctx = TaskContext(timeout_seconds=30)
+    with bind_task_context(9, ctx):
+        with pytest.raises(TaskCancelledError):
+            LLMClient(provider="custom").get_response("hello", max_retries=3)
+    assert len(calls) == 1 and calls[0] <= 30
@@ -0,0 +1,88 @@
+import threading
+import time
+
+import pytest
+
+from app.constants.task_status import CreationStatus
+from app.services import task_drain, task_recovery
+from app.services.pipeline_executor import PipelineRejectedError
+from app.services.task_context import TaskContext, TaskSuspended, bind_task_context, suspend_all
+from app.services.task_scheduler import FairShareScheduler, parse_tier_weights
+
+
+def test_suspend_interrupts_backoff_sleep():
+    ctx = TaskContext(60)
+    with bind_task_context(11, ctx):
+        threading.Timer(0.05, suspend_all).start()
+        started = time.monotonic()
+        with pytest.raises(TaskSuspended):
+            ctx.sleep(5)
+    assert time.monotonic() - started < 1
+
+
+def test_scheduler_drain_returns_queued_and_rejects_new_tasks(manual_executor):
+    executor = manual_executor
+    sched = FairShareScheduler(executor, 1, 1, 10, parse_tier_weights(""))
+    sched.submit(1, "u1", None, lambda: None)
+    sched.submit(2, "u2", None, lambda: None)
+
+    assert sched.drain() == [2]
+    assert sched.running_keys() == [1]
+    with pytest.raises(PipelineRejectedError):
+        sched.submit(3, "u3", None, lambda: None)
+    fn, args = executor.pending.pop()
+    fn(*args)
+    assert sched.running_keys() == []
+
+
+def test_drain_tasks_marks_only_stopped_tasks_resumable(monkeypatch, manual_executor):
+    executor = manual_executor
+    sched = FairShareScheduler(executor, 1, 1, 10, parse_tier_weights(""))
+    sched.submit(1, "u1", None, lambda: None)
+    sched.submit(2, "u2", None, lambda: None)
+    marked = []
+    state = task_drain.DrainState()
+    monkeypatch.setattr(task_drain, "task_scheduler", sched)
+    monkeypatch.setattr(task_drain, "drain_state", state)
+    monkeypatch.setattr(task_drain, "mark_resumable", lambda ids: marked.extend(ids) or len(ids))
+
+    summary = task_drain.drain_tasks(timeout=0.05, poll_interval=0.01)
+
+    assert state.draining
+    # 任务 1 的线程仍在执行，不能交给其他 worker 恢复
+    assert marked == [2]
+    assert summary["queued"] == 1 and summary["unfinished"] == 1 and summary["marked_resumable"] == 1
+
+
+def test_suspended_task_is_requeued_without_consuming_attempts(env, seed, load_proc):
+    Session, scheduler, executor = env
+    message_id = seed(Session, age_seconds=5, extra_info={"locale": "en", "recovery_attempts": 1})
+
+    assert task_recovery.mark_resumable([message_id]) == 1
+    proc = load_proc(Session, message_id)
+    assert proc.creation_status == CreationStatus.PENDING and proc.extra_info["suspended"] is True
+
+    assert task_recovery.sweep_orphaned_tasks() == 1
+    proc = load_proc(Session, message_id)
+    assert proc.creation_status == CreationStatus.PENDING
+    assert proc.extra_info == {"locale": "en", "recovery_attempts": 1}
+    assert scheduler.position(message_id) == 0
+
+
+def test_drain_marker_file_starts_draining_before_shutdown(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app.main import create_app
+
+    marker = tmp_path / "backend_1.drain"
+    state = task_drain.DrainState(str(marker))
+    monkeypatch.setattr(task_drain, "drain_state", state)
+    client = TestClient(create_app())
+
+    assert client.get("/ready").status_code == 200
+    assert not state.draining
+    marker.touch()
+    assert client.get("/ready").status_code == 503
+    assert state.draining and state.started_at is not None
+    marker.unlink()
+    assert state.draining
@@ -0,0 +1,69 @@
+import pytest
+
+from app.constants.task_status import CreationStatus
+from app.entity.research_chat import ResearchChatMessage
+from app.routes import chat_routes
+from app.services import task_recovery
+
+
+def test_sweeper_requeues_orphan_and_pipeline_resumes_from_checkpoint(env, monkeypatch, seed, load_proc):
+    Session, scheduler, executor = env
+    checkpoint = {
+        "completed": ["keywords", "papers", "inspiration"],
+        "state": {"keywords": "gnn", "query": "gnn", "newest": [], "highly_cited": [], "relevant": [],
+                  "inspiration": "idea"},
+    }
+    message_id = seed(Session, checkpoint=checkpoint)
+
+    assert task_recovery.sweep_orphaned_tasks() == 1
+    proc = load_proc(Session, message_id)
+    assert proc.creation_status == CreationStatus.PENDING
+    assert proc.extra_info["recovery_attempts"] == 1
+    assert scheduler.position(message_id) == 0
+
+    prompts = []
+
+    class FakeLLM:
+        def __init__(self, *a, **k):
+            pass
+
+        def get_response(self, prompt, **kwargs):
+            prompts.append(prompt)
+            return f"answer {len(prompts)}"
+
+    monkeypatch.setattr(chat_routes, "LLMClient", FakeLLM)
+    monkeypatch.setattr(chat_routes, "get_newest_paper", lambda q: pytest.fail("papers step should be skipped"))
+    fn, args = executor.pending.pop()
+    fn(*args)
+
+    proc = load_proc(Session, message_id)
+    assert proc.creation_status == CreationStatus.CREATED
+    assert len(prompts) == 3  # plan / review / finalize
+    assert proc.process_info["logs"][0] == "[t] step1"
+    with Session() as db:
+        msg = db.get(ResearchChatMessage, message_id)
+        assert msg.result_papers["response"] == "answer 3"
+        assert msg.result_papers["intermediate_results"]["inspiration"] == "idea"
+
+
+def test_sweeper_fails_task_when_attempts_exhausted_or_cancelled(env, seed, load_proc):
+    Session, scheduler, executor = env
+    exhausted = seed(Session, extra_info={"locale": "cn", "recovery_attempts": 1})
+    cancelled = seed(Session, status=CreationStatus.PENDING, extra_info={"cancel_requested": True})
+    fresh = seed(Session, age_seconds=5)
+
+    assert task_recovery.sweep_orphaned_tasks() == 2
+    assert load_proc(Session, exhausted).creation_status == CreationStatus.FAILED
+    assert load_proc(Session, cancelled).creation_status == CreationStatus.FAILED
+    assert load_proc(Session, fresh).creation_status == CreationStatus.CREATING
+    assert executor.pending == []
+
+
+def test_heartbeat_refreshes_tasks_owned_by_this_process(env, seed, load_proc):
+    Session, scheduler, executor = env
+    message_id = seed(Session)
+    scheduler.submit(message_id, 1, None, lambda: None)
+
+    assert task_recovery.heartbeat_active_tasks() == 1
+    assert task_recovery.sweep_orphaned_tasks() == 0
+    assert load_proc(Session, message_id).creation_status == CreationStatus.CREATING
@@ -0,0 +1,151 @@
+import pytest
+
+from app.services.pipeline_executor import PipelineRejectedError
+from app.services.task_scheduler import FairShareScheduler, parse_tier_weights
+
+
+class ManualExecutor:
+    """记录提交的任务，由测试手动执行"""
+
+    max_workers = 8
+
+    def __init__(self):
+        self.pending = []
+
+    def submit(self, fn, *args):
+        self.pending.append((fn, args))
+
+    def run_next(self):
+        fn, args = self.pending.pop(0)
+        fn(*args)
+
+
+def make_scheduler(executor, max_concurrency=1, per_user_limit=1, max_queued=10,
+                   weights="pioneer:3,student:1"):
+    return FairShareScheduler(executor, max_concurrency, per_user_limit, max_queued, parse_tier_weights(weights))
+
+
+def test_parse_tier_weights_adds_default_and_skips_invalid():
+    assert parse_tier_weights("pioneer:4, student:1,bad:x,zero:0") == {"pioneer": 4.0, "student": 1.0, "default": 1.0}
+
+
+def test_global_cap_and_queue_position():
+    executor = ManualExecutor()
+    sched = make_scheduler(executor)
+    ran = []
+
+    assert sched.submit(1, "u1", "student", ran.append, 1) == 0
+    assert sched.submit(2, "u2", "student", ran.append, 2) == 1
+    assert sched.submit(3, "u3", "student", ran.append, 3) == 2
+    assert len(executor.pending) == 1 and sched.position(1) == 0
+
+    executor.run_next()
+    assert sched.position(2) == 0 and sched.position(3) == 1
+    executor.run_next()
+    executor.run_next()
+    assert ran == [1, 2, 3]
+    assert sched.position(3) is None
+    assert sched.stats()["running"] == 0
+
+
+def test_per_user_limit_lets_other_users_pass():
+    executor = ManualExecutor()
+    sched = make_scheduler(executor, max_concurrency=2, per_user_limit=1)
+    ran = []
+
+    sched.submit(1, "hog", "student", ran.append, 1)
+    sched.submit(2, "hog", "student", ran.append, 2)
+    sched.submit(3, "other", "student", ran.append, 3)
+
+    # hog 已达单用户上限，other 的任务越过排队中的 2 先执行
+    assert sched.stats()["running"] == 2
+    executor.run_next()
+    executor.run_next()
+    assert ran == [1, 3]
+    executor.run_next()
+    assert ran == [1, 3, 2]
+
+
+def test_weighted_lanes_share_capacity():
+    executor = ManualExecutor()
+    sched = make_scheduler(executor, per_user_limit=10)
+    order = []
+
+    sched.submit("warmup", "w", None, order.append, "warmup")
+    for i in range(4):
+        sched.submit(f"s{i}", "s", "student", order.append, "student")
+        sched.submit(f"p{i}", "p", "pioneer", order.append, "pioneer")
+    while executor.pending:
+        executor.run_next()
+
+    # 权重 3:1，前 4 个派发中 pioneer 占 3 个
+    assert order[0] == "warmup"
+    assert order[1:5].count("pioneer") == 3
+    assert sorted(order[1:]) == ["pioneer"] * 4 + ["student"] * 4
+
+
+def test_rejects_when_queue_full():
+    executor = ManualExecutor()
+    sched = make_scheduler(executor, max_queued=1)
+    sched.submit(1, "u1", None, lambda: None)
+    sched.submit(2, "u2", None, lambda: None)
+    assert sched.is_saturated()
+    with pytest.raises(PipelineRejectedError):
+        sched.submit(3, "u3", None, lambda: None)
+
+
+def test_queue_bounded_when_user_at_per_user_cap():
+    executor = ManualExecutor()
+    # 全局并发充足，但 hog 已达单用户上限，其余任务只能排队
+    sched = FairShareScheduler(executor, 4, 1, 3, parse_tier_weights(""))
+    sched.submit(0, "hog", None, lambda: None)
+    for i in range(1, 4):
+        assert sched.submit(i, "hog", None, lambda: None) == i
+    assert sched.stats() == {"running": 1, "queued": 3, "lanes": {"default": 3}}
+    assert sched.is_saturated()
+    with pytest.raises(PipelineRejectedError):
+        sched.submit(4, "hog", None, lambda: None)
+    assert sched.stats()["queued"] == 3
+
+
+def test_per_user_queue_limit():
+    executor = ManualExecutor()
+    sched = FairShareScheduler(executor, 4, 1, 10, parse_tier_weights(""), per_user_queue_limit=2)
+    for i in range(3):
+        sched.submit(i, "hog", None, lambda: None)
+    with pytest.raises(PipelineRejectedError):
+        sched.submit(3, "hog", None, lambda: None)
+    # 其他用户不受影响
+    assert sched.submit(4, "other", None, lambda: None) == 0
+
+
+def test_cancel_removes_queued_task():
+    executor = ManualExecutor()
+    sched = make_scheduler(executor)
+    sched.submit(1, "u1", None, lambda: None)
+    sched.submit(2, "u2", None, lambda: None)
+    assert sched.cancel(2) is True
+    assert sched.cancel(1) is False  # 已在执行
+    executor.run_next()
+    assert not executor.pending and sched.stats()["queued"] == 0
+
+
+def test_executor_rejection_frees_slots_without_redispatching():
+    executor = ManualExecutor()
+    sched = make_scheduler(executor)
+    ran = []
+    for i in range(5):
+        sched.submit(i, f"u{i}", None, ran.append, i)
+
+    attempts = []
+
+    def reject(fn, *args):
+        attempts.append(args[0].key)
+        raise PipelineRejectedError("Pipeline executor is shut down")
+
+    # 执行器关闭后，释放的槽位只尝试派发一次，不会沿队列逐个递归派发
+    executor.submit = reject
+    executor.run_next()
+    assert ran == [0] and attempts == [1]
+    assert sched.stats()["running"] == 0 and sched.stats()["queued"] == 3
+    assert sched.position(1) is None and sched.position(2) == 1
@@ -62,3 +62,211 @@ def test_get_logger_returns_logger():
     lg = get_logger("any")
     lg.info("x")
     assert isinstance(lg, logging.Logger)
+
+
+def test_bounded_queue_handler_drop_new_counts_drops():
+    import queue
+    from app.utils.logger import BoundedQueueHandler
+
+    q = queue.Queue(maxsize=1)
+    h = BoundedQueueHandler(q, overflow="drop_new")
+    logger = logging.getLogger("t_async_drop_new")
+    logger.propagate = False
+    logger.handlers[:] = [h]
+    logger.warning("first")
+    logger.warning("second")
+    assert q.qsize() == 1
+    assert q.get_nowait().getMessage() == "first"
+    assert h.dropped == 1
+
+
+def test_bounded_queue_handler_drop_oldest_keeps_newest():
+    import queue
+    from app.utils.logger import BoundedQueueHandler
+
+    q = queue.Queue(maxsize=1)
+    h = BoundedQueueHandler(q, overflow="drop_oldest")
+    logger = logging.getLogger("t_async_drop_oldest")
+    logger.propagate = False
+    logger.handlers[:] = [h]
+    logger.warning("old %s", 1)
+    logger.warning("new %s", 2)
+    assert q.get_nowait().getMessage() == "new 2"
+    assert h.dropped == 1
+    # 被挤出的记录已结束计数，消费完剩余记录后 join() 不会阻塞
+    q.task_done()
+    assert q.unfinished_tasks == 0
+
+
+def test_bounded_queue_handler_counts_drops_across_threads():
+    import queue
+    import threading
+    from app.utils.logger import BoundedQueueHandler
+
+    q = queue.Queue(maxsize=1)
+    h = BoundedQueueHandler(q, overflow="drop_oldest")
+    record = logging.LogRecord("t", logging.INFO, __file__, 1, "msg", None, None)
+
+    def flood():
+        for _ in range(500):
+            h.enqueue(record)
+
+    threads = [threading.Thread(target=flood) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert h.dropped == 8 * 500 - 1
+
+
+def test_batching_queue_listener_writes_and_flushes(tmp_path):
+    import queue
+    from app.utils.logger import BoundedQueueHandler, BatchingQueueListener
+
+    log_dir = tmp_path / "alogs"
+    fh = DailySwitchingFileHandler(str(log_dir), for_error=False, flush_each=False)
+    fh.setFormatter(SimpleFormatter())
+    q = queue.Queue(maxsize=100)
+    listener = BatchingQueueListener(q, fh)
+    listener.start()
+
+    logger = logging.getLogger("t_async_listener")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.handlers[:] = [BoundedQueueHandler(q)]
+    for i in range(20):
+        logger.info("line %d", i)
+    try:
+        raise ValueError("kaboom")
+    except ValueError:
+        logger.exception("failed")
+    listener.stop()
+
+    d = datetime.now().strftime("%Y%m%d")
+    content = (log_dir / f"{d}.log").read_text(encoding="utf-8")
+    assert "line 0" in content and "line 19" in content
+    assert "Exception: kaboom" in content
+    fh.close()
+
+
+def test_json_formatter_includes_trace_context_fields():
+    import json
+    from app.utils.logger import JsonFormatter, TraceContextFilter
+    from app.utils.trace_context import bind_trace_context
+
+    logger = logging.getLogger("t_json")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(TraceContextFilter())
+    logger.handlers[:] = [handler]
+
+    with bind_trace_context(trace_id="tid-1", message_id=42):
+        logger.info("hello %s", "world", extra={"duration_ms": 12})
+    logger.info("outside")
+
+    first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert first["message"] == "hello world"
+    assert first["trace_id"] == "tid-1" and first["message_id"] == 42
+    assert first["duration_ms"] == 12 and first["step"] is None
+    assert second["trace_id"] is None and second["duration_ms"] is None
+
+
+def test_simple_formatter_appends_trace_id():
+    from app.utils.logger import TraceContextFilter
+    from app.utils.trace_context import bind_trace_context, get_trace_id
+
+    logger = logging.getLogger("t_trace_text")
+    logger.propagate = False
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(SimpleFormatter())
+    handler.addFilter(TraceContextFilter())
+    logger.handlers[:] = [handler]
+
+    with bind_trace_context(trace_id="abc"):
+        assert get_trace_id() == "abc"
+        logger.warning("traced")
+    assert "traced | trace_id=abc" in stream.getvalue()
+
+
+def test_log_step_records_step_and_duration():
+    from app.utils.logger import TraceContextFilter, log_step
+
+    records = []
+
+    class Capture(logging.Handler):
+        def emit(self, record):
+            records.append(record)
+
+    logger = logging.getLogger("t_log_step")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    handler = Capture()
+    handler.addFilter(TraceContextFilter())
+    logger.handlers[:] = [handler]
+
+    with log_step(logger, "keywords"):
+        logger.info("inside")
+    assert records[0].step == "keywords"
+    assert records[-1].step == "keywords" and records[-1].duration_ms >= 0
+
+    records.clear()
+    try:
+        with log_step(logger, "papers"):
+            raise RuntimeError("x")
+    except RuntimeError:
+        pass
+    assert records[-1].levelno == logging.ERROR and records[-1].step == "papers"
+
+
+def test_task_log_sink_shards_by_message_id(tmp_path):
+    from app.utils.logger import TaskLogSinkHandler, TASK_LOGGER_NAME
+
+    sink = TaskLogSinkHandler(str(tmp_path), shards=4)
+    logger = logging.getLogger(TASK_LOGGER_NAME + ".sink_test")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.handlers[:] = [sink]
+
+    for message_id in range(40):
+        logging.LoggerAdapter(logger, {"message_id": message_id}).info("task %s", message_id)
+    # 非 research_task 日志器的记录被忽略
+    other = logging.getLogger("t_not_task")
+    other.propagate = False
+    other.handlers[:] = [sink]
+    other.info("ignored")
+    sink.close()
+
+    day_dir = tmp_path / "tasks" / datetime.now().strftime("%Y%m%d")
+    files = sorted(p.name for p in day_dir.iterdir())
+    assert files == ["tasks_00.log", "tasks_01.log", "tasks_02.log", "tasks_03.log"]
+    shard_1 = (day_dir / "tasks_01.log").read_text(encoding="utf-8")
+    assert "[msg:5] task 5" in shard_1 and "[msg:4]" not in shard_1
+    assert "ignored" not in "".join((day_dir / f).read_text(encoding="utf-8") for f in files)
+    assert sink.path_for(5).endswith("tasks_01.log")
+
+
+def test_get_task_logger_does_not_register_per_message_loggers():
+    from app.utils.logger import get_task_logger
+
+    before = len(logging.Logger.manager.loggerDict)
+    adapters = [get_task_logger(i) for i in range(100)]
+    assert len(logging.Logger.manager.loggerDict) <= before + 1
+    assert adapters[7].extra == {"message_id": 7}
+
+
+def test_task_log_formatter_does_not_mutate_record():
+    import json
+    from app.utils.logger import JsonFormatter, TaskLogFormatter
+
+    record = logging.LogRecord("research_task", logging.INFO, __file__, 1, "no task", None, None)
+    assert "[msg:-] no task" in TaskLogFormatter().format(record)
+    # 后续 handler 仍看到缺失的 message_id
+    assert getattr(record, "message_id", None) is None
+    assert json.loads(JsonFormatter().format(record))["message_id"] is None
+
+    record.message_id = 9
+    assert "[msg:9] no task" in TaskLogFormatter().format(record)
@@ -222,12 +222,19 @@ start_single_service() {
     cd "$BACKEND_DIR"
     export APP_ENV=$ENV
     export PYTHONPATH="$BACKEND_DIR:$PYTHONPATH"
+    # 预停机标记文件（stop_services.sh 在发送 SIGTERM 前创建），启动前清理上一轮遗留
+    export DRAIN_MARKER_FILE="$PID_DIR/$ENV/backend_$service_num.drain"
+    rm -f "$DRAIN_MARKER_FILE"
 
     # 根据环境选择启动方式
     local start_command=""
     if [ "$ENV" = "prod" ] || [ "$ENV" = "stage" ]; then
+        # Prometheus 多进程指标目录（每个服务实例独立，由 gunicorn.conf.py 在启动时清空）
+        export PROMETHEUS_MULTIPROC_DIR="$PID_DIR/$ENV/prometheus_$service_num"
+        mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
         # 使用 gunicorn + uvicorn.workers.UvicornWorker 获得更好的进程管理
         start_command="$CONDA_PREFIX/bin/gunicorn \
+            -c gunicorn.conf.py \
             -w $WORKER_COUNT \
             -k uvicorn.workers.UvicornWorker \
             -b 0.0.0.0:$port \
@@ -18,6 +18,11 @@ echo "$(dirname "$0")/env.conf"
 # 设置环境变量
 export ENV=$ENV
 
+# 优雅停止等待时间：需覆盖 SHUTDOWN_DRAIN_TIMEOUT_SECONDS，超时后强制停止
+STOP_TIMEOUT=${STOP_TIMEOUT:-90}
+# 预停机等待时间：创建排空标记后 /ready 返回 503，等待负载均衡摘除流量后再发送 SIGTERM
+DRAIN_GRACE_SECONDS=${DRAIN_GRACE_SECONDS:-10}
+
 # 停止后端服务
 echo "停止后端服务..."
 i=1
@@ -35,6 +40,7 @@ while [ $i -le $BACKEND_COUNT ]; do
             ;;
     esac
     pid_file="$BASE_DIR/pid/$ENV/backend_$i.pid"
+    drain_file="$BASE_DIR/pid/$ENV/backend_$i.drain"
     
     echo "停止后端服务 $i (端口 $port)..."
     
@@ -43,9 +49,16 @@ while [ $i -le $BACKEND_COUNT ]; do
         echo "  PID 文件记录的进程号: $pid"
         
         if kill -0 "$pid" 2>/dev/null; then
-            echo "  进程 $pid 存在，尝试停止..."
+            echo "  进入排空状态，等待 ${DRAIN_GRACE_SECONDS} 秒摘除流量..."
+            touch "$drain_file"
+            sleep "$DRAIN_GRACE_SECONDS"
+            echo "  进程 $pid 存在，尝试停止（最多等待 ${STOP_TIMEOUT} 秒排空研究任务）..."
             kill "$pid"
-            sleep 2
+            waited=0
+            while kill -0 "$pid" 2>/dev/null && [ $waited -lt $STOP_TIMEOUT ]; do
+                sleep 1
+                waited=$((waited + 1))
+            done
             
             if kill -0 "$pid" 2>/dev/null; then
                 echo "  进程仍在运行，强制停止..."
@@ -91,7 +104,7 @@ while [ $i -le $BACKEND_COUNT ]; do
             fi
         fi
         
-        rm -f "$pid_file"
+        rm -f "$pid_file" "$drain_file"
     else
         echo "  PID 文件不存在，尝试智能查找..."
         